@@ -1,15 +1,32 @@
+"""
+Generates synthetic sales transactions and loads them into MySQL.
+
+Three modes:
+  backfill  build the whole dataset with NumPy and bulk-load it
+            (large executemany batches or LOAD DATA LOCAL INFILE), or
+            write it as Parquet files for the API's DuckDB backend
+  stream    insert a steady "live" feed at a target rows/sec
+  parallel  several worker processes generating and inserting at once,
+            each over its own connection, e.g. to load-test the API
+
+Examples:
+  python DataGenerator.py backfill --rows 10000000 --end-date 2024-12-31 --method infile
+  python DataGenerator.py stream --rate 5
+  python DataGenerator.py parallel --workers 8 --rows 20000000 --commit-every 20
+"""
+import argparse
+import csv
+import os
+import re
+import tempfile
 import pandas as pd
 import numpy as np
-from faker import Faker
-import random
 import time
+from concurrent.futures import ProcessPoolExecutor
 import mysql.connector
 
-fake = Faker()
-
 num_transactions = 100000
 num_products = 50
-regions = ['North America', 'Europe', 'Asia', 'South America', 'Africa']
 states = {
     'New York': (40.7128, -74.0060),
     'California': (36.7783, -119.4179),
@@ -57,127 +74,465 @@ states = {
     'Wyoming': (43.0759, -107.2903)
 }
 
-date_range = pd.date_range(start='1/1/2015', end='12/31/2024', freq='D')
-start_date = date_range[0]
-last_used_date = start_date
-product_ids = [f'P{str(i).zfill(4)}' for i in range(1, num_products + 1)]
-products = [{'Product ID': pid, 'Product Name': fake.word(), 'Category': fake.word()}
-            for pid in product_ids]
-
-transactions = []
-id = 0
-for _ in range(num_transactions):
-    id += 1
-    transaction_id = fake.uuid4()
-    timestamp = last_used_date + \
-        pd.DateOffset(seconds=random.randint(0, 86400))
-    last_used_date = timestamp
-    product = random.choice(products)
-    product_id = product['Product ID']
-
-    # Simulate changing quantity based on time period
-    if timestamp < start_date + pd.DateOffset(days=30):
-        quantity = random.randint(1, 5)
+
+state_names = np.array(list(states.keys()))
+state_latitudes = np.array([lat for lat, _ in states.values()])
+state_longitudes = np.array([lon for _, lon in states.values()])
+
+product_ids = np.array([f'P{str(i).zfill(4)}' for i in range(1, num_products + 1)])
+
+tableName = "transactions"
+COLUMNS = ['Timestamp', 'ProductID', 'Quantity', 'UnitPrice',
+           'TotalAmount', 'State', 'Latitude', 'Longitude']
+
+
+def generate_transactions(rng, num_rows, start_time, ramp_end=None, max_gap=86400):
+    """
+    Build num_rows transactions as a DataFrame, one NumPy array per column.
+
+    Each timestamp is 0-max_gap seconds after the previous one, starting from
+    start_time. Quantities are 1-5 before ramp_end and 5-10 afterwards.
+    """
+    start_time = np.datetime64(pd.Timestamp(start_time).to_datetime64(), 's')
+    offsets = rng.integers(0, max_gap + 1, size=num_rows).cumsum()
+    timestamps = start_time + offsets.astype('timedelta64[s]')
+
+    if ramp_end is None:
+        quantity = rng.integers(5, 11, size=num_rows)
     else:
-        quantity = random.randint(5, 10)
-
-    unit_price = round(random.uniform(5.0, 100.0), 2)
-    total_amount = round(quantity * unit_price, 2)
-    state = random.choice(list(states.keys()))
-    lat, lon = states[state]
-
-    transactions.append({
-        'ID': id,
-        'Transaction ID': transaction_id,
-        'Timestamp': timestamp,
-        'Product ID': product_id,
+        ramp_end = np.datetime64(pd.Timestamp(ramp_end).to_datetime64(), 's')
+        quantity = np.where(timestamps < ramp_end,
+                            rng.integers(1, 6, size=num_rows),
+                            rng.integers(5, 11, size=num_rows))
+
+    unit_price = np.round(rng.uniform(5.0, 100.0, size=num_rows), 2)
+    state_index = rng.integers(0, len(state_names), size=num_rows)
+
+    return pd.DataFrame({
+        'Timestamp': timestamps,
+        'ProductID': product_ids[rng.integers(0, len(product_ids), size=num_rows)],
         'Quantity': quantity,
-        'Unit Price': unit_price,
-        'Total Amount': total_amount,
-        'State': state,
-        'Latitude': lat,
-        'Longitude': lon
+        'UnitPrice': unit_price,
+        'TotalAmount': np.round(quantity * unit_price, 2),
+        'State': state_names[state_index],
+        'Latitude': state_latitudes[state_index],
+        'Longitude': state_longitudes[state_index],
     })
 
-# Convert to DataFrame
-transactions_df = pd.DataFrame(transactions)
-products_df = pd.DataFrame(products)
-
-# Calculate Revenue Data
-transactions_df['Date'] = transactions_df['Timestamp'].dt.date
-revenue_df = transactions_df.groupby('Date').agg(
-    {'Total Amount': 'sum'}).cumsum().reset_index()
-revenue_df.columns = ['Timestamp', 'Total Revenue']
-
-# Connect to MySQL
-mydb = mysql.connector.connect(
-    host="localhost",
-    user="user",
-    password="userpassword",
-    database="my_database"
-)
-
-mycursor = mydb.cursor()
-tableName = "transactions"
 
-# Check if table exists
-mycursor.execute(f"SHOW TABLES LIKE '{tableName}'")
-result = mycursor.fetchone()  # ✅ Fetch the result to avoid unread results error
+def generate_chunks(rng, num_rows, chunk_size, start_time, ramp_end=None, max_gap=86400):
+    """
+    Yield num_rows transactions as DataFrames of at most chunk_size rows.
+
+    Each chunk continues the timeline where the previous one ended, so the
+    output matches one big generate_transactions call while only one chunk
+    is ever held in memory.
+    """
+    next_start = start_time
+    for offset in range(0, num_rows, chunk_size):
+        chunk = generate_transactions(rng, min(chunk_size, num_rows - offset),
+                                      next_start, ramp_end=ramp_end, max_gap=max_gap)
+        next_start = chunk['Timestamp'].iloc[-1]
+        yield chunk
+
+
+class DailyRevenue:
+    """
+    Cumulative revenue per day, kept incrementally across chunks.
+
+    Only the day currently being filled is held in memory; each finished day
+    is written out (if a writer is given) as soon as a later day shows up.
+    """
+
+    def __init__(self, writer=None):
+        self.writer = writer
+        self.total = 0.0
+        self.days = 0
+        self._day = None
+        self._day_total = 0.0
 
-if result:
-    print(f"Table {tableName} exists")
+    def add(self, chunk):
+        daily = chunk.groupby(chunk['Timestamp'].dt.floor('D'))['TotalAmount'].sum()
+        for day, amount in daily.items():
+            if day != self._day:
+                self._close_day()
+                self._day = day
+            self._day_total += amount
 
-    # ✅ Check if the Latitude and Longitude columns exist
-    mycursor.execute("SHOW COLUMNS FROM transactions LIKE 'Latitude'")
-    lat_exists = mycursor.fetchone()
+    def finish(self):
+        self._close_day()
 
-    mycursor.execute("SHOW COLUMNS FROM transactions LIKE 'Longitude'")
-    lon_exists = mycursor.fetchone()
+    def _close_day(self):
+        if self._day is None:
+            return
+        self.total += self._day_total
+        self.days += 1
+        if self.writer is not None:
+            self.writer.writerow([self._day.date().isoformat(), round(self.total, 2)])
+        self._day = None
+        self._day_total = 0.0
 
-    if not lat_exists or not lon_exists:
+
+def to_rows(batch_df):
+    """Convert a batch to a list of tuples ready for executemany."""
+    timestamps = np.char.replace(
+        np.datetime_as_string(batch_df['Timestamp'].to_numpy('datetime64[s]')), 'T', ' ')
+    return list(zip(timestamps.tolist(),
+                    *(batch_df[column].tolist() for column in COLUMNS[1:])))
+
+
+def connect(args, local_infile=False):
+    return mysql.connector.connect(
+        host=args.host,
+        user=args.user,
+        password=args.password,
+        database=args.database,
+        allow_local_infile=local_infile
+    )
+
+
+# Secondary indexes for the SQL the API generates: a State or ProductID filter
+# with a date range, date ranges alone, and totals grouped by State or
+# ProductID. The trailing measures make them covering, so those sums are
+# read from the index without touching the rows.
+TABLE_INDEXES = {
+    'idx_state_timestamp': ('State', 'Timestamp', 'TotalAmount', 'Quantity'),
+    'idx_product_timestamp': ('ProductID', 'Timestamp', 'TotalAmount', 'Quantity'),
+    'idx_timestamp': ('Timestamp', 'TotalAmount'),
+}
+
+
+def ensure_indexes(mydb, mycursor, indexes=TABLE_INDEXES):
+    """Add whichever indexes are missing, in one ALTER TABLE. Returns their names."""
+    mycursor.execute(f"SHOW INDEX FROM {tableName}")
+    existing = {row[2] for row in mycursor.fetchall()}
+    missing = [name for name in indexes if name not in existing]
+    if missing:
+        started = time.perf_counter()
+        mycursor.execute(f"ALTER TABLE {tableName} " + ", ".join(
+            f"ADD INDEX {name} ({', '.join(indexes[name])})" for name in missing))
+        mydb.commit()
+        print(f"Added indexes {', '.join(missing)} in {time.perf_counter() - started:.1f}s.")
+    return missing
+
+
+def ensure_table(mydb, mycursor, indexes=True):
+    """
+    Create the transactions table, or add what an older one lacks. With
+    indexes=False the secondary indexes are left for the caller to add after
+    a bulk load, which builds them far faster than maintaining them per row.
+    """
+    # Check if table exists
+    mycursor.execute(f"SHOW TABLES LIKE '{tableName}'")
+    result = mycursor.fetchone()  # ✅ Fetch the result to avoid unread results error
+
+    if result:
+        print(f"Table {tableName} exists")
+
+        # ✅ Check if the Latitude and Longitude columns exist
+        mycursor.execute("SHOW COLUMNS FROM transactions LIKE 'Latitude'")
+        lat_exists = mycursor.fetchone()
+
+        mycursor.execute("SHOW COLUMNS FROM transactions LIKE 'Longitude'")
+        lon_exists = mycursor.fetchone()
+
+        if not lat_exists or not lon_exists:
+            mycursor.execute(
+                "ALTER TABLE transactions ADD COLUMN Latitude FLOAT, ADD COLUMN Longitude FLOAT")
+            mydb.commit()
+            print("Added missing Latitude and Longitude columns.")
+
+    else:
+        # Ensure a clean start
+        mycursor.execute("DROP TABLE IF EXISTS transactions")
         mycursor.execute(
-            "ALTER TABLE transactions ADD COLUMN Latitude FLOAT, ADD COLUMN Longitude FLOAT")
+            "CREATE TABLE transactions ("
+            "ID INT AUTO_INCREMENT PRIMARY KEY, "
+            "Timestamp DATETIME, "
+            "ProductID VARCHAR(255), "
+            "Quantity INT, "
+            "UnitPrice FLOAT, "
+            "TotalAmount FLOAT, "
+            "State VARCHAR(255), "
+            "Latitude FLOAT, "
+            "Longitude FLOAT)"
+        )
         mydb.commit()
-        print("Added missing Latitude and Longitude columns.")
-
-else:
-    # Ensure a clean start
-    mycursor.execute("DROP TABLE IF EXISTS transactions")
-    mycursor.execute(
-        "CREATE TABLE transactions ("
-        "ID INT AUTO_INCREMENT PRIMARY KEY, "
-        "Timestamp DATETIME, "
-        "ProductID VARCHAR(255), "
-        "Quantity INT, "
-        "UnitPrice FLOAT, "
-        "TotalAmount FLOAT, "
-        "State VARCHAR(255), "
-        "Latitude FLOAT, "
-        "Longitude FLOAT)"
-    )
-    mydb.commit()
-    print(f"Table {tableName} created.")
-
-# Insert data into the table batch size
-batch_size = 2
-batch_count = len(transactions_df) // batch_size
-
-for i in range(batch_count):
-    start_index = i * batch_size
-    end_index = (i + 1) * batch_size
-    batch_df = transactions_df.iloc[start_index:end_index]
-
-    sql = f"INSERT INTO {tableName} (Timestamp, ProductID, Quantity, UnitPrice, TotalAmount, State, Latitude, Longitude) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
-    values = []
-    for _, row in batch_df.iterrows():
-        timestamp = row['Timestamp'].strftime('%Y-%m-%d %H:%M:%S')
-        val = (timestamp, row['Product ID'], row['Quantity'],
-               row['Unit Price'], row['Total Amount'], row['State'], row['Latitude'], row['Longitude'])
-        values.append(val)
-
-    mycursor.executemany(sql, values)
+        print(f"Table {tableName} created.")
+
+    if indexes:
+        ensure_indexes(mydb, mycursor)
+
+
+INSERT_SQL = (f"INSERT INTO {tableName} ({', '.join(COLUMNS)}) "
+              f"VALUES ({', '.join(['%s'] * len(COLUMNS))})")
+
+
+def insert_executemany(mydb, mycursor, batch_df):
+    """Insert a batch as one multi-row INSERT and commit it."""
+    mycursor.executemany(INSERT_SQL, to_rows(batch_df))
     mydb.commit()
-    print(mycursor.rowcount, "records inserted.")
-    time.sleep(2)
 
-print("Data insertion complete.")
+
+def insert_load_data(mydb, mycursor, batch_df):
+    """Insert a batch through a temporary CSV and LOAD DATA LOCAL INFILE."""
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    try:
+        with os.fdopen(fd, 'w', newline='') as f:
+            csv.writer(f).writerows(to_rows(batch_df))
+        mycursor.execute(
+            f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {tableName} "
+            "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+            "LINES TERMINATED BY '\\r\\n' "
+            f"({', '.join(COLUMNS)})")
+        mydb.commit()
+    finally:
+        os.remove(path)
+
+
+class ParquetWriter:
+    """
+    Write batches as Parquet files in the layout theApiBrain's DuckDB backend
+    reads (part-<first ID>-<last ID>.parquet), numbering IDs on from the
+    files already there, so the API can be tried without a MySQL server.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        ends = [int(match.group(1)) for match in
+                (re.match(r"^part-\d+-(\d+)\.parquet$", name) for name in os.listdir(directory))
+                if match]
+        self.directory = directory
+        self.next_id = max(ends, default=0) + 1
+
+    def __call__(self, mydb, mycursor, batch_df):
+        first, last = self.next_id, self.next_id + len(batch_df) - 1
+        batch_df = batch_df.reset_index(drop=True)
+        batch_df.insert(0, 'ID', np.arange(first, last + 1))
+        path = os.path.join(self.directory, f"part-{first:012d}-{last:012d}.parquet")
+        batch_df.to_parquet(path + '.tmp', index=False, coerce_timestamps='us')
+        os.replace(path + '.tmp', path)
+        self.next_id = last + 1
+
+
+def max_gap_seconds(args):
+    """Largest gap between consecutive rows; spreads rows evenly up to --end-date."""
+    span = (pd.Timestamp(args.end_date) - pd.Timestamp(args.start_date)).total_seconds()
+    return max(1, int(2 * span / max(args.rows, 1)))
+
+
+def backfill(args):
+    """
+    Generate the dataset chunk by chunk and bulk-load each chunk in large
+    batches, so peak memory depends on --chunk-size, not --rows.
+    """
+    rng = np.random.default_rng(args.seed)
+    chunks = generate_chunks(
+        rng, args.rows, args.chunk_size, args.start_date,
+        ramp_end=pd.Timestamp(args.start_date) + pd.DateOffset(days=30),
+        max_gap=max_gap_seconds(args))
+
+    revenue_file = open(args.revenue_csv, 'w', newline='') if args.revenue_csv else None
+    revenue_writer = None
+    if revenue_file is not None:
+        revenue_writer = csv.writer(revenue_file)
+        revenue_writer.writerow(['Timestamp', 'Total Revenue'])
+    revenue = DailyRevenue(revenue_writer)
+
+    if args.method == 'parquet':
+        mydb = mycursor = None
+        insert = ParquetWriter(args.parquet_dir)
+    else:
+        mydb = connect(args, local_infile=args.method == 'infile')
+        mycursor = mydb.cursor()
+        ensure_table(mydb, mycursor, indexes=False)
+        insert = insert_load_data if args.method == 'infile' else insert_executemany
+    # Parquet files hold a whole chunk each
+    batch_size = args.chunk_size if args.method == 'parquet' else args.batch_size
+
+    started = time.perf_counter()
+    inserted = 0
+    try:
+        for chunk in chunks:
+            revenue.add(chunk)
+            for start_index in range(0, len(chunk), batch_size):
+                batch_df = chunk.iloc[start_index:start_index + batch_size]
+                insert(mydb, mycursor, batch_df)
+                inserted += len(batch_df)
+            del chunk
+            elapsed = time.perf_counter() - started
+            print(f"{inserted} records inserted ({inserted / elapsed:,.0f} rows/sec).")
+        revenue.finish()
+        if mydb is not None and not args.no_indexes:
+            ensure_indexes(mydb, mycursor)
+    finally:
+        if mydb is not None:
+            mycursor.close()
+            mydb.close()
+        if revenue_file is not None:
+            revenue_file.close()
+
+    print(f"Data insertion complete: {revenue.days} days, "
+          f"total revenue {revenue.total:.2f}.")
+
+
+def live_stream(args):
+    """Insert new transactions continuously at roughly args.rate rows/sec."""
+    rng = np.random.default_rng(args.seed)
+    mydb = connect(args)
+    mycursor = mydb.cursor()
+    ensure_table(mydb, mycursor, indexes=not args.no_indexes)
+
+    started = time.monotonic()
+    sent = 0
+    try:
+        while args.rows is None or sent < args.rows:
+            due = int((time.monotonic() - started) * args.rate) - sent
+            if args.rows is not None:
+                due = min(due, args.rows - sent)
+            if due > 0:
+                # Live rows are stamped with the current time
+                now = pd.Timestamp.now().floor('s')
+                batch_df = generate_transactions(rng, due, now)
+                batch_df['Timestamp'] = now
+                insert_executemany(mydb, mycursor, batch_df)
+                sent += due
+                print(f"{due} records inserted ({sent} total).")
+            time.sleep(args.tick)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mycursor.close()
+        mydb.close()
+    print(f"Streamed {sent} records.")
+
+
+def ingest_worker(args, worker, seed, num_rows, start_time, ramp_end, max_gap):
+    """
+    One parallel writer: generate num_rows transactions from its own seed
+    and insert them over its own connection, args.batch_size rows per
+    multi-row INSERT and args.commit_every INSERTs per transaction.
+    Returns (worker, rows inserted, seconds).
+    """
+    rng = np.random.default_rng(seed)
+    mydb = connect(args)
+    mycursor = mydb.cursor()
+    started = time.perf_counter()
+    inserted = pending = 0
+    try:
+        for chunk in generate_chunks(rng, num_rows, args.chunk_size, start_time,
+                                     ramp_end=ramp_end, max_gap=max_gap):
+            for start_index in range(0, len(chunk), args.batch_size):
+                batch_df = chunk.iloc[start_index:start_index + args.batch_size]
+                mycursor.executemany(INSERT_SQL, to_rows(batch_df))
+                inserted += len(batch_df)
+                pending += 1
+                if pending >= args.commit_every:
+                    mydb.commit()
+                    pending = 0
+            elapsed = time.perf_counter() - started
+            print(f"[worker {worker}] {inserted} records inserted "
+                  f"({inserted / elapsed:,.0f} rows/sec).", flush=True)
+        mydb.commit()
+    finally:
+        mycursor.close()
+        mydb.close()
+    return worker, inserted, time.perf_counter() - started
+
+
+def parallel_ingest(args):
+    """
+    Insert args.rows transactions with args.workers processes writing at
+    once. Worker i fills the i-th slice of the time range from the i-th
+    seed spawned from --seed, so a run can be repeated exactly.
+    """
+    mydb = connect(args)
+    mycursor = mydb.cursor()
+    try:
+        ensure_table(mydb, mycursor, indexes=not args.no_indexes)
+    finally:
+        mycursor.close()
+        mydb.close()
+
+    seeds = np.random.SeedSequence(args.seed).spawn(args.workers)
+    print(f"Seed {seeds[0].entropy}, {args.workers} workers.")
+    start = pd.Timestamp(args.start_date)
+    span = pd.Timestamp(args.end_date) - start
+    shares = [args.rows // args.workers + (i < args.rows % args.workers)
+              for i in range(args.workers)]
+    ramp_end = start + pd.DateOffset(days=30)
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [
+            pool.submit(ingest_worker, args, i, seeds[i], shares[i],
+                        start + span * i / args.workers, ramp_end,
+                        max(1, int(2 * span.total_seconds() / args.workers / shares[i])))
+            for i in range(args.workers) if shares[i]]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    for worker, rows, seconds in results:
+        print(f"Worker {worker}: {rows} rows in {seconds:.1f}s ({rows / seconds:,.0f} rows/sec).")
+    total = sum(rows for _, rows, _ in results)
+    print(f"Parallel ingest complete: {total} rows in {elapsed:.1f}s "
+          f"({total / elapsed:,.0f} rows/sec over {len(results)} workers).")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic transactions and load them into MySQL.")
+    parser.add_argument('mode', choices=['backfill', 'stream', 'parallel'], nargs='?',
+                        default='backfill')
+    parser.add_argument('--rows', type=int, default=None,
+                        help=f"rows to generate (backfill and parallel default "
+                             f"{num_transactions}, stream default unlimited)")
+    parser.add_argument('--batch-size', type=int, default=10000,
+                        help="rows per INSERT/LOAD DATA batch (and commit, except in parallel mode)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4,
+                        help="parallel mode writer processes")
+    parser.add_argument('--commit-every', type=int, default=10,
+                        help="parallel mode batches per transaction")
+    parser.add_argument('--chunk-size', type=int, default=100000,
+                        help="rows generated and held in memory at a time")
+    parser.add_argument('--revenue-csv', default=None,
+                        help="write the cumulative daily revenue to this CSV")
+    parser.add_argument('--method', choices=['executemany', 'infile', 'parquet'],
+                        default='executemany',
+                        help="bulk load with multi-row INSERTs or LOAD DATA LOCAL INFILE, "
+                             "or write Parquet files to --parquet-dir instead of MySQL")
+    parser.add_argument('--parquet-dir', default='transactions_parquet',
+                        help="backfill --method parquet output directory")
+    parser.add_argument('--rate', type=float, default=1.0, help="stream mode rows/sec")
+    parser.add_argument('--tick', type=float, default=1.0,
+                        help="stream mode seconds between inserts")
+    parser.add_argument('--start-date', default='2015-01-01')
+    parser.add_argument('--end-date', default=None,
+                        help="spread backfill and parallel rows up to this date "
+                             "(default today; pass it to repeat a --seed run exactly)")
+    parser.add_argument('--no-indexes', action='store_true',
+                        help="don't add the secondary indexes (TABLE_INDEXES)")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--user', default='user')
+    parser.add_argument('--password', default='userpassword')
+    parser.add_argument('--database', default='my_database')
+    args = parser.parse_args(argv)
+    if args.mode in ('backfill', 'parallel') and args.rows is None:
+        args.rows = num_transactions
+    if args.mode in ('backfill', 'parallel'):
+        if args.end_date is None:
+            args.end_date = pd.Timestamp.today().strftime('%Y-%m-%d')
+        if pd.Timestamp(args.end_date) <= pd.Timestamp(args.start_date):
+            parser.error("--end-date must be after --start-date")
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.mode == 'stream':
+        live_stream(args)
+    elif args.mode == 'parallel':
+        parallel_ingest(args)
+    else:
+        backfill(args)
@@ -0,0 +1,359 @@
+"""
+Benchmark: end-to-end API latency under a replayed question workload, fully offline.
+
+The model is the stub Ollama server (stubOllama.py) and the database is an
+embedded DuckDB copy of `transactions`, generated by DataGenerator.py at
+each scale factor and kept in --data-dir for later runs:
+
+    python benchmarks/benchEndToEnd.py --scales 100000,1000000 --concurrency 1,4,16
+
+For each scale theApiBrain is started in its own process. Then
+benchmarks/workload.jsonl is replayed against /api/ask-database-set and
+/api/should-reload by each number of clients in turn, for --duration
+seconds per level, every client with its own sessions. The SQL cache is
+emptied before each level (unless --warm) so model calls stay in the mix.
+
+Each level reports p50/p95/p99 latency, throughput, the server's resident
+memory and the mean time per pipeline stage read from /metrics. The
+results are appended to --results, and each level is compared with the
+last stored run of the same shape.
+
+With --backend mysql the configured MySQL server is used instead. Its
+transactions table is DROPPED and reloaded at each scale.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+sys.path.insert(0, ROOT)
+
+import DataGenerator  # noqa: E402
+from stubOllama import StubOllama  # noqa: E402
+
+STAGE_PATTERN = re.compile(r'^aiquery_stage_seconds_(sum|count)\{(.*)\} (\S+)$')
+
+
+def serve(args):
+    """The server process: theApiBrain on args.port, against the chosen backend."""
+    from werkzeug.serving import make_server
+    import theApiBrain as brain
+    brain.sql_cache.path = None
+    # Embedded by the stub model; emptied with the SQL cache before each level
+    brain.question_index = brain.create_question_index(
+        dict(brain.question_index_config, embedder='ollama', path=None))
+    brain.tracing_config['log_stages'] = False
+    if args.backend == 'duckdb':
+        brain.execution_backend = brain.create_execution_backend(dict(
+            brain.execution_config, backend='duckdb', parquet_dir=args.parquet_dir,
+            sync_from_mysql=False))
+        brain.rollups.enabled = False
+    brain.model_router.preload()
+    make_server('127.0.0.1', args.port, brain.app, threaded=True).serve_forever()
+
+
+def seed(args, rows):
+    """Load `rows` generated transactions. Returns the Parquet directory, if any."""
+    generator_args = ['backfill', '--rows', str(rows), '--end-date', '2024-12-31',
+                      '--seed', str(args.seed)]
+    if args.backend == 'mysql':
+        mydb = DataGenerator.connect(args)
+        mycursor = mydb.cursor()
+        mycursor.execute("DROP TABLE IF EXISTS transactions, transactions_daily, rollup_state")
+        mycursor.close()
+        mydb.close()
+        DataGenerator.backfill(DataGenerator.parse_args(
+            generator_args + ['--method', 'infile', '--host', args.host, '--user', args.user,
+                              '--password', args.password, '--database', args.database]))
+        return None
+
+    directory = os.path.join(args.data_dir, f"sf-{rows}")
+    marker = os.path.join(directory, 'COMPLETE')
+    if not os.path.exists(marker):
+        if os.path.isdir(directory):
+            # Left over from an interrupted run
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+        DataGenerator.backfill(DataGenerator.parse_args(
+            generator_args + ['--method', 'parquet', '--parquet-dir', directory]))
+        with open(marker, 'w') as f:
+            f.write(f"{rows}\n")
+    return directory
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, parquet_dir, ollama_url, log_path):
+    port = free_port()
+    command = [sys.executable, os.path.abspath(__file__), 'serve', '--port', str(port),
+               '--backend', args.backend]
+    if parquet_dir:
+        command += ['--parquet-dir', parquet_dir]
+    log = open(log_path, 'w')
+    server = subprocess.Popen(command, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT,
+                              env=dict(os.environ, OLLAMA_HOST=ollama_url))
+    log.close()
+    api = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            break
+        try:
+            with urllib.request.urlopen(f"{api}/api/execution-backend", timeout=5):
+                return server, api
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    server.kill()
+    with open(log_path) as f:
+        raise SystemExit("The API server did not start:\n" + "".join(f.readlines()[-20:]))
+
+
+def load_workload(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def replay(api, workload, clients, duration):
+    """Replay the workload from each client for duration seconds. Returns (latencies, errors)."""
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(number):
+        i = 0
+        while time.monotonic() < deadline:
+            entry = workload[i % len(workload)]
+            i += 1
+            session = urllib.parse.quote(f"{entry['session']}-{clients}-{number}")
+            if entry.get('reload'):
+                url = f"{api}/api/should-reload?session={session}"
+            else:
+                url = (f"{api}/api/ask-database-set/{urllib.parse.quote(entry['question'])}"
+                       f"?session={session}")
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=300) as response:
+                    response.read()
+            except (urllib.error.URLError, OSError) as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def stage_totals(api):
+    """Seconds and calls per pipeline stage so far, from the server's /metrics."""
+    totals = {}
+    with urllib.request.urlopen(f"{api}/metrics", timeout=30) as response:
+        for line in response.read().decode().splitlines():
+            match = STAGE_PATTERN.match(line)
+            if not match:
+                continue
+            kind, labels, value = match.groups()
+            stage = re.search(r'stage="([^"]*)"', labels).group(1)
+            entry = totals.setdefault(stage, {'sum': 0.0, 'count': 0.0})
+            entry[kind] += float(value)
+    return totals
+
+
+def stage_means(before, after):
+    """Mean milliseconds per call of each stage between two stage_totals()."""
+    means = {}
+    for stage, entry in after.items():
+        previous = before.get(stage, {'sum': 0.0, 'count': 0.0})
+        calls = entry['count'] - previous['count']
+        if calls:
+            means[stage] = round((entry['sum'] - previous['sum']) / calls * 1000, 2)
+    return means
+
+
+def question_index_counts(api):
+    """The question index's reused/hinted/missed lookups so far."""
+    with urllib.request.urlopen(f"{api}/api/question-index", timeout=30) as response:
+        stats = json.loads(response.read())
+    return {name: stats.get(name, 0) for name in ('reused', 'hinted', 'misses')}
+
+
+def memory_mb(pid):
+    """(resident, peak resident) MB of a process, or (None, None) where /proc isn't available."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(':', 1) for line in f)
+    except OSError:
+        return None, None
+    return (int(fields['VmRSS'].split()[0]) / 1024, int(fields['VmHWM'].split()[0]) / 1024)
+
+
+def git_revision():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                         text=True, stderr=subprocess.DEVNULL).strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                        cwd=ROOT, text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+
+def load_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def shape(record):
+    """What has to match for two results to be comparable."""
+    return (record['backend'], record['rows'], record['clients'], record['workload'],
+            record['token_delay'], record['warm'])
+
+
+def summarize(latencies, errors, duration):
+    summary = {'requests': len(latencies), 'errors': len(errors),
+               'throughput': round(len(latencies) / duration, 2)}
+    if latencies:
+        percentiles = (statistics.quantiles(latencies, n=100) if len(latencies) > 1
+                       else latencies * 99)
+        summary.update(p50_ms=round(percentiles[49] * 1000, 1),
+                       p95_ms=round(percentiles[94] * 1000, 1),
+                       p99_ms=round(percentiles[98] * 1000, 1),
+                       max_ms=round(max(latencies) * 1000, 1))
+    return summary
+
+
+def print_record(record, previous):
+    if not record['requests']:
+        print(f"{record['rows']:>12,}{record['clients']:>9}   no successful requests "
+              f"({record['errors']} errors)")
+        return
+    rss = f"{record['rss_mb']:.0f}" if record['rss_mb'] is not None else '-'
+    change = '-'
+    if previous and previous.get('p95_ms'):
+        change = (f"{(record['p95_ms'] / previous['p95_ms'] - 1) * 100:+.0f}% "
+                  f"vs {previous['commit'] or '?'}")
+    print(f"{record['rows']:>12,}{record['clients']:>9}{record['throughput']:>9.1f}"
+          f"{record['p50_ms']:>10.1f}{record['p95_ms']:>10.1f}{record['p99_ms']:>10.1f}"
+          f"{record['errors']:>8}{rss:>8}   {change}")
+    stages = ", ".join(f"{stage} {ms}" for stage, ms in sorted(record['stages_ms'].items()))
+    print(f"{'':>21}stage ms: {stages or '-'}")
+    index = record.get('question_index') or {}
+    print(f"{'':>21}question index: {index.get('reused', 0)} reused, "
+          f"{index.get('hinted', 0)} hinted, {index.get('misses', 0)} misses")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('mode', choices=['run', 'serve'], nargs='?', default='run',
+                        help="run: the benchmark (default); serve: the API server it starts")
+    parser.add_argument('--scales', default='100000,1000000',
+                        help='comma-separated row counts to load')
+    parser.add_argument('--concurrency', default='1,4,16',
+                        help='comma-separated numbers of concurrent clients')
+    parser.add_argument('--duration', type=float, default=20, help='seconds per level')
+    parser.add_argument('--workload', default=os.path.join(HERE, 'workload.jsonl'),
+                        help='JSON lines of {"session", "question"} or {"session", "reload": true}')
+    parser.add_argument('--warm', action='store_true',
+                        help='keep the SQL cache between levels')
+    parser.add_argument('--token-delay', type=float, default=0.005,
+                        help='seconds per token generated by the stub model')
+    parser.add_argument('--preamble-tokens', type=int, default=200)
+    parser.add_argument('--trailer-tokens', type=int, default=120)
+    parser.add_argument('--backend', choices=['duckdb', 'mysql'], default='duckdb')
+    parser.add_argument('--data-dir', default=os.path.join(ROOT, 'bench_data'),
+                        help='where generated Parquet data is kept between runs')
+    parser.add_argument('--results', default=os.path.join(HERE, 'results', 'endToEnd.jsonl'))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--port', type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--parquet-dir', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--user', default='user')
+    parser.add_argument('--password', default='userpassword')
+    parser.add_argument('--database', default='my_database')
+    args = parser.parse_args()
+
+    if args.mode == 'serve':
+        serve(args)
+        return
+
+    scales = [int(rows) for rows in args.scales.split(',')]
+    levels = [int(clients) for clients in args.concurrency.split(',')]
+    workload = load_workload(args.workload)
+    os.makedirs(args.data_dir, exist_ok=True)
+    history = load_results(args.results)
+    commit = git_revision()
+
+    stub = StubOllama(token_delay=args.token_delay, preamble_tokens=args.preamble_tokens,
+                      trailer_tokens=args.trailer_tokens).start()
+    records = []
+    try:
+        for rows in scales:
+            parquet_dir = seed(args, rows)
+            server, api = start_server(args, parquet_dir, stub.url,
+                                       os.path.join(args.data_dir, 'server.log'))
+            print(f"\n{'rows':>12}{'clients':>9}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}"
+                  f"{'p99 ms':>10}{'errors':>8}{'RSS MB':>8}   p95 change")
+            try:
+                for clients in levels:
+                    if not args.warm:
+                        urllib.request.urlopen(f"{api}/api/sql-cache/invalidate", timeout=30).read()
+                    llm_calls = stub.requests
+                    before, index_before = stage_totals(api), question_index_counts(api)
+                    latencies, errors = replay(api, workload, clients, args.duration)
+                    after, index_after = stage_totals(api), question_index_counts(api)
+                    rss, peak = memory_mb(server.pid)
+                    record = dict(
+                        summarize(latencies, errors, args.duration),
+                        time=datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                        commit=commit, python=platform.python_version(),
+                        backend=args.backend, rows=rows, clients=clients,
+                        duration=args.duration, workload=os.path.basename(args.workload),
+                        token_delay=args.token_delay, warm=args.warm,
+                        llm_calls=stub.requests - llm_calls,
+                        rss_mb=rss and round(rss, 1), peak_rss_mb=peak and round(peak, 1),
+                        stages_ms=stage_means(before, after),
+                        question_index={name: index_after[name] - index_before[name]
+                                        for name in index_after})
+                    previous = next((old for old in reversed(history)
+                                     if shape(old) == shape(record)), None)
+                    print_record(record, previous)
+                    records.append(record)
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        stub.stop()
+        if records:
+            os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+            with open(args.results, 'a') as f:
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+            print(f"\nAppended {len(records)} results to {args.results}")
+
+
+if __name__ == '__main__':
+    main()
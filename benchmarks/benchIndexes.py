@@ -0,0 +1,122 @@
+"""
+Benchmark: typical generated queries on a large transactions table, without and with secondary indexes.
+
+Needs a MySQL server. Load 10M rows first, or pass --generate to do it here:
+
+    python DataGenerator.py backfill --rows 10000000 --end-date 2024-12-31 --method infile --no-indexes
+    python benchmarks/benchIndexes.py --runs 3
+
+"Before" drops every secondary index on the table, "after" adds
+DataGenerator.TABLE_INDEXES (or, with --advised, whatever IndexAdvisor
+proposes for the same queries). For each query it prints the median time
+and the key and row estimate EXPLAIN reports. The indexes are left in place.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import DataGenerator  # noqa: E402
+
+QUERIES = [
+    ('sales by state',
+     "SELECT State, SUM(TotalAmount) AS TotalSales FROM transactions "
+     "GROUP BY State ORDER BY TotalSales DESC"),
+    ('one state, one year',
+     "SELECT SUM(TotalAmount) AS TotalSales FROM transactions "
+     "WHERE State = 'California' AND Timestamp BETWEEN '2023-01-01' AND '2023-12-31'"),
+    ('quantity per product, month',
+     "SELECT ProductID, SUM(Quantity) AS Quantity FROM transactions "
+     "WHERE Timestamp >= '2024-06-01' AND Timestamp < '2024-07-01' GROUP BY ProductID"),
+    ('latest rows of a product',
+     "SELECT * FROM transactions WHERE ProductID = 'P0007' ORDER BY Timestamp DESC LIMIT 10"),
+    ('sales in the last week',
+     "SELECT SUM(TotalAmount) AS TotalSales FROM transactions WHERE Timestamp >= '2024-12-24'"),
+]
+
+
+def secondary_indexes(mycursor):
+    mycursor.execute("SHOW INDEX FROM transactions")
+    return sorted({row[2] for row in mycursor.fetchall()} - {'PRIMARY'})
+
+
+def measure(mycursor, sql, runs):
+    mycursor.execute(sql)
+    mycursor.fetchall()  # warm the buffer pool
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        mycursor.execute(sql)
+        mycursor.fetchall()
+        samples.append(time.perf_counter() - start)
+    mycursor.execute(f"EXPLAIN {sql}")
+    columns = [column[0] for column in mycursor.description]
+    plan = dict(zip(columns, mycursor.fetchone()))
+    return statistics.median(samples) * 1000, plan['key'] or '-', plan['rows']
+
+
+def advised_indexes():
+    import theApiBrain as brain
+    advisor = brain.IndexAdvisor(max_recommendations=len(QUERIES))
+    for _, sql in QUERIES:
+        advisor.record(sql)
+    return {proposal['name']: proposal['columns']
+            for proposal in advisor.recommendations(existing={'PRIMARY': ['ID']})}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--generate', action='store_true',
+                        help='load --rows fresh rows with DataGenerator first')
+    parser.add_argument('--rows', type=int, default=10000000)
+    parser.add_argument('--advised', action='store_true',
+                        help="use IndexAdvisor's proposals instead of TABLE_INDEXES")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--user', default='user')
+    parser.add_argument('--password', default='userpassword')
+    parser.add_argument('--database', default='my_database')
+    args = parser.parse_args()
+
+    connection_args = ['--host', args.host, '--user', args.user,
+                       '--password', args.password, '--database', args.database]
+    if args.generate:
+        DataGenerator.backfill(DataGenerator.parse_args(
+            ['backfill', '--rows', str(args.rows), '--end-date', '2024-12-31',
+             '--method', 'infile', '--no-indexes'] + connection_args))
+
+    mydb = DataGenerator.connect(args)
+    mycursor = mydb.cursor()
+    mycursor.execute("SELECT COUNT(*) FROM transactions")
+    (rows,) = mycursor.fetchone()
+    print(f"transactions: {rows:,} rows")
+
+    dropped = secondary_indexes(mycursor)
+    if dropped:
+        mycursor.execute("ALTER TABLE transactions " +
+                         ", ".join(f"DROP INDEX {name}" for name in dropped))
+        print(f"Dropped {', '.join(dropped)}")
+    before = {name: measure(mycursor, sql, args.runs) for name, sql in QUERIES}
+
+    indexes = advised_indexes() if args.advised else DataGenerator.TABLE_INDEXES
+    for name, columns in indexes.items():
+        print(f"{name}: ({', '.join(columns)})")
+    DataGenerator.ensure_indexes(mydb, mycursor, indexes)
+    after = {name: measure(mycursor, sql, args.runs) for name, sql in QUERIES}
+
+    print(f"\n{'query':<30}{'before ms':>12}{'after ms':>12}{'speedup':>9}"
+          f"   {'rows examined (est.)':<24}key")
+    for name, _ in QUERIES:
+        (old_ms, _, old_rows), (new_ms, key, new_rows) = before[name], after[name]
+        print(f"{name:<30}{old_ms:>12.1f}{new_ms:>12.1f}{old_ms / new_ms:>8.1f}x"
+              f"   {f'{old_rows:,} -> {new_rows:,}':<24}{key}")
+
+    mycursor.close()
+    mydb.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark: time-to-SQL and time-to-first-answer-text, blocking vs streaming.
+
+Runs against the stub Ollama server, so no model or GPU is needed:
+
+    python benchmarks/benchStreaming.py --runs 5 --token-delay 0.01
+
+"Blocking" is the old behaviour (wait for the whole response, then run
+extractSQLQuery); "streaming" is query_ollama_cli, which stops the
+generation as soon as the ```sql``` block closes.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from stubOllama import StubOllama  # noqa: E402
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--token-delay', type=float, default=0.01,
+                        help='seconds per generated token')
+    parser.add_argument('--preamble-tokens', type=int, default=200)
+    parser.add_argument('--trailer-tokens', type=int, default=120)
+    args = parser.parse_args()
+
+    stub = StubOllama(token_delay=args.token_delay,
+                      preamble_tokens=args.preamble_tokens,
+                      trailer_tokens=args.trailer_tokens).start()
+    # The ollama module reads OLLAMA_HOST when it is first imported
+    os.environ['OLLAMA_HOST'] = stub.url
+    import theApiBrain as brain
+    brain.sql_cache.path = None
+
+    question = "total sales by state"
+    sql_prompt = brain.build_sql_prompt(question)
+    humanize_prompt = brain.build_humanize_prompt(question, [{'State': 'California', 'TotalSales': 1234.56}])
+
+    def blocking_sql():
+        response = brain.chat(model='deepseek-r1:8b',
+                              messages=[{'role': 'user', 'content': sql_prompt}])
+        return brain.extractSQLQuery(response['message']['content'])
+
+    def blocking_first_text():
+        return brain.chat(model='deepseek-r1:8b',
+                          messages=[{'role': 'user', 'content': humanize_prompt}])
+
+    def streaming_first_text():
+        answer_filter = brain.AnswerStreamFilter()
+        stream = brain.stream_chat(humanize_prompt)
+        try:
+            for chunk in stream:
+                if answer_filter.feed(chunk):
+                    return chunk
+        finally:
+            stream.close()
+
+    cases = [
+        ('time to SQL', blocking_sql, lambda: brain.query_ollama_cli(question)),
+        ('time to first answer text', blocking_first_text, streaming_first_text),
+    ]
+    print(f"{'measure':<28}{'blocking ms':>14}{'streaming ms':>14}{'saved':>9}"
+          f"{'tokens/call':>20}")
+    for name, blocking, streaming in cases:
+        timings, tokens = {}, {}
+        for label, func in (('blocking', blocking), ('streaming', streaming)):
+            samples = []
+            before = stub.tokens_generated
+            for _ in range(args.runs):
+                elapsed, result = timed(func)
+                assert result, f"{label} {name} returned nothing"
+                samples.append(elapsed)
+            # Let the stub notice cancelled streams before counting tokens
+            time.sleep(args.token_delay * 5)
+            timings[label] = statistics.median(samples) * 1000
+            tokens[label] = (stub.tokens_generated - before) / args.runs
+        saved = 1 - timings['streaming'] / timings['blocking']
+        print(f"{name:<28}{timings['blocking']:>14.1f}{timings['streaming']:>14.1f}"
+              f"{saved:>9.0%}{tokens['blocking']:>10.0f} -> {tokens['streaming']:<6.0f}")
+
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
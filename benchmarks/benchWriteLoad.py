@@ -0,0 +1,137 @@
+"""
+Load test: API latency with no writes, then while DataGenerator's parallel ingest is writing.
+
+Needs MySQL and a running API (theApiBrain.py or theAsyncApiBrain.py):
+
+    python benchmarks/benchWriteLoad.py --clients 8 --duration 30 --workers 4
+
+Each client asks questions the template fast path answers, so the numbers
+measure the database and the server, not the LLM. Every client has its own
+session. The writer runs `DataGenerator.py parallel` until the second phase
+ends.
+"""
+import argparse
+import datetime
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+QUESTIONS = [
+    "total sales by state",
+    "how many transactions per month",
+    "average unit price in Texas",
+    "top 5 products by quantity",
+]
+
+
+def run_clients(api, clients, duration):
+    """Ask QUESTIONS in a loop from each client for duration seconds. Returns (latencies, errors)."""
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(number):
+        i = number
+        while time.monotonic() < deadline:
+            question = QUESTIONS[i % len(QUESTIONS)]
+            i += 1
+            url = (f"{api}/api/ask-database-set/{urllib.parse.quote(question)}"
+                   f"?session=load{number}")
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=120) as response:
+                    response.read()
+            except (urllib.error.URLError, OSError) as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def summarize(name, latencies, errors, duration):
+    if not latencies:
+        print(f"{name:<14}no successful requests ({len(errors)} errors)")
+        return
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    print(f"{name:<14}{len(latencies) / duration:>9.1f}{percentiles[49] * 1000:>10.1f}"
+          f"{percentiles[94] * 1000:>10.1f}{max(latencies) * 1000:>10.1f}{len(errors):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--api', default='http://127.0.0.1:3308')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30, help='seconds per phase')
+    parser.add_argument('--workers', type=int, default=4, help='DataGenerator writer processes')
+    parser.add_argument('--rows', type=int, default=100000000,
+                        help='rows the writers insert at most (they are stopped after the phase)')
+    parser.add_argument('--end-date', default=datetime.date.today().isoformat(),
+                        help="the writers spread their rows up to this date")
+    parser.add_argument('--commit-every', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--user', default='user')
+    parser.add_argument('--password', default='userpassword')
+    parser.add_argument('--database', default='my_database')
+    args = parser.parse_args()
+
+    idle = run_clients(args.api, args.clients, args.duration)
+
+    writer = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'DataGenerator.py'), 'parallel',
+         '--workers', str(args.workers), '--rows', str(args.rows),
+         '--batch-size', str(args.batch_size), '--commit-every', str(args.commit_every),
+         '--end-date', args.end_date,
+         '--seed', '1', '--host', args.host, '--user', args.user,
+         '--password', args.password, '--database', args.database],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+        start_new_session=True)
+    writer_output = []
+    reader = threading.Thread(target=lambda: writer_output.extend(writer.stdout), daemon=True)
+    reader.start()
+    try:
+        busy = run_clients(args.api, args.clients, args.duration)
+    finally:
+        # Stop the worker processes too, not just the parent
+        try:
+            os.killpg(writer.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        writer.wait()
+        reader.join(timeout=5)
+
+    print(f"\n{'phase':<14}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'errors':>8}")
+    summarize('idle', *idle, args.duration)
+    summarize('heavy writes', *busy, args.duration)
+
+    # Last progress line of each worker: its rows/sec while the API was under load
+    last = {}
+    for line in writer_output:
+        if line.startswith('[worker'):
+            last[line.split(']')[0]] = line.strip()
+    print()
+    for line in last.values():
+        print(line)
+    if not last:
+        print("The writer inserted nothing:\n" + "".join(writer_output[-5:]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+A small stand-in for the Ollama HTTP API, for offline benchmarks.
+
+Serves POST /api/chat, streamed as NDJSON or as a single JSON body, the way
+deepseek-r1 answers: a <think> preamble, then the reply (a ```sql``` block
+for SQL prompts, a <<< >>> sentence for humanize prompts), then a trailing
+explanation. One token is emitted every `token_delay` seconds, and the
+number of tokens actually generated is counted so benchmarks can show how
+much work a cancelled stream saved. A chat without messages loads the
+model, as Ollama's does; the models loaded this way are in `loaded`.
+
+POST /api/embed returns bag-of-words embeddings, hashed into `dimensions`
+buckets after `embed_delay` seconds, so rewordings that share their words
+come out close, as they would from a real embedding model.
+"""
+import json
+import math
+import re
+import threading
+import zlib
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_SQL_REPLY = (
+    "```sql\nSELECT State, SUM(TotalAmount) AS TotalSales\n"
+    "FROM transactions\nGROUP BY State\nORDER BY TotalSales DESC;\n```"
+)
+DEFAULT_ANSWER_REPLY = "<<< California has the highest total sales at $1,234.56 >>>"
+
+# Words the stub's embeddings leave out, so they don't dominate short questions
+STOP_WORDS = {'a', 'an', 'the', 'by', 'per', 'for', 'each', 'of', 'what', 'which', 'is',
+              'are', 'me', 'show', 'give', 'to', 'in', 'has', 'have', 'did', 'do', 'does'}
+
+
+class StubOllama:
+    """Runs the stub server on a background thread."""
+
+    def __init__(self, host='127.0.0.1', port=0, token_delay=0.01,
+                 preamble_tokens=200, trailer_tokens=120,
+                 sql_reply=DEFAULT_SQL_REPLY, answer_reply=DEFAULT_ANSWER_REPLY,
+                 embed_delay=0.005, dimensions=256):
+        self.token_delay = token_delay
+        self.embed_delay = embed_delay
+        self.dimensions = dimensions
+        self.embeddings = 0
+        self.preamble_tokens = preamble_tokens
+        self.trailer_tokens = trailer_tokens
+        self.sql_reply = sql_reply
+        self.answer_reply = answer_reply
+        self.tokens_generated = 0
+        self.requests = 0
+        self.loaded = []
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reply_for(self, prompt):
+        """Pick the canned reply for a prompt: humanize prompts mention <<< >>>."""
+        return self.answer_reply if "<<<" in prompt else self.sql_reply
+
+    def tokens_for(self, prompt):
+        reply_tokens = self.reply_for(prompt).replace("\n", "\n ").split(" ")
+        preamble = ["<think>"] + ["hmm"] * self.preamble_tokens + ["</think>\n\n"]
+        trailer = ["\n\nThis"] + ["explains"] * self.trailer_tokens
+        return preamble + [token + " " for token in reply_tokens] + trailer
+
+    def embedding(self, text):
+        """A unit-length hashed bag of the text's words."""
+        vector = [0.0] * self.dimensions
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            if word not in STOP_WORDS:
+                h = zlib.crc32(word.encode())
+                vector[h % self.dimensions] += 1.0 if h & 0x80000000 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def _count(self):
+        with self._lock:
+            self.tokens_generated += 1
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _chunk(self, model, content, done):
+                return {
+                    'model': model,
+                    'created_at': datetime.now(timezone.utc).isoformat(),
+                    'message': {'role': 'assistant', 'content': content},
+                    'done': done,
+                }
+
+            def _send_json(self, payload):
+                payload = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                if self.path not in ('/api/chat', '/api/embed'):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                model = body.get('model', 'stub')
+                if self.path == '/api/embed':
+                    inputs = body.get('input', [])
+                    inputs = [inputs] if isinstance(inputs, str) else inputs
+                    time.sleep(stub.embed_delay)
+                    with stub._lock:
+                        stub.embeddings += len(inputs)
+                    self._send_json({'model': model,
+                                     'embeddings': [stub.embedding(text) for text in inputs]})
+                    return
+                if not body.get('messages'):
+                    with stub._lock:
+                        stub.loaded.append(model)
+                    self._send_json(dict(self._chunk(model, "", True), done_reason='load'))
+                    return
+                prompt = body['messages'][-1]['content']
+                tokens = stub.tokens_for(prompt)
+                with stub._lock:
+                    stub.requests += 1
+
+                if not body.get('stream', True):
+                    for _ in tokens:
+                        time.sleep(stub.token_delay)
+                        stub._count()
+                    self._send_json(self._chunk(model, "".join(tokens), True))
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.end_headers()
+                try:
+                    for token in tokens:
+                        time.sleep(stub.token_delay)
+                        stub._count()
+                        self.wfile.write((json.dumps(self._chunk(model, token, False)) + "\n").encode())
+                        self.wfile.flush()
+                    self.wfile.write((json.dumps(self._chunk(model, "", True)) + "\n").encode())
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client cancelled the generation
+                    pass
+
+        return Handler
+
+
+if __name__ == '__main__':
+    stub = StubOllama(port=11434).start()
+    print(f"Stub Ollama listening on {stub.url}")
+    try:
+        stub._thread.join()
+    except KeyboardInterrupt:
+        stub.stop()
@@ -0,0 +1,139 @@
+"""
+TabPy client for the rows of the last "give me" question (/api/last-10-records).
+
+AiQueryClient keeps one pooled requests.Session and remembers the last rows
+it received along with their ETag. The server's ETag only changes when new
+rows arrive or the question changes, so refreshing an unchanged dashboard
+gets a 304 with no body and no query. Rows are sent as an Arrow IPC stream
+when pyarrow is installed, and as JSON otherwise, gzipped either way. They
+are returned as a dict of column lists, the shape a Tableau table extension
+expects, without building a DataFrame.
+
+Deploy the client to TabPy once, so its session and cache outlive each
+evaluation:
+
+    python tabpyClient.py --api http://127.0.0.1:3308 --session my-dashboard --tabpy http://localhost:9004
+
+Then the table extension script is:
+
+    return tabpy.query('aiquery_rows')['response']
+
+Without --tabpy it fetches the rows twice and prints what each request cost.
+"""
+import argparse
+import json
+import zlib
+
+import requests  # type: ignore
+from requests.adapters import HTTPAdapter
+
+try:
+    import pyarrow as pa
+except ImportError:  # rows come as JSON instead
+    pa = None
+
+ARROW = 'application/vnd.apache.arrow.stream'
+
+
+def rows_to_columns(rows):
+    """[{column: value}, ...] -> {column: [values]}."""
+    if isinstance(rows, dict):
+        return rows
+    names = list(rows[0]) if rows else []
+    return {name: [row.get(name) for row in rows] for name in names}
+
+
+class AiQueryClient:
+    """Fetches one dashboard session's rows, reusing them while they're unchanged."""
+
+    def __init__(self, api_url='http://127.0.0.1:3308', session_id=None, timeout=60,
+                 pool_size=4):
+        self.api_url = api_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # requests already sends Accept-Encoding: gzip
+        self.session.headers['Accept'] = ARROW if pa is not None else 'application/json'
+        if session_id:
+            self.session.headers['X-Session-ID'] = session_id
+        self._etag = None
+        self._columns = None
+        self.stats = {'requests': 0, 'not_modified': 0, 'bytes_received': 0}
+
+    def fetch(self):
+        """The rows as {column: [values]}, or None if the request failed."""
+        headers = {}
+        if self._etag and self._columns is not None:
+            headers['If-None-Match'] = self._etag
+        try:
+            response = self.session.get(f"{self.api_url}/api/last-10-records", headers=headers,
+                                        timeout=self.timeout, stream=True)
+            # Read the body as sent, to count the bytes on the wire
+            body = b"".join(response.raw.stream(65536, decode_content=False))
+        except requests.RequestException as e:
+            print(f"Failed : {e}")
+            return None
+        self.stats['requests'] += 1
+        self.stats['bytes_received'] += len(body)
+        if body and response.headers.get('Content-Encoding') == 'gzip':
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+
+        if response.status_code == 304:
+            self.stats['not_modified'] += 1
+            return self._columns
+        if response.status_code != 200:
+            print(f"Failed : {response.status_code}")
+            return None
+
+        if response.headers.get('Content-Type', '').split(';')[0] == ARROW:
+            columns = pa.ipc.open_stream(body).read_all().to_pydict() if body else {}
+        else:
+            columns = rows_to_columns(json.loads(body))
+        self._etag = response.headers.get('ETag')
+        self._columns = columns
+        return columns
+
+
+client = AiQueryClient()
+
+
+def fetch_data_from_api():
+    return client.fetch()
+
+
+def deploy(tabpy_url, aiquery_client, name='aiquery_rows'):
+    """Deploy aiquery_client.fetch to a TabPy server as the `name` endpoint."""
+    from tabpy.tabpy_tools.client import Client
+    Client(tabpy_url).deploy(name, aiquery_client.fetch,
+                             'Rows of the last "give me" question, as columns', override=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--api', default='http://127.0.0.1:3308')
+    parser.add_argument('--session', default=None, help="the dashboard's session ID")
+    parser.add_argument('--tabpy', default=None, help='TabPy server to deploy the client to')
+    parser.add_argument('--name', default='aiquery_rows', help='TabPy endpoint name')
+    args = parser.parse_args()
+
+    aiquery_client = AiQueryClient(args.api, args.session)
+    if args.tabpy:
+        deploy(args.tabpy, aiquery_client, args.name)
+        print(f"Deployed {args.name} to {args.tabpy}")
+        return
+
+    for attempt in ('first', 'second'):
+        received = aiquery_client.stats['bytes_received']
+        columns = aiquery_client.fetch()
+        if columns is None:
+            return
+        rows = len(next(iter(columns.values()), []))
+        print(f"{attempt} fetch: {rows} rows, {len(columns)} columns, "
+              f"{aiquery_client.stats['bytes_received'] - received:,} bytes received")
+    print(aiquery_client.stats)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,36 @@
 import logging
-from flask import Flask, request, jsonify
+import asyncio
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 import mysql.connector
 from flask_cors import CORS  # Import CORS
 from mysql.connector import Error
-from ollama import chat
+from ollama import ResponseError, chat, embed
 import re
+import queue
+import threading
+import os
+import json
+import time
+import hashlib
+import zlib
+import contextvars
+import sys
+import uuid
+import heapq
+import itertools
+import io
+from collections import OrderedDict, deque
+from datetime import timedelta
+from decimal import Decimal
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow IPC output is optional
+    pa = None
 
 app = Flask(__name__)
 CORS(app)
@@ -19,10 +45,185 @@ db_config = {
     'database': 'my_database'
 }
 
+# Connection pool settings: max open connections and seconds to wait for one
+pool_config = {
+    'size': 5,
+    'timeout': 10
+}
+
+# Question -> SQL cache settings: entries kept, seconds before an entry expires
+# and the file the cache is persisted to between restarts
+sql_cache_config = {
+    'max_entries': 500,
+    'ttl': 7 * 24 * 3600,
+    'path': 'sql_cache.json'
+}
+
+# Nearest-neighbour index of past questions whose SQL ran. A new question
+# whose cosine similarity to a stored one is at least reuse_similarity, and
+# which names the same numbers, values and qualifiers (month, average, top,
+# ...), reuses that SQL; otherwise the top_k stored questions at least
+# hint_similarity away go into the prompt as examples. embedder is 'ollama'
+# (embedding_model) or 'hashing' (word and character n-grams hashed into
+# `dimensions`, no model, but it only recognizes rewordings that share words,
+# so it wants higher thresholds). Vectors are memory-mapped under `path`
+question_index_config = {
+    'enabled': True,
+    'embedder': 'ollama',
+    'embedding_model': 'nomic-embed-text',
+    'dimensions': 512,
+    'reuse_similarity': 0.93,
+    'hint_similarity': 0.75,
+    'top_k': 3,
+    'max_entries': 5000,
+    'path': 'question_index'
+}
+
+# Number of distinct queries whose results are kept between reloads
+result_cache_config = {
+    'max_entries': 100
+}
+
+# Guardrails for generated SQL: per-query time limit (MAX_EXECUTION_TIME hint)
+# and the most rows EXPLAIN may estimate before a query is refused. Joined
+# tables multiply their estimates, so the default lets a full scan of a
+# 10M-row transactions table through but refuses joining it to itself
+sql_guard_config = {
+    'max_execution_ms': 10000,
+    'max_rows_scanned': 50000000
+}
+
+# Index advisor: distinct queries remembered, the widest index it proposes,
+# how many proposals it lists and whether /api/index-advisor/apply may run DDL
+index_advisor_config = {
+    'max_queries': 1000,
+    'max_index_columns': 5,
+    'max_recommendations': 5,
+    'allow_apply': False
+}
+
+# Pre-aggregated rollup of transactions per day x State x ProductID, kept up
+# to date from new ID ranges, folding at most batch_ids IDs per transaction
+rollup_config = {
+    'enabled': True,
+    'table': 'transactions_daily',
+    'batch_ids': 1000000
+}
+
+# Where execute_sql_query runs queries: 'mysql', or 'duckdb' for an embedded
+# columnar copy of transactions as Parquet files in parquet_dir, copied from
+# MySQL by ID range (sync_batch_ids IDs per file, small files merged once
+# there are more than max_files). With sync_from_mysql False the Parquet
+# files are served as they are, so no MySQL server is needed
+execution_config = {
+    'backend': 'mysql',
+    'parquet_dir': 'transactions_parquet',
+    'sync_batch_ids': 1000000,
+    'max_files': 64,
+    'sync_from_mysql': True
+}
+
+# Rows fetched per round trip when streaming "give me" results, and the gzip
+# level used for clients sending Accept-Encoding: gzip (0 turns it off)
+stream_config = {
+    'chunk_size': 1000,
+    'gzip_level': 6
+}
+
+# Per-dashboard session state: 'memory' (this process only), 'file' (a local
+# directory shared by the workers on one host) or 'redis' (shared by all workers)
+session_config = {
+    'backend': 'memory',
+    'max_sessions': 1000,
+    'ttl': 24 * 3600,
+    'path': 'sessions',
+    'redis_url': 'redis://localhost:6379/0'
+}
+
+# Writers commit in any order, so a lower ID can become visible after a
+# higher one. A max ID is only used as the high-water mark once every write
+# transaction open when it was read has ended (from information_schema.innodb_trx,
+# which needs the PROCESS privilege; without it, once it is lag_seconds old).
+# A process waits up to startup_wait seconds for its first such max ID
+visibility_config = {
+    'lag_seconds': 10,
+    'startup_wait': 30
+}
+
+# Change-data push: seconds between MAX(ID) checks, seconds a session stays
+# subscribed after its stream or last long-poll ends, longest long-poll wait
+# and seconds between SSE keep-alive comments
+watch_config = {
+    'interval': 2,
+    'subscriber_ttl': 60,
+    'long_poll_timeout': 25,
+    'keepalive': 15
+}
+
+# Local answers for simple results: longest answer in words and most rows
+# summarised without the LLM
+humanizer_config = {
+    'max_words': 15,
+    'max_rows': 100
+}
+
+# Prompt sizing: how long Ollama keeps the model (and the cached prompt
+# prefix) loaded between calls, and the token budget for DB results sent
+# to the humanizer
+prompt_config = {
+    'keep_alive': '30m',
+    'db_response_tokens': 600
+}
+
+# Self-repair of SQL that fails to run: model attempts per failure, seconds
+# allowed for the whole repair and error -> fix pairs remembered
+repair_config = {
+    'max_attempts': 3,
+    'time_budget': 60,
+    'memory_entries': 200
+}
+
+# Ollama calls allowed to run at once; match the model server's capacity
+# (OLLAMA_NUM_PARALLEL)
+llm_scheduler_config = {
+    'max_concurrency': 1
+}
+
+# Ollama model per task ('default' serves any task without its own), and the
+# smaller model a task switches to once a call has waited more than
+# queue_budget seconds for a model slot. With preload the models are loaded
+# when the server starts; pin keeps them loaded (keep_alive -1) instead of
+# for prompt_config['keep_alive']. Ollama keeps OLLAMA_MAX_LOADED_MODELS at once
+model_config = {
+    'models': {
+        'default': 'deepseek-r1:8b',
+        'sql': 'deepseek-r1:8b',
+        'repair': 'deepseek-r1:8b',
+        'humanize': 'llama3.2:3b'
+    },
+    'fallbacks': {
+        'sql': 'qwen2.5-coder:3b',
+        'repair': 'qwen2.5-coder:3b',
+        'humanize': 'llama3.2:1b'
+    },
+    'queue_budget': 5.0,
+    'preload': True,
+    'pin': True
+}
+
+# Tracing: one JSON log line per pipeline stage (log_stages), and a sampling
+# profiler for requests still running after slow_request_seconds, sampling
+# every profile_interval seconds into profile_dir (profile_slow_requests)
+tracing_config = {
+    'log_stages': True,
+    'slow_request_seconds': 10,
+    'profile_slow_requests': False,
+    'profile_interval': 0.01,
+    'profile_dir': 'profiles'
+}
+
+# Default number of records to return for new sessions
 return_data_num = 100
-last_checked_data = None
-Question = ""
-return_this_data = {}
 
 
 TABLE_CONTEXT = """
@@ -87,379 +288,4426 @@ ORDER BY TotalSales DESC;
 # Function to get database connection
 
 
+class ConnectionPool:
+    """
+    A small bounded pool of MySQL connections shared by every DB path.
+
+    Connections are pinged on checkout and replaced if they went stale, and
+    callers wait up to `timeout` seconds for a free connection once `size`
+    connections are checked out.
+    """
+
+    def __init__(self, config, size=5, timeout=10):
+        self.config = config
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self.stats = {'in_use': 0, 'waits': 0, 'created': 0, 'recycled': 0}
+
+    def _connect(self):
+        connection = mysql.connector.connect(
+            host=self.config['host'],
+            user=self.config['user'],
+            password=self.config['password'],
+            database=self.config['database']
+        )
+        self.stats['created'] += 1
+        return connection
+
+    def _healthy(self, connection):
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except Error:
+            return False
+
+    def acquire(self):
+        """Check out a healthy connection, opening one if the pool isn't full."""
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            connection = None
+            with self._lock:
+                if self._open < self.size:
+                    self._open += 1
+                    reserved = True
+                else:
+                    reserved = False
+            if reserved:
+                try:
+                    connection = self._connect()
+                except Error:
+                    with self._lock:
+                        self._open -= 1
+                    raise
+            else:
+                with self._lock:
+                    self.stats['waits'] += 1
+                try:
+                    connection = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise Error(msg="Timed out waiting for a database connection.")
+
+        if not self._healthy(connection):
+            with self._lock:
+                self.stats['recycled'] += 1
+            try:
+                connection.close()
+            except Error:
+                pass
+            try:
+                connection = self._connect()
+            except Error:
+                with self._lock:
+                    self._open -= 1
+                raise
+
+        with self._lock:
+            self.stats['in_use'] += 1
+        return connection
+
+    def release(self, connection):
+        """Return a connection to the pool, rolling back any open transaction."""
+        with self._lock:
+            self.stats['in_use'] -= 1
+        try:
+            connection.rollback()
+        except Error:
+            with self._lock:
+                self._open -= 1
+            return
+        self._idle.put(connection)
+
+    def discard(self, connection):
+        """Close a checked-out connection that can't be reused instead of returning it."""
+        with self._lock:
+            self.stats['in_use'] -= 1
+            self._open -= 1
+        try:
+            connection.close()
+        except Error:
+            pass
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, size=self.size, open=self._open,
+                        idle=self._idle.qsize(), timeout=self.timeout)
+
+
+db_pool = ConnectionPool(
+    db_config, size=pool_config['size'], timeout=pool_config['timeout'])
+
+
 def get_db_connection():
-    """Function to get a database connection."""
+    """Function to get a pooled database connection. Release it with db_pool.release()."""
     try:
-        mydb = mysql.connector.connect(
-            host=db_config['host'],
-            user=db_config['user'],
-            password=db_config['password'],
-            database=db_config['database']
-        )
-        return mydb
+        return db_pool.acquire()
     except Error as e:
         print(f"Error: {e}")
         return None
 
 
-# Function to query Ollama
-def query_ollama_cli_humanize(question, db_response):
+class SQLCache:
     """
-    Generates a concise, human-readable summary from the database response, 
-    returning the final answer between <<< and >>>.
+    Persistent LRU/TTL cache of question -> SQL translations.
+
+    Keys are the normalized question plus a hash of the table schema, so
+    changing TABLE_CONTEXT naturally invalidates every stored translation.
+    Only SQL that executed successfully is ever stored.
     """
 
-    try:
-        prompt = (
-            "You are a chatbot AI that generates extremely short answers based ONLY on the database response.\n"
-            "Strictly follow these rules:\n"
-            "1. The answer must be under 15 words.\n"
-            "2. Use only the exact numbers from the database response.\n"
-            "3. Do not add explanations, introductions, or extra details.\n"
-            "4. Enclose your final answer between <<< and >>>.\n"
-            "\n"
-            "Example Format:\n"
-            "  - Correct: <<< The total sales is $687.77 >>>\n\n"
-            f"Database response: {db_response}\n\n"
-            f"User's question: {question}\n\n"
-            "### Answer (strictly follow the format and length constraints):"
-        )
+    def __init__(self, schema, max_entries=500, ttl=None, path=None):
+        self.schema_hash = hashlib.sha256(schema.encode('utf-8')).hexdigest()[:16]
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        self._load()
 
-        response = chat(model='deepseek-r1:8b', messages=[
-            {'role': 'user', 'content': prompt},
-        ])
+    @staticmethod
+    def normalize(question):
+        question = re.sub(r"[^\w\s]", " ", question.lower())
+        return " ".join(question.split())
 
-        humanized_response = response['message']['content'].strip()
+    def key(self, question):
+        return f"{self.schema_hash}:{self.normalize(question)}"
 
-        # 1) If the response doesn't contain <<< >>>, enforce it
-        if "<<<" not in humanized_response or ">>>" not in humanized_response:
-            # Extract up to 15 words
-            words = humanized_response.split()
-            short_response = " ".join(words[:15])
-            humanized_response = f"<<< {short_response} >>>"
-
-        # 2) Ensure the final answer is under 15 words even if AI ignores instructions
-        #    We'll parse out only the text between <<< and >>>, then truncate if needed.
-        import re
-        match = re.search(r'<<<(.*?)>>>', humanized_response, re.DOTALL)
-        if match:
-            # Get the text inside <<< >>>
-            inner_text = match.group(1).strip()
-            words = inner_text.split()
-            if len(words) > 15:
-                inner_text = " ".join(words[:15])  # Truncate to 15 words
-            humanized_response = f"<<< {inner_text} >>>"
-        else:
-            # If for some reason there's no match, wrap forcibly
-            words = humanized_response.split()
-            short_response = " ".join(words[:15])
-            humanized_response = f"<<< {short_response} >>>"
-
-        # 3) Handle "not specified"/"no data" in case AI tries to generate a negative statement
-        if "not specified" in humanized_response.lower() or "no data" in humanized_response.lower():
-            # Provide a default if the DB has a numeric field named CombinedTotal
-            if db_response and isinstance(db_response, list) and "CombinedTotal" in db_response[0]:
-                amount = float(db_response[0]["CombinedTotal"])
-                humanized_response = f"<<< The combined total sales amount is ${amount:.2f} >>>"
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry['stored_at'] > self.ttl
+
+    def get(self, question):
+        key = self.key(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry, time.time()):
+                if entry is not None:
+                    del self._entries[key]
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry['sql']
+
+    def put(self, question, sql):
+        with self._lock:
+            key = self.key(question)
+            self._entries[key] = {'sql': sql, 'stored_at': time.time()}
+            self._entries.move_to_end(key)
+            self.stats['stores'] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+            self._save()
+
+    def invalidate(self, question=None):
+        """Drop one question, or the whole cache when no question is given."""
+        with self._lock:
+            if question is None:
+                removed = len(self._entries)
+                self._entries.clear()
             else:
-                humanized_response = "<<< Sorry, not enough data to form a short answer >>>"
+                removed = 1 if self._entries.pop(self.key(question), None) else 0
+            self._save()
+            return removed
 
-        return humanized_response
+    def snapshot(self):
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            hit_rate = self.stats['hits'] / lookups if lookups else 0.0
+            return dict(self.stats, entries=len(self._entries),
+                        max_entries=self.max_entries, hit_rate=hit_rate)
 
-    except Exception as e:
-        print(f"Error: {e}")
-        return "<<< Sorry, I couldn't process the data into a human-readable format. >>>"
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error: could not load SQL cache: {e}")
+            return
+        now = time.time()
+        for key, entry in stored.items():
+            # Entries written against another schema can never be hit again
+            if key.startswith(self.schema_hash + ":") and not self._expired(entry, now):
+                self._entries[key] = entry
 
-    """Takes the database response and generates a human-readable summary using the question for context."""
-    try:
-        prompt = (
-            f"You are an AI assistant that converts database query results into easy-to-understand answers.\n\n"
-            f"User asked: {question}\n\n"
-            f"Database returned the following JSON data:\n{db_response}\n\n"
-            f"Please analyze the response and provide a clear, human-readable summary.\n"
-            f"Keep it concise and informative. Do not include any SQL-related details."
-        )
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error: could not save SQL cache: {e}")
 
-        response = chat(model='deepseek-r1:8b', messages=[
-            {'role': 'user', 'content': prompt},
-        ])
 
-        humanized_response = response['message']['content'].strip()
-        return humanized_response
-    except Exception as e:
-        print(f"Error: {e}")
-        return "Sorry, I couldn't process the data into a human-readable format."
+sql_cache = SQLCache(TABLE_CONTEXT,
+                     max_entries=sql_cache_config['max_entries'],
+                     ttl=sql_cache_config['ttl'],
+                     path=sql_cache_config['path'])
 
 
-def query_ollama_cli(question):
-    """Query Ollama to generate a MySQL-compliant SQL query."""
-    try:
-        prompt = (
-            f"You are an SQL Jedi so make no mistakes, Convert the following question into a valid MySQL query that retrieves the required data "
-            f"from the transactions table. Make sure it is compatible with `ONLY_FULL_GROUP_BY` mode. "
-            f"Ensure that all non-aggregated columns appear in `GROUP BY` and avoid errors. "
-            f"Table Structure:\n{TABLE_CONTEXT} only use the columns provided in {TABLE_CONTEXT}\n\n"
-            f"Do NOT include `TotalAmount` in `GROUP BY` when using aggregate functions.\n\n"
-            f"Database: MySQL 8.0\n\n"
-            f"User's Question: {question}\n\n"
-            "Provide only the SQL query, enclosed in triple backticks (```sql ... ```). "
-        )
+class OllamaEmbedder:
+    """Question embeddings from an Ollama embedding model."""
 
-        response = chat(model='deepseek-r1:8b',
-                        messages=[{'role': 'user', 'content': prompt}])
-        sql_query = extractSQLQuery(response['message']['content'])
-        return sql_query
-    except Exception as e:
-        print(f"Error: {e}")
-        return None
+    def __init__(self, model):
+        self.model = model
+        self.name = f"ollama:{model}"
 
+    def __call__(self, text):
+        response = embed(model=self.model, input=text, keep_alive=prompt_config['keep_alive'])
+        return np.asarray(response['embeddings'][0], dtype=np.float32)
 
-def query_ollama_cli_forError(old_sql, error_message):
-    """Query Ollama to fix the SQL query based on an error message."""
-    try:
-        prompt = (
-            f"The following SQL query resulted in an error:\n\n"
-            f"SQL Query:\n{old_sql}\n\n"
-            f"Error Message:\n{error_message}\n\n"
-            "Please provide a corrected SQL query that resolves the error. "
-            "Ensure that the corrected query maintains the exact table structure as defined below:\n\n"
-            f"Table Structure:\n{TABLE_CONTEXT} only use the columns provided in {TABLE_CONTEXT}\n\n"
-            f"Database: MySQL 8.0\n\n"
-            "Provide only the corrected SQL query enclosed within triple backticks (` ```sql ... ``` `). "
-            "Do not include any explanations, headers, or comments.\n\n"
-            "Corrected SQL Query:\n"
-        )
 
-        response = chat(model='deepseek-r1:8b', messages=[
-            {'role': 'user', 'content': prompt},
-        ])
+class HashingEmbedder:
+    """
+    Model-free embeddings: words, word pairs and character trigrams hashed
+    into a fixed number of signed buckets. Filler words are left out, so
+    "sales by state" and "what are the sales for each state" coincide.
+    """
 
-        sql_query = extractSQLQuery(response['message']['content'])
-        return sql_query
-    except Exception as e:
-        print(f"Error: {e}")
-        return None
+    FILLER = {'a', 'an', 'the', 'by', 'per', 'for', 'each', 'every', 'of', 'what', 'which',
+              'is', 'are', 'was', 'were', 'me', 'show', 'give', 'list', 'tell', 'please',
+              'did', 'do', 'does', 'to', 'across', 'all'}
 
-# Function to execute SQL query
+    def __init__(self, dimensions=512):
+        self.dimensions = dimensions
+        self.name = f"hashing:{dimensions}"
 
+    def __call__(self, text):
+        words = [word for word in SQLCache.normalize(text).split() if word not in self.FILLER]
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f" {word} "
+            features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature in features:
+            h = zlib.crc32(feature.encode('utf-8'))
+            vector[h % self.dimensions] += 1.0 if h & 0x80000000 else -1.0
+        return vector
 
-def execute_sql_query(sql_query):
-    """Execute the SQL query and return the results."""
-    try:
-        connection = get_db_connection()
-        if connection is None:
-            return None, "Failed to connect to the database."
 
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute(sql_query)
-        results = cursor.fetchall()
+# Words that change what a question asks for even when the rest is reworded;
+# SQL is only reused between questions naming the same classes
+QUESTION_QUALIFIERS = {
+    'day': {'day', 'days', 'daily', 'today', 'yesterday'},
+    'week': {'week', 'weeks', 'weekly'},
+    'month': {'month', 'months', 'monthly'},
+    'quarter': {'quarter', 'quarters', 'quarterly'},
+    'year': {'year', 'years', 'yearly', 'annual', 'annually'},
+    'average': {'average', 'avg', 'mean'},
+    'count': {'count', 'number', 'many'},
+    'max': {'highest', 'most', 'max', 'maximum', 'top', 'best', 'largest', 'biggest'},
+    'min': {'lowest', 'least', 'min', 'minimum', 'bottom', 'worst', 'smallest', 'fewest'},
+    'quantity': {'quantity', 'quantities', 'units', 'items'},
+    'price': {'price', 'prices', 'unitprice'},
+}
+QUESTION_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+SQL_STRING_LITERAL = re.compile(r"'((?:[^'\\]|\\.|'')*)'|\"((?:[^\"\\]|\\.)*)\"")
 
-        cursor.close()
-        connection.close()
 
-        return results, None
-    except Error as e:
-        print(f"Database error: {e}")
-        return None, str(e)
+class QuestionIndex:
+    """
+    Embeddings of past questions whose SQL ran, for finding rewordings of
+    a question that the exact-match SQL cache misses.
 
+    Vectors are normalized float16 rows of a fixed-size array (memory-mapped
+    when a path is set), so the top-k cosine search is one matrix-vector
+    product. Once full, the oldest entry is overwritten.
+    """
 
-# Function to format results
-def format_results(results, expected_columns):
-    """Format the results to match the expected table structure."""
-    if not results:
-        return []
+    def __init__(self, schema, embedder, max_entries=5000, reuse_similarity=0.93,
+                 hint_similarity=0.75, top_k=3, path=None, enabled=True):
+        self.schema_hash = hashlib.sha256(schema.encode('utf-8')).hexdigest()[:16]
+        self.embedder = embedder
+        self.max_entries = max_entries
+        self.reuse_similarity = reuse_similarity
+        self.hint_similarity = hint_similarity
+        self.top_k = top_k
+        self.path = path
+        self.enabled = enabled
+        self._vectors = None
+        self._entries = [None] * max_entries
+        self._slots = {}  # normalized question -> slot
+        self._next = 0
+        self._filled = 0  # slots written so far, up to max_entries
+        self._recent = OrderedDict()  # normalized question -> vector, to embed once per ask
+        self._lock = threading.Lock()
+        self.stats = {'lookups': 0, 'reused': 0, 'hinted': 0, 'misses': 0, 'stores': 0,
+                      'embed_errors': 0, 'embed_seconds': 0.0}
+        self._load()
 
-    formatted = []
-    for row in results:
-        formatted_row = {column: row.get(column, None)
-                         for column in expected_columns}
-        formatted.append(formatted_row)
+    def _files(self):
+        return os.path.join(self.path, 'entries.json'), os.path.join(self.path, 'vectors.f16')
 
-    return formatted
+    def _allocate(self, dimensions, mode='w+'):
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+            self._vectors = np.memmap(self._files()[1], dtype=np.float16, mode=mode,
+                                      shape=(self.max_entries, dimensions))
+        else:
+            self._vectors = np.zeros((self.max_entries, dimensions), dtype=np.float16)
 
+    def _embed(self, question):
+        """Unit-length embedding of a question, or None if the embedder failed."""
+        key = SQLCache.normalize(question)
+        with self._lock:
+            vector = self._recent.get(key)
+        if vector is not None:
+            return vector
+        started = time.perf_counter()
+        try:
+            with trace('embed', embedder=self.embedder.name):
+                vector = self.embedder(question)
+        except Exception as e:
+            print(f"Error: could not embed question: {e}")
+            with self._lock:
+                self.stats['embed_errors'] += 1
+            return None
+        norm = np.linalg.norm(vector)
+        vector = vector / norm if norm else vector
+        with self._lock:
+            self.stats['embed_seconds'] += time.perf_counter() - started
+            self._recent[key] = vector
+            while len(self._recent) > 64:
+                self._recent.popitem(last=False)
+        return vector
 
-EXPECTED_COLUMNS = ['id', 'transaction_date', 'amount',
-                    'category']  # Adjust based on your table structure
+    def search(self, question, k=None):
+        """The k stored entries closest to the question: [(similarity, entry), ...]."""
+        vector = self._embed(question)
+        if vector is None:
+            return []
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != len(vector):
+                return []
+            similarities = np.asarray(self._vectors[:self._filled], dtype=np.float32) @ vector
+            k = min(k or self.top_k, self._filled)
+            if not k:
+                return []
+            best = np.argpartition(-similarities, k - 1)[:k]
+            return [(float(similarities[slot]), dict(self._entries[slot]))
+                    for slot in sorted(best, key=lambda slot: -similarities[slot])
+                    if self._entries[slot] is not None]
 
+    @staticmethod
+    def _qualifiers(words):
+        return {name for name, vocabulary in QUESTION_QUALIFIERS.items() if vocabulary & words}
 
-# Endpoint to set the number of records to return
-@app.route('/api/set-return-num/<int:num>', methods=['GET'])
-def set_return_num(num):
-    global return_data_num
-    return_data_num = num
-    return jsonify({'message': f'Successfully set the number of records to return to {num}'})
+    @classmethod
+    def compatible(cls, question, entry):
+        """
+        Whether the entry's SQL answers question as well: both name the same
+        numbers and qualifiers, and every SQL value the stored question
+        mentions (a state, a product) is in the new one too.
+        """
+        new, old = SQLCache.normalize(question), SQLCache.normalize(entry['question'])
+        if sorted(QUESTION_NUMBER.findall(new)) != sorted(QUESTION_NUMBER.findall(old)):
+            return False
+        if cls._qualifiers(set(new.split())) != cls._qualifiers(set(old.split())):
+            return False
+        for single, double in SQL_STRING_LITERAL.findall(entry['sql']):
+            value = SQLCache.normalize(single or double)
+            if value and f" {value} " in f" {old} " and f" {value} " not in f" {new} ":
+                return False
+        return True
 
+    def match(self, question):
+        """
+        Returns (sql, examples): the SQL of a stored rewording of question to
+        reuse as is, or else stored (question, sql) pairs similar enough to
+        show the model.
+        """
+        if not self.enabled:
+            return None, []
+        neighbours = self.search(question)
+        with self._lock:
+            self.stats['lookups'] += 1
+        for similarity, entry in neighbours:
+            if similarity >= self.reuse_similarity and self.compatible(question, entry):
+                with self._lock:
+                    self.stats['reused'] += 1
+                return entry['sql'], []
+        examples = [(entry['question'], entry['sql']) for similarity, entry in neighbours
+                    if similarity >= self.hint_similarity]
+        with self._lock:
+            self.stats['hinted' if examples else 'misses'] += 1
+        return None, examples
 
-# @app.route('/ask', methods=['POST'])
+    def put(self, question, sql):
+        """Index a question whose SQL ran successfully."""
+        if not self.enabled:
+            return
+        vector = self._embed(question)
+        if vector is None:
+            return
+        key = SQLCache.normalize(question)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != len(vector):
+                self._reset(len(vector))
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._next
+                self._next = (self._next + 1) % self.max_entries
+                evicted = self._entries[slot]
+                if evicted is not None:
+                    self._slots.pop(SQLCache.normalize(evicted['question']), None)
+            self._vectors[slot] = vector
+            self._filled = max(self._filled, slot + 1)
+            self._entries[slot] = {'question': question, 'sql': sql, 'stored_at': time.time()}
+            self._slots[key] = slot
+            self.stats['stores'] += 1
+            self._save()
 
+    def invalidate(self, question=None):
+        """Drop one question, or every entry when no question is given."""
+        with self._lock:
+            if question is None:
+                removed = len(self._slots)
+                self._entries = [None] * self.max_entries
+                self._slots.clear()
+                self._next = self._filled = 0
+                if self._vectors is not None:
+                    self._vectors[:] = 0
+            else:
+                slot = self._slots.pop(SQLCache.normalize(question), None)
+                removed = 0 if slot is None else 1
+                if slot is not None:
+                    self._entries[slot] = None
+                    self._vectors[slot] = 0
+            self._save()
+            return removed
 
-def extractSQLQuery(text):
-    """
-    Extracts the SQL query from a text response.
-    It handles cases where the SQL query is enclosed within triple backticks
-    or directly present in the text.
+    def snapshot(self):
+        with self._lock:
+            hits = self.stats['reused'] + self.stats['hinted']
+            return dict(self.stats, entries=len(self._slots), max_entries=self.max_entries,
+                        embedder=self.embedder.name, enabled=self.enabled,
+                        hit_rate=hits / self.stats['lookups'] if self.stats['lookups'] else 0.0)
 
-    Args:
-        text (str): The text response containing the SQL query.
+    def _reset(self, dimensions):
+        self._entries = [None] * self.max_entries
+        self._slots.clear()
+        self._next = self._filled = 0
+        self._allocate(dimensions)
 
-    Returns:
-        str: The extracted SQL query.
+    def _load(self):
+        if not self.path:
+            return
+        entries_path, vectors_path = self._files()
+        if not os.path.exists(entries_path) or not os.path.exists(vectors_path):
+            return
+        try:
+            with open(entries_path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error: could not load question index: {e}")
+            return
+        # Vectors from another embedder, schema or size can't be searched
+        if (stored.get('schema') != self.schema_hash or stored.get('embedder') != self.embedder.name
+                or len(stored.get('entries', [])) != self.max_entries):
+            return
+        self._allocate(stored['dimensions'], mode='r+')
+        self._entries = stored['entries']
+        self._next = stored['next']
+        self._slots = {SQLCache.normalize(entry['question']): slot
+                       for slot, entry in enumerate(self._entries) if entry is not None}
+        self._filled = max(self._slots.values(), default=-1) + 1
 
-    Raises:
-        ValueError: If no valid SQL query is found in the response.
+    def _save(self):
+        if not self.path or self._vectors is None:
+            return
+        entries_path, _ = self._files()
+        try:
+            self._vectors.flush()
+            tmp_path = entries_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'schema': self.schema_hash, 'embedder': self.embedder.name,
+                           'dimensions': self._vectors.shape[1], 'next': self._next,
+                           'entries': self._entries}, f)
+            os.replace(tmp_path, entries_path)
+        except OSError as e:
+            print(f"Error: could not save question index: {e}")
+
+
+def create_question_index(config):
+    """Build the question index from question_index_config."""
+    if config['embedder'] == 'hashing':
+        embedder = HashingEmbedder(config['dimensions'])
+    elif config['embedder'] == 'ollama':
+        embedder = OllamaEmbedder(config['embedding_model'])
+    else:
+        raise ValueError(f"Unknown question index embedder: {config['embedder']}")
+    return QuestionIndex(TABLE_CONTEXT, embedder, max_entries=config['max_entries'],
+                         reuse_similarity=config['reuse_similarity'],
+                         hint_similarity=config['hint_similarity'], top_k=config['top_k'],
+                         path=config['path'], enabled=config['enabled'])
+
+
+question_index = create_question_index(question_index_config)
+
+
+def new_session_state():
+    """State kept for each dashboard session."""
+    return {
+        'question': "",
+        'last_checked_data': None,
+        'return_this_data': {},
+        'return_data_num': return_data_num,
+    }
+
+
+class MemorySessionStore:
+    """Bounded in-process session store: least recently used sessions are evicted first."""
+
+    def __init__(self, max_sessions=1000, ttl=None):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or (self.ttl and time.time() - entry['touched'] > self.ttl):
+                return new_session_state()
+            self._sessions.move_to_end(session_id)
+            return dict(entry['state'])
+
+    def save(self, session_id, state):
+        with self._lock:
+            self._sessions[session_id] = {'state': dict(state), 'touched': time.time()}
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class FileSessionStore:
+    """
+    Session store backed by one JSON file per session in a local directory,
+    so several worker processes on a host can share sessions. Files idle for
+    longer than ttl, or beyond the newest max_sessions, are swept on save.
     """
-    logging.info(f"Extracting SQL Query from text: {text}")
 
-    # First attempt: Extract SQL within triple backticks
-    code_block_pattern = re.compile(
-        r"```sql\s*([\s\S]*?)\s*```", re.IGNORECASE)
-    match = code_block_pattern.search(text)
-    if match:
-        sql_query = match.group(1).strip()
-        logging.info("SQL query extracted from code block.")
-        return sql_query
+    def __init__(self, path, max_sessions=1000, ttl=None):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        os.makedirs(path, exist_ok=True)
 
-    # Second attempt: Extract SQL directly present in the text
-    # Look for a line starting with SELECT and ending with a semicolon
-    direct_sql_pattern = re.compile(r"(SELECT[\s\S]*?;)", re.IGNORECASE)
-    match = direct_sql_pattern.search(text)
-    if match:
-        sql_query = match.group(1).strip()
-        logging.info("SQL query extracted directly from text.")
-        return sql_query
+    def _file(self, session_id):
+        return os.path.join(self.path, hashlib.sha256(session_id.encode('utf-8')).hexdigest() + ".json")
 
-    # Optional Third Attempt: Handle SQL without a terminating semicolon
-    # This can be useful if the SQL query is the last part of the text without a semicolon
-    direct_sql_no_semicolon_pattern = re.compile(
-        r"(SELECT[\s\S]*)", re.IGNORECASE)
-    match = direct_sql_no_semicolon_pattern.search(text)
-    if match:
-        sql_query = match.group(1).strip()
-        # Additional validation can be performed here
-        if sql_query.endswith(";"):
-            sql_query = sql_query[:-1].strip()
-        logging.info(
-            "SQL query extracted directly from text without semicolon.")
-        return sql_query
+    def load(self, session_id):
+        path = self._file(session_id)
+        try:
+            if self.ttl and time.time() - os.path.getmtime(path) > self.ttl:
+                return new_session_state()
+            with open(path) as f:
+                return dict(new_session_state(), **json.load(f))
+        except (OSError, ValueError):
+            return new_session_state()
 
-    # If all attempts fail, raise an error
-    logging.error("No valid SQL query found in the response.")
-    raise ValueError("No valid SQL query found in the response.")
+    def save(self, session_id, state):
+        path = self._file(session_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, default=str)
+        os.replace(tmp_path, path)
+        self._sweep()
 
+    def _sweep(self):
+        try:
+            files = [os.path.join(self.path, name) for name in os.listdir(self.path)
+                     if name.endswith(".json")]
+            files.sort(key=os.path.getmtime, reverse=True)
+        except OSError:
+            return
+        now = time.time()
+        for index, path in enumerate(files):
+            try:
+                if index >= self.max_sessions or (self.ttl and now - os.path.getmtime(path) > self.ttl):
+                    os.remove(path)
+            except OSError:
+                pass
 
-def ask_question(question):
+    def __len__(self):
+        return len([name for name in os.listdir(self.path) if name.endswith(".json")])
 
-    print("Received POST requestsss", question)
-    if not question:
-        return jsonify({'error': 'No question provided.'}), 400
 
-    sql_query = query_ollama_cli(question)
-    print("sql query", sql_query)
-    sql_query_sanitized = extractSQLQuery(sql_query)
-    print(f"Generated SQL Query: {sql_query_sanitized}")
+class RedisSessionStore:
+    """Session store in Redis (or any Redis-compatible server), shared by every worker."""
 
-    # print(f"Generated SQL Query: {sql_query}")
+    def __init__(self, url, ttl=None, prefix="aiquery:session:"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
 
-    if not sql_query:
-        return jsonify({'error': 'Failed to generate SQL query.'}), 500
+    def load(self, session_id):
+        raw = self.client.get(self.prefix + session_id)
+        if raw is None:
+            return new_session_state()
+        return dict(new_session_state(), **json.loads(raw))
 
-    results, error = execute_sql_query(sql_query_sanitized)
+    def save(self, session_id, state):
+        # Redis evicts idle sessions itself through the key TTL
+        self.client.set(self.prefix + session_id, json.dumps(state, default=str),
+                        ex=int(self.ttl) if self.ttl else None)
 
-    print(f"Results: {results}")
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(self.prefix + "*"))
 
-    if error:
-        new_sql_query = query_ollama_cli_forError(sql_query, error)
-        new_sql_query_sanitized = new_sql_query
-        print(f"Generated SQL Query: {new_sql_query_sanitized}")
-        results, error = execute_sql_query(sql_query_sanitized)
-        return jsonify({'error': f"SQL Execution Error: {error}"}), 500
 
-    return results
+def create_session_store(config):
+    if config['backend'] == 'file':
+        return FileSessionStore(config['path'], max_sessions=config['max_sessions'],
+                                ttl=config['ttl'])
+    if config['backend'] == 'redis':
+        return RedisSessionStore(config['redis_url'], ttl=config['ttl'])
+    return MemorySessionStore(max_sessions=config['max_sessions'], ttl=config['ttl'])
 
-    formatted_data = format_results(results, EXPECTED_COLUMNS)
 
-    # return jsonify({'data': formatted_data}), 200, {'Access-Control-Allow-Origin': '*'}
+session_store = create_session_store(session_config)
 
 
-@app.route('/api/ask-database-set/<string:question>', methods=['GET'])
-def ask_database_set(question):
-    global Question
-    Question = question
+def current_session_id(req):
+    """Dashboards identify themselves with an X-Session-ID header or ?session=."""
+    return req.headers.get('X-Session-ID') or req.args.get('session') or 'default'
 
-    print("Question is asked", question)
-    question = question
-    sql_query_analysed = should_reload()
 
-    if not sql_query_analysed:
-        return jsonify({'error': 'Failed to generate SQL query.'}), 500
+# Histogram buckets: seconds, row counts and token counts
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192)
 
-    return jsonify({'message': f'Query generated: {sql_query_analysed}'}), 200
+# The ID of the request being handled, for the trace lines of every stage
+current_request_id = contextvars.ContextVar('request_id', default='-')
 
+trace_logger = logging.getLogger('aiquery.trace')
+trace_logger.setLevel(logging.INFO)
+if not trace_logger.handlers:
+    trace_logger.addHandler(logging.StreamHandler())
+    trace_logger.propagate = False
 
-@app.route('/api/ask-database/<int:num>', methods=['GET'])
-def ask_database():
-    print("question is asked", )
-    ollama_response = should_reload()
-    print('finally response from ollama', ollama_response)
 
-    return jsonify({'ollama_response': ollama_response}), 200
-# Function to determine if client should reload data
+class Metrics:
+    """
+    Counters and histograms, rendered in the Prometheus text format. The
+    numeric values of components' snapshot() are added as gauges each time
+    the metrics are read, so pool, cache and scheduler counters need no
+    extra bookkeeping.
+    """
 
+    def __init__(self, prefix='aiquery'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = {'buckets': buckets, 'counts': [0] * len(buckets),
+                                                 'sum': 0, 'count': 0}
+            for i, bound in enumerate(entry['buckets']):
+                if value <= bound:
+                    entry['counts'][i] += 1
+                    break
+            entry['sum'] += value
+            entry['count'] += 1
+
+    def collect(self, name, snapshot):
+        """Report the numbers in snapshot() as <prefix>_<name>_<key> gauges."""
+        self._collectors.append((name, snapshot))
+
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+                   for _, value in labels)
+        return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+    def render(self):
+        lines, typed = [], set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, dict(entry, counts=list(entry['counts'])))
+                                for key, entry in self._histograms.items())
+        for (name, labels), value in counters:
+            declare(f"{self.prefix}_{name}", 'counter')
+            lines.append(f"{self.prefix}_{name}{self._format_labels(labels)} {value}")
+        for (name, labels), entry in histograms:
+            full_name = f"{self.prefix}_{name}"
+            declare(full_name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(entry['buckets'], entry['counts']):
+                cumulative += count
+                lines.append(f"{full_name}_bucket{self._format_labels(labels + (('le', bound),))} "
+                             f"{cumulative}")
+            lines.append(f"{full_name}_bucket{self._format_labels(labels + (('le', '+Inf'),))} "
+                         f"{entry['count']}")
+            lines.append(f"{full_name}_sum{self._format_labels(labels)} {entry['sum']}")
+            lines.append(f"{full_name}_count{self._format_labels(labels)} {entry['count']}")
+
+        for component, snapshot in self._collectors:
+            try:
+                values = snapshot()
+            except Exception as e:
+                print(f"Metrics for {component} failed: {e}")
+                continue
+            for key, value in values.items():
+                # One level of nesting, e.g. prompt tokens per kind of prompt
+                entries = value.items() if isinstance(value, dict) else [(None, value)]
+                for label, number in entries:
+                    if isinstance(number, bool):
+                        number = int(number)
+                    if not isinstance(number, (int, float)):
+                        continue
+                    if label is None:
+                        name, labels = f"{self.prefix}_{component}_{key}", ()
+                    else:
+                        name, labels = f"{self.prefix}_{component}_{label}", (('key', key),)
+                    name = re.sub(r"\W", "_", name)
+                    declare(name, 'gauge')
+                    lines.append(f"{name}{self._format_labels(labels)} {number}")
+        return "\n".join(lines) + "\n"
 
-@app.route('/api/should-reload', methods=['GET'])
-def should_reload():
-    print("Question from should reload", Question)
-    global last_checked_data
-    connection = get_db_connection()
-    if connection is None:
-        return jsonify({'error': 'Failed to connect to the database'}), 500
 
-    cursor = connection.cursor(dictionary=True)
+metrics = Metrics()
+
+
+@contextmanager
+def trace(stage, **labels):
+    """
+    Time one pipeline stage. The duration goes to the stage_seconds
+    histogram, labelled with stage and labels, and one JSON line with the
+    request ID is logged. Anything the caller adds to the yielded dict
+    (rows, tokens, ...) is logged with it.
+    """
+    span = dict(labels)
+    status = 'ok'
+    started = time.perf_counter()
     try:
-        # Get the latest transaction
-        cursor.execute("SELECT * FROM transactions ORDER BY ID DESC LIMIT 1")
-        latest_record = cursor.fetchone()
+        yield span
+    except Exception:
+        status = 'error'
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        metrics.observe('stage_seconds', seconds, stage=stage, status=status, **labels)
+        if tracing_config['log_stages']:
+            trace_logger.info(json.dumps(
+                dict(span, request_id=current_request_id.get(), stage=stage, status=status,
+                     ms=round(seconds * 1000, 1)), default=str))
 
-        # Get the total number of records
-        cursor.execute("SELECT COUNT(*) AS count FROM transactions")
-        total_records = cursor.fetchone()
-        count = total_records['count']
 
-        cursor.close()
-        connection.close()
+def count_llm_tokens(task, prompt, response=None, chunks=0):
+    """
+    Record the prompt and completion tokens of one Ollama call, using
+    Ollama's counts when the response has them (a finished call) and
+    otherwise the prompt estimate and the number of streamed chunks.
+    """
+    response = response or {}
+    prompt_tokens = response.get('prompt_eval_count') or estimate_tokens(prompt)
+    completion_tokens = response.get('eval_count') or chunks
+    metrics.observe('llm_prompt_tokens', prompt_tokens, buckets=TOKEN_BUCKETS, task=task)
+    metrics.observe('llm_completion_tokens', completion_tokens, buckets=TOKEN_BUCKETS, task=task)
+    return prompt_tokens, completion_tokens
 
-        if last_checked_data != count:
-            last_checked_data = count
 
-            # Prepare a question for Ollama
+class TracedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with jsonify() timed as the serialize stage."""
 
-            # Query Ollama
-            ollama_response = ask_question(Question)
-            print('ollama response', ollama_response)
+    def response(self, *args, **kwargs):
+        with trace('serialize'):
+            return super().response(*args, **kwargs)
 
-            reload_decision = True
-            if Question.lower().startswith("give me"):
-                global return_this_data
-                return_this_data = ollama_response
-            else:
-                ollama_humanize = query_ollama_cli_humanize(
-                    ollama_response, Question
-                )
-                return ollama_humanize
 
-        return jsonify({'reload': False}), 200, {'Access-Control-Allow-Origin': '*'}
+app.json = TracedJSONProvider(app)
 
-    except Error as e:
-        print(f"Error: {e}")
-        return jsonify({'error': 'Database query failed'}), 500
 
+class SlowRequestProfiler:
+    """
+    A sampling profiler for slow requests. Each request registers its
+    thread; once one has run for `threshold` seconds a background thread
+    samples its stack every `interval` seconds, so fast requests are never
+    sampled. When the request ends the samples are written to
+    <directory>/<request id>.folded as collapsed stacks
+    ("outer;inner;leaf count", as read by flamegraph.pl and speedscope).
+    """
+
+    def __init__(self, threshold, interval=0.01, directory='profiles', enabled=False):
+        self.threshold = threshold
+        self.interval = interval
+        self.directory = directory
+        self.enabled = enabled
+        self._active = {}  # thread ident -> request being handled on it
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {'slow_requests': 0, 'samples': 0, 'profiles_written': 0}
 
-# API to fetch the last N records
-@app.route('/api/last-10-records', methods=['GET'])
-def get_last_10_records():
-    return jsonify(return_this_data)
+    def start(self, request_id):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._active[threading.get_ident()] = {
+                'request_id': request_id, 'started': time.monotonic(), 'samples': {}}
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='slow-request-profiler',
+                                                daemon=True)
+                self._thread.start()
+
+    def finish(self, seconds):
+        """Stop tracking this thread's request. Returns the profile written, if any."""
+        with self._lock:
+            entry = self._active.pop(threading.get_ident(), None)
+            if seconds >= self.threshold:
+                self.stats['slow_requests'] += 1
+        if seconds >= self.threshold:
+            metrics.inc('slow_requests_total')
+        if not entry or not entry['samples']:
+            return None
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{entry['request_id']}.folded")
+        with open(path, 'w') as f:
+            for stack, count in sorted(entry['samples'].items(), key=lambda item: -item[1]):
+                f.write(f"{stack} {count}\n")
+        with self._lock:
+            self.stats['profiles_written'] += 1
+        print(f"Slow request {entry['request_id']} took {seconds:.1f}s, profile in {path}")
+        return path
+
+    @staticmethod
+    def _collapse(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            with self._lock:
+                due = [ident for ident, entry in self._active.items()
+                       if now - entry['started'] >= self.threshold]
+            if not due:
+                continue
+            frames = sys._current_frames()
+            stacks = {ident: self._collapse(frames[ident]) for ident in due if ident in frames}
+            with self._lock:
+                for ident, stack in stacks.items():
+                    entry = self._active.get(ident)
+                    if entry is not None:
+                        entry['samples'][stack] = entry['samples'].get(stack, 0) + 1
+                        self.stats['samples'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, enabled=self.enabled, active=len(self._active),
+                        threshold=self.threshold)
+
+
+slow_request_profiler = SlowRequestProfiler(
+    tracing_config['slow_request_seconds'], interval=tracing_config['profile_interval'],
+    directory=tracing_config['profile_dir'], enabled=tracing_config['profile_slow_requests'])
+
+# Push streams stay open for minutes by design; they're not slow requests
+UNPROFILED_ENDPOINTS = {'changes', 'changes_poll'}
+
+
+@app.before_request
+def start_request_trace():
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+    g.request_started = time.perf_counter()
+    current_request_id.set(g.request_id)
+    if request.endpoint not in UNPROFILED_ENDPOINTS:
+        slow_request_profiler.start(g.request_id)
+
+
+@app.after_request
+def tag_request_trace(response):
+    response.headers['X-Request-ID'] = g.get('request_id', '-')
+    metrics.inc('requests_total', endpoint=request.endpoint, status=response.status_code)
+    return response
+
+
+# Runs once the response is sent, after the last chunk of a streamed one
+@app.teardown_request
+def finish_request_trace(error=None):
+    if 'request_started' not in g:
+        return
+    seconds = time.perf_counter() - g.request_started
+    metrics.observe('request_seconds', seconds, endpoint=request.endpoint)
+    slow_request_profiler.finish(seconds)
+    current_request_id.set('-')
+
+
+def estimate_tokens(text):
+    """Rough token count for a prompt (about four characters per token)."""
+    return max(1, round(len(text) / 4))
+
+
+def render_compact_schema(schema):
+    """
+    Render a TABLE_CONTEXT-style description as one line per column, a
+    fraction of the tokens of the original markdown.
+    """
+    columns = re.findall(r"^- `(\w+)` \(\*\*(.+?)\*\*\)[ \t]*\n[ \t]*- (.+?)\s*$",
+                         schema, re.MULTILINE)
+    lines = [f"  {name} {kind.replace(',', '')} -- {description.replace('`', '')}"
+             for name, kind, description in columns]
+    return "Table transactions (MySQL 8.0):\n" + "\n".join(lines)
+
+
+COMPACT_SCHEMA = render_compact_schema(TABLE_CONTEXT)
+
+# Shared by the SQL and repair prompts so both start with the same tokens,
+# which Ollama can reuse while the model stays loaded (keep_alive)
+SQL_PROMPT_PREFIX = (
+    f"{COMPACT_SCHEMA}\n\n"
+    "Rules:\n"
+    "- Use only the columns above.\n"
+    "- Queries must work in ONLY_FULL_GROUP_BY mode: every non-aggregated selected column goes in GROUP BY.\n"
+    "- Do NOT put TotalAmount in GROUP BY when using aggregate functions.\n"
+    "- Filter dates with Timestamp BETWEEN 'YYYY-MM-DD' AND 'YYYY-MM-DD'.\n"
+    "- Reply with only the SQL query, enclosed in triple backticks (```sql ... ```).\n\n"
+)
+
+
+class PromptStats:
+    """Counts the estimated prompt tokens sent to the model, per kind of prompt."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def record(self, kind, prompt):
+        tokens = estimate_tokens(prompt)
+        with self._lock:
+            entry = self.stats.setdefault(kind, {'calls': 0, 'tokens': 0, 'max_tokens': 0})
+            entry['calls'] += 1
+            entry['tokens'] += tokens
+            entry['max_tokens'] = max(entry['max_tokens'], tokens)
+            entry['last_tokens'] = tokens
+        print(f"Prompt {kind}: ~{tokens} tokens")
+        return prompt
+
+    def snapshot(self):
+        with self._lock:
+            return {kind: dict(entry, avg_tokens=entry['tokens'] / entry['calls'])
+                    for kind, entry in self.stats.items()}
+
+
+prompt_stats = PromptStats()
+
+
+def compact_db_response(db_response, max_tokens):
+    """
+    Render a DB response as compact JSON for a prompt. Lists that don't fit
+    in max_tokens keep as many whole leading rows as fit, followed by a note
+    of how many were left out.
+    """
+    text = json.dumps(db_response, default=str, separators=(',', ':'))
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if not isinstance(db_response, list):
+        return text[:max_tokens * 4] + "..."
+
+    kept, used = [], 0
+    for row in db_response:
+        row_text = json.dumps(row, default=str, separators=(',', ':'))
+        # Leave room for the note below
+        if used + estimate_tokens(row_text) > max_tokens - 20:
+            break
+        kept.append(row_text)
+        used += estimate_tokens(row_text)
+    return (f"[{','.join(kept)}]\n"
+            f"({len(db_response) - len(kept)} more rows not shown, {len(db_response)} in total)")
+
+
+def build_humanize_prompt(question, db_response):
+    """Build the prompt asking the model for a short answer from a DB response."""
+    rows = compact_db_response(db_response, prompt_config['db_response_tokens'])
+    return prompt_stats.record('humanize', (
+        "You are a chatbot AI that generates extremely short answers based ONLY on the database response.\n"
+        "Strictly follow these rules:\n"
+        "1. The answer must be under 15 words.\n"
+        "2. Use only the exact numbers from the database response.\n"
+        "3. Do not add explanations, introductions, or extra details.\n"
+        "4. Enclose your final answer between <<< and >>>.\n"
+        "\n"
+        "Example Format:\n"
+        "  - Correct: <<< The total sales is $687.77 >>>\n\n"
+        f"User's question: {question}\n\n"
+        f"Database response: {rows}\n\n"
+        "### Answer (strictly follow the format and length constraints):"
+    ))
+
+
+def finalize_humanized_response(humanized_response, db_response):
+    """Force a model answer into the `<<< ... >>>` format, at most 15 words long."""
+    # 1) If the response doesn't contain <<< >>>, enforce it
+    if "<<<" not in humanized_response or ">>>" not in humanized_response:
+        # Extract up to 15 words
+        words = humanized_response.split()
+        short_response = " ".join(words[:15])
+        humanized_response = f"<<< {short_response} >>>"
+
+    # 2) Ensure the final answer is under 15 words even if AI ignores instructions
+    #    We'll parse out only the text between <<< and >>>, then truncate if needed.
+    match = re.search(r'<<<(.*?)>>>', humanized_response, re.DOTALL)
+    if match:
+        # Get the text inside <<< >>>
+        inner_text = match.group(1).strip()
+        words = inner_text.split()
+        if len(words) > 15:
+            inner_text = " ".join(words[:15])  # Truncate to 15 words
+        humanized_response = f"<<< {inner_text} >>>"
+    else:
+        # If for some reason there's no match, wrap forcibly
+        words = humanized_response.split()
+        short_response = " ".join(words[:15])
+        humanized_response = f"<<< {short_response} >>>"
+
+    # 3) Handle "not specified"/"no data" in case AI tries to generate a negative statement
+    if "not specified" in humanized_response.lower() or "no data" in humanized_response.lower():
+        # Provide a default if the DB has a numeric field named CombinedTotal
+        if db_response and isinstance(db_response, list) and "CombinedTotal" in db_response[0]:
+            amount = float(db_response[0]["CombinedTotal"])
+            humanized_response = f"<<< The combined total sales amount is ${amount:.2f} >>>"
+        else:
+            humanized_response = "<<< Sorry, not enough data to form a short answer >>>"
+
+    return humanized_response
+
+
+# Words of a result column's label (e.g. AVG(UnitPrice) -> average unit
+# price) that decide how the local humanizer formats it. Counts are plain
+# numbers whatever else they mention (NumSales, SalesCount, SUM(Quantity));
+# money is formatted as dollars; ratios, ranks and changes go to the LLM
+COUNT_WORDS = {'count', 'cnt', 'num', 'number', 'qty', 'quantity', 'quantities'}
+CURRENCY_WORDS = {'amount', 'amounts', 'sales', 'revenue', 'price', 'prices',
+                  'spend', 'spending', 'cost', 'costs'}
+UNCLEAR_WORDS = {'percent', 'percentage', 'pct', 'ratio', 'share', 'rate', 'rank',
+                 'growth', 'change'}
+
+# Result columns that name a group even when their values are numbers
+DIMENSION_COLUMN = re.compile(r"^(?:year|month|week|day|date|hour|\w*id)$", re.IGNORECASE)
+
+AGGREGATE_LABELS = {'SUM': 'total', 'AVG': 'average', 'MIN': 'minimum', 'MAX': 'maximum'}
+
+
+class LocalHumanizer:
+    """
+    Writes the short `<<< ... >>>` answer for scalar, single-row and small
+    grouped results without calling the LLM, formatting money and counts
+    from the column names. Other shapes, and measures whose unit the names
+    don't make clear, return None and go to the model.
+    """
+
+    def __init__(self, max_words=15, max_rows=100):
+        self.max_words = max_words
+        self.max_rows = max_rows
+        self.stats = {'local': 0, 'llm': 0}
+
+    @staticmethod
+    def label(column):
+        """Readable name for a result column, e.g. AVG(UnitPrice) -> average unit price."""
+        call = re.match(r"^(\w+)\s*\((.*)\)$", column.strip())
+        if call:
+            function, argument = call.group(1).upper(), call.group(2).strip("` ")
+            if function == 'COUNT':
+                return 'number of transactions'
+            prefix = AGGREGATE_LABELS.get(function, function.lower())
+            label = LocalHumanizer.label(argument)
+            return label if label.startswith(prefix) else f"{prefix} {label}"
+        words = re.sub(r"(?<=[a-z0-9])(?=[A-Z])|_", " ", column).split()
+        return " ".join(word if word.isupper() and len(word) > 1 else word.lower()
+                        for word in words)
+
+    @staticmethod
+    def is_number(value):
+        return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+    @classmethod
+    def unit(cls, column):
+        """'number' or 'money' for a measure column, or None when its name is unclear."""
+        if re.search(r"[-+/%]|\*(?!\s*\))", column):
+            # Arithmetic over several columns, e.g. SUM(TotalAmount)/SUM(Quantity)
+            return None
+        words = set(cls.label(column).lower().split())
+        if words & UNCLEAR_WORDS:
+            return None
+        if words & COUNT_WORDS or not words & CURRENCY_WORDS:
+            return 'number'
+        return 'money'
+
+    @classmethod
+    def format_value(cls, column, value):
+        if not cls.is_number(value):
+            return str(value)
+        if cls.unit(column) == 'money':
+            sign = "-" if value < 0 else ""
+            return f"{sign}${abs(value):,.2f}"
+        if value == int(value):
+            return f"{int(value):,}"
+        return f"{value:,.2f}"
+
+    def answer(self, db_response):
+        """Return the finished answer, or None when the model should write it."""
+        text = self._describe(db_response)
+        if text is None or len(text.split()) > self.max_words:
+            self.stats['llm'] += 1
+            return None
+        self.stats['local'] += 1
+        return f"<<< {text[0].upper()}{text[1:]} >>>"
+
+    def _describe(self, rows):
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            return None
+        if not rows:
+            return "No matching transactions were found"
+        if len(rows) > self.max_rows:
+            return None
+
+        columns = list(rows[0])
+        measures = [c for c in columns if not DIMENSION_COLUMN.match(c)
+                    and all(self.is_number(row[c]) or row[c] is None for row in rows)]
+        dimensions = [c for c in columns if c not in measures]
+        if not measures or len(dimensions) > 1:
+            return None
+        if any(self.unit(c) is None for c in measures):
+            return None
+
+        if len(rows) == 1:
+            row = rows[0]
+            if all(row[c] is None for c in measures):
+                return "No matching transactions were found"
+            where = f" for {row[dimensions[0]]}" if dimensions else ""
+            parts = [f"{self.label(c)}{where} is {self.format_value(c, row[c])}"
+                     for c in measures]
+            return "the " + ", and the ".join(parts)
+
+        if len(measures) != 1 or not dimensions:
+            return None
+        measure, dimension = measures[0], dimensions[0]
+        ranked = [row for row in rows if row[measure] is not None]
+        if not ranked:
+            return "No matching transactions were found"
+
+        listing = ", ".join(f"{row[dimension]} {self.format_value(measure, row[measure])}"
+                            for row in ranked)
+        text = f"{self.label(measure)}: {listing}"
+        if len(text.split()) <= self.max_words:
+            return text
+
+        top = max(ranked, key=lambda row: row[measure])
+        bottom = min(ranked, key=lambda row: row[measure])
+        return (f"highest {self.label(measure)}: {top[dimension]} "
+                f"{self.format_value(measure, top[measure])}; lowest: {bottom[dimension]} "
+                f"{self.format_value(measure, bottom[measure])}, across {len(ranked)} rows")
+
+    def snapshot(self):
+        total = self.stats['local'] + self.stats['llm']
+        return dict(self.stats, local_rate=self.stats['local'] / total if total else 0.0)
+
+
+local_humanizer = LocalHumanizer(**humanizer_config)
+
+
+def build_sql_prompt(question, examples=()):
+    """
+    Build the prompt asking the model to translate a question into SQL.
+    examples are (question, sql) pairs that worked for similar questions;
+    they follow the fixed instructions so the prompt prefix stays cacheable.
+    """
+    shots = "".join(f"Question: {example}\n```sql\n{sql}\n```\n\n" for example, sql in examples)
+    if shots:
+        shots = f"Queries that answered similar questions:\n\n{shots}"
+    return prompt_stats.record('sql', (
+        f"{SQL_PROMPT_PREFIX}"
+        "You are an SQL Jedi so make no mistakes. Convert the following question into a "
+        "valid MySQL query that retrieves the required data from the transactions table.\n\n"
+        f"{shots}"
+        f"User's Question: {question}\n"
+    ))
+
+
+def build_repair_prompt(old_sql, error_message):
+    """Build the prompt asking the model to fix SQL that failed with an error."""
+    return prompt_stats.record('repair', (
+        f"{SQL_PROMPT_PREFIX}"
+        "The following SQL query resulted in an error. Provide a corrected SQL query "
+        "that resolves it, without explanations, headers, or comments.\n\n"
+        f"SQL Query:\n{old_sql}\n\n"
+        f"Error Message:\n{error_message}\n"
+    ))
+
+
+SQL_CODE_BLOCK = re.compile(r"```sql\s*([\s\S]*?)\s*```", re.IGNORECASE)
+THINK_BLOCK = re.compile(r"<think>[\s\S]*?(?:</think>|$)")
+
+
+class SQLStreamExtractor:
+    """
+    Incrementally scans streamed model output for the first complete
+    ```sql ... ``` block after any <think> reasoning, so generation can be
+    stopped as soon as it closes.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.sql = None
+        self._scan_from = 0
+
+    def feed(self, chunk):
+        """Add a chunk of output; returns the SQL once a block has closed."""
+        if self.sql is not None:
+            return self.sql
+        self.text += chunk
+        if self.text.lstrip().startswith("<think>") and self._scan_from == 0:
+            # Drafts inside the reasoning are not the model's answer
+            think_end = self.text.find("</think>")
+            if think_end == -1:
+                return None
+            self._scan_from = think_end + len("</think>")
+        match = SQL_CODE_BLOCK.search(self.text, self._scan_from)
+        if match:
+            self.sql = match.group(1).strip()
+            return self.sql
+        # Resume from an unclosed opening fence, or just before the tail in
+        # case a fence is split across chunks
+        open_at = self.text.lower().find("```sql", self._scan_from)
+        self._scan_from = open_at if open_at != -1 else max(self._scan_from, len(self.text) - 6)
+        return None
+
+    def finish(self):
+        """Return the SQL from the full output when no block closed early."""
+        if self.sql is not None:
+            return self.sql
+        try:
+            return extractSQLQuery(THINK_BLOCK.sub("", self.text))
+        except ValueError:
+            return extractSQLQuery(self.text)
+
+
+class AnswerStreamFilter:
+    """Turns streamed model output into the visible text, hiding <think> reasoning."""
+
+    def __init__(self):
+        self.text = ""
+        self._emitted = 0
+
+    def feed(self, chunk):
+        """Add a chunk of output; returns the newly visible text, if any."""
+        self.text += chunk
+        visible = THINK_BLOCK.sub("", self.text)
+        # Hold back a partially received "<think>" tag
+        for keep in range(len("<think>") - 1, 0, -1):
+            if visible.endswith("<think>"[:keep]):
+                visible = visible[:-keep]
+                break
+        # Drop the blank lines the model leaves after its reasoning
+        visible = visible.lstrip()
+        delta = visible[self._emitted:]
+        self._emitted = max(self._emitted, len(visible))
+        return delta
+
+    @property
+    def complete(self):
+        """True once a full <<< ... >>> answer is visible, so the rest can be skipped."""
+        visible = THINK_BLOCK.sub("", self.text)
+        start = visible.find("<<<")
+        return start != -1 and visible.find(">>>", start + 3) != -1
+
+
+# Scheduling priorities for LLM calls: questions a user is waiting on go
+# ahead of refreshes triggered by new rows
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class LLMScheduler:
+    """
+    Sits in front of every Ollama call. At most max_concurrency calls run at
+    once; waiting calls are admitted by priority, then in arrival order.
+    Identical calls that are already queued or running are merged
+    (single-flight): the followers wait for the leader's result instead of
+    asking the model again. Threads and coroutines (the async server) share
+    the same slots, queue and in-flight calls.
+    """
+
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max_concurrency
+        self._active = 0
+        self._waiting = []  # heap of [priority, sequence] tickets
+        self._sequence = itertools.count()
+        self._in_flight = {}  # key -> _Flight
+        self._lock = threading.Condition()
+        self._wakeups = []  # (loop, future) of coroutines waiting for a slot
+        self.stats = {'calls': 0, 'deduplicated': 0, 'promoted': 0,
+                      'max_queue_depth': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+
+    def _notify(self):
+        """Wake every waiting thread and coroutine. Call with the lock held."""
+        self._lock.notify_all()
+        for loop, future in self._wakeups:
+            loop.call_soon_threadsafe(_resolve, future)
+        self._wakeups.clear()
+
+    def _enqueue(self, ticket):
+        heapq.heappush(self._waiting, ticket)
+        self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], len(self._waiting))
+
+    def _admit(self, ticket, queued):
+        """Take a slot for ticket if it is next in line and one is free. Call with the lock held."""
+        if self._active >= self.max_concurrency or self._waiting[0] is not ticket:
+            return False
+        heapq.heappop(self._waiting)
+        self._active += 1
+        waited = time.monotonic() - queued
+        self.stats['calls'] += 1
+        self.stats['wait_seconds'] += waited
+        self.stats['max_wait_seconds'] = max(self.stats['max_wait_seconds'], waited)
+        # The next ticket may fit in a slot that is still free
+        self._notify()
+        return True
+
+    def _acquire(self, ticket):
+        queued = time.monotonic()
+        with self._lock:
+            self._enqueue(ticket)
+            while not self._admit(ticket, queued):
+                self._lock.wait()
+
+    async def _acquire_async(self, ticket):
+        loop = asyncio.get_running_loop()
+        queued = time.monotonic()
+        with self._lock:
+            self._enqueue(ticket)
+        try:
+            while True:
+                with self._lock:
+                    if self._admit(ticket, queued):
+                        return
+                    wakeup = loop.create_future()
+                    self._wakeups.append((loop, wakeup))
+                await wakeup
+        except asyncio.CancelledError:
+            # Timed out in the queue: step aside so the tickets behind can go
+            with self._lock:
+                self._waiting = [t for t in self._waiting if t is not ticket]
+                heapq.heapify(self._waiting)
+                self._notify()
+            raise
+
+    def _release(self):
+        with self._lock:
+            self._active -= 1
+            self._notify()
+
+    @contextmanager
+    def slot(self, priority=INTERACTIVE):
+        """Hold one model slot, e.g. for a streamed response that can't be shared."""
+        self._acquire([priority, next(self._sequence)])
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def acquire_async(self, priority=INTERACTIVE):
+        """Wait for a model slot from a coroutine; give it back with release()."""
+        await self._acquire_async([priority, next(self._sequence)])
+
+    def release(self):
+        """Give back a slot taken with acquire_async()."""
+        self._release()
+
+    def _join(self, key, priority):
+        """Return (flight, leader) for a call under key. Call with the lock held."""
+        flight = self._in_flight.get(key)
+        if flight is None:
+            flight = self._in_flight[key] = _Flight([priority, next(self._sequence)])
+            return flight, True
+        self.stats['deduplicated'] += 1
+        if priority < flight.ticket[0] and any(t is flight.ticket for t in self._waiting):
+            # A user is now waiting on a queued background call
+            flight.ticket[0] = priority
+            heapq.heapify(self._waiting)
+            self.stats['promoted'] += 1
+            self._notify()
+        return flight, False
+
+    def _land(self, key, flight):
+        with self._lock:
+            del self._in_flight[key]
+        flight.finish()
+
+    def run(self, key, func, priority=INTERACTIVE):
+        """
+        Return func() run in a model slot, or the result of the identical
+        call already in flight under key.
+        """
+        with self._lock:
+            flight, leader = self._join(key, priority)
+
+        if not leader:
+            flight.done.wait()
+            return flight.outcome()
+
+        try:
+            self._acquire(flight.ticket)
+            try:
+                flight.result = func()
+            finally:
+                self._release()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            self._land(key, flight)
+        return flight.result
+
+    async def run_async(self, key, func, priority=INTERACTIVE):
+        """
+        Coroutine counterpart of run(): return await func() run in a model
+        slot, or the result of the identical call already in flight under key.
+        """
+        with self._lock:
+            flight, leader = self._join(key, priority)
+
+        if not leader:
+            await flight.wait_async()
+            return flight.outcome()
+
+        try:
+            await self._acquire_async(flight.ticket)
+            try:
+                flight.result = await func()
+            finally:
+                self._release()
+        except Exception as e:
+            flight.error = e
+            raise
+        except asyncio.CancelledError:
+            # The leader timed out; its followers must not wait forever
+            flight.error = TimeoutError("The identical call this one was merged with was cancelled")
+            raise
+        finally:
+            self._land(key, flight)
+        return flight.result
+
+    def snapshot(self):
+        with self._lock:
+            calls = self.stats['calls']
+            return dict(self.stats, active=self._active, queue_depth=len(self._waiting),
+                        in_flight=len(self._in_flight),
+                        avg_wait_seconds=self.stats['wait_seconds'] / calls if calls else 0.0)
+
+
+class _Flight:
+    """One scheduled call and the result its followers are waiting for."""
+
+    def __init__(self, ticket):
+        self.ticket = ticket
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self._lock = threading.Lock()
+        self._waiters = []  # (loop, future) of coroutines waiting for the result
+
+    def finish(self):
+        with self._lock:
+            self.done.set()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    async def wait_async(self):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self.done.is_set():
+                return
+            self._waiters.append((loop, future))
+        await future
+
+    def outcome(self):
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+llm_scheduler = LLMScheduler(llm_scheduler_config['max_concurrency'])
+
+
+class ModelRouter:
+    """
+    Picks the Ollama model for each task (sql, repair, humanize). A call
+    that waited longer than queue_budget for a model slot uses the task's
+    smaller fallback model, so a backed-up queue drains faster. Models
+    Ollama doesn't have are replaced by the default model.
+
+    Counts calls and fallbacks per task, and how often each model's output
+    was good: SQL that ran without repair, a repair that ran, an answer in
+    the <<< >>> format. Latency per task and model is in the llm stage of
+    /metrics.
+    """
+
+    def __init__(self, models, fallbacks=None, queue_budget=None, preload=True, pin=False):
+        self.models = dict(models)
+        self.fallbacks = dict(fallbacks or {})
+        self.queue_budget = queue_budget
+        self.preload_models = preload
+        self.pin = pin
+        self.loaded = set()
+        self.unavailable = set()
+        self._outputs = OrderedDict()  # (task, output) -> model, until judged
+        self._lock = threading.Lock()
+        self.task_stats = {}   # task -> {'calls', 'fallbacks', 'good', 'bad'}
+        self.model_stats = {}  # model -> {'calls', 'good', 'bad'}
+
+    @property
+    def default_model(self):
+        return self.models['default']
+
+    @property
+    def keep_alive(self):
+        return -1 if self.pin else prompt_config['keep_alive']
+
+    def _count(self, task, model, counter):
+        task_stats = self.task_stats.setdefault(
+            task, {'calls': 0, 'fallbacks': 0, 'good': 0, 'bad': 0})
+        model_stats = self.model_stats.setdefault(model, {'calls': 0, 'good': 0, 'bad': 0})
+        task_stats[counter] += 1
+        if counter in model_stats:
+            model_stats[counter] += 1
+
+    def choose(self, task, waited=0.0):
+        """The model for a task's call that waited `waited` seconds for its slot."""
+        model = self.models.get(task, self.default_model)
+        fallback = self.fallbacks.get(task)
+        fell_back = (fallback is not None and self.queue_budget is not None
+                     and waited > self.queue_budget and fallback not in self.unavailable)
+        if fell_back:
+            model = fallback
+        if model in self.unavailable:
+            model = self.default_model
+        with self._lock:
+            self._count(task, model, 'calls')
+            if fell_back:
+                self._count(task, model, 'fallbacks')
+        return model
+
+    def failed(self, model, error):
+        """Stop routing to a model Ollama reported missing."""
+        if (isinstance(error, ResponseError) and error.status_code == 404
+                and model != self.default_model):
+            print(f"Model {model} is not available, using {self.default_model}")
+            with self._lock:
+                self.unavailable.add(model)
+                self.loaded.discard(model)
+
+    def judge(self, task, model, good):
+        with self._lock:
+            self._count(task, model, 'good' if good else 'bad')
+
+    def produced(self, task, output, model):
+        """Remember which model wrote output, for outcome() once it has been tried."""
+        with self._lock:
+            self._outputs[(task, output)] = model
+            while len(self._outputs) > 256:
+                self._outputs.popitem(last=False)
+
+    def outcome(self, task, output, good):
+        """Judge the model that produced output; outputs not from a model are ignored."""
+        with self._lock:
+            model = self._outputs.pop((task, output), None)
+        if model is not None:
+            self.judge(task, model, good)
+
+    def preload(self):
+        """Load every configured model on a background thread, for keep_alive."""
+        if not self.preload_models:
+            return
+        models = list(dict.fromkeys([self.default_model, *self.models.values(),
+                                     *self.fallbacks.values()]))
+
+        def load():
+            for model in models:
+                try:
+                    # A chat without messages only loads the model
+                    chat(model=model, messages=[], keep_alive=self.keep_alive)
+                except Exception as e:
+                    print(f"Error: could not preload {model}: {e}")
+                    self.failed(model, e)
+                    continue
+                with self._lock:
+                    self.loaded.add(model)
+                print(f"Model {model} loaded")
+
+        threading.Thread(target=load, name='model-preload', daemon=True).start()
+
+    def snapshot(self):
+        with self._lock:
+            models = {model: dict(stats, loaded=model in self.loaded)
+                      for model, stats in self.model_stats.items()}
+            for model in self.loaded | self.unavailable:
+                models.setdefault(model, {'calls': 0, 'good': 0, 'bad': 0,
+                                          'loaded': model in self.loaded})
+            return {
+                'tasks': {task: dict(stats) for task, stats in self.task_stats.items()},
+                'models': models,
+                'routes': dict(self.models),
+                'fallbacks': dict(self.fallbacks),
+                'queue_budget': self.queue_budget,
+                'pinned': self.pin,
+                'unavailable': sorted(self.unavailable)
+            }
+
+
+model_router = ModelRouter(**model_config)
+
+
+def chat_reply(prompt, priority=INTERACTIVE, task='chat'):
+    """
+    Return (model, content) of a (scheduled, deduplicated) Ollama chat
+    response from the model the router picks for task.
+    """
+    requested = time.monotonic()
+
+    def call():
+        model = model_router.choose(task, time.monotonic() - requested)
+        try:
+            with trace('llm', task=task, model=model) as span:
+                response = chat(model=model, messages=[{'role': 'user', 'content': prompt}],
+                                keep_alive=model_router.keep_alive)
+                span['prompt_tokens'], span['completion_tokens'] = count_llm_tokens(
+                    task, prompt, response)
+        except Exception as e:
+            model_router.failed(model, e)
+            raise
+        return model, response['message']['content']
+
+    return llm_scheduler.run(('chat', task, prompt), call, priority)
+
+
+def chat_content(prompt, priority=INTERACTIVE, task='chat'):
+    """Return the content of a (scheduled, deduplicated) Ollama chat response."""
+    return chat_reply(prompt, priority, task)[1]
+
+
+def stream_chat(prompt, priority=INTERACTIVE, task='chat', judge=None):
+    """
+    Yield the content of a streamed Ollama chat response chunk by chunk,
+    holding a scheduler slot until the stream is closed. judge(text), if
+    given, says whether the complete output was good, for the router.
+    """
+    requested = time.monotonic()
+    with llm_scheduler.slot(priority):
+        model = model_router.choose(task, time.monotonic() - requested)
+        with trace('llm', task=task, model=model) as span:
+            stream = chat(model=model, messages=[{'role': 'user', 'content': prompt}],
+                          stream=True, keep_alive=model_router.keep_alive)
+            chunks, last, text = 0, None, []
+            try:
+                for part in stream:
+                    chunks, last = chunks + 1, part
+                    text.append(part['message']['content'])
+                    yield part['message']['content']
+            except Exception as e:
+                model_router.failed(model, e)
+                raise
+            finally:
+                # Closing the HTTP stream makes Ollama stop generating
+                stream.close()
+                span['prompt_tokens'], span['completion_tokens'] = count_llm_tokens(
+                    task, prompt, last if last is not None and last.get('done') else None,
+                    chunks)
+            if judge is not None:
+                model_router.judge(task, model, judge("".join(text)))
+
+
+def well_formed_answer(text):
+    """Whether a humanize reply used the <<< >>> answer format."""
+    return "<<<" in text and ">>>" in text
+
+
+# Function to query Ollama
+def query_ollama_cli_humanize(question, db_response, priority=INTERACTIVE):
+    """
+    Generates a concise, human-readable summary from the database response, 
+    returning the final answer between <<< and >>>.
+    """
+
+    with trace('humanize') as span:
+        # Scalar and small grouped results don't need the model
+        local_answer = local_humanizer.answer(db_response)
+        span['source'] = 'local' if local_answer else 'llm'
+        if local_answer:
+            return local_answer
+
+        try:
+            prompt = build_humanize_prompt(question, db_response)
+
+            model, humanized_response = chat_reply(prompt, priority=priority, task='humanize')
+            model_router.judge('humanize', model, well_formed_answer(humanized_response))
+            humanized_response = humanized_response.strip()
+
+            humanized_response = finalize_humanized_response(
+                humanized_response, db_response)
+
+            return humanized_response
+
+        except Exception as e:
+            print(f"Error: {e}")
+            return "<<< Sorry, I couldn't process the data into a human-readable format. >>>"
+
+    """Takes the database response and generates a human-readable summary using the question for context."""
+    try:
+        prompt = (
+            f"You are an AI assistant that converts database query results into easy-to-understand answers.\n\n"
+            f"User asked: {question}\n\n"
+            f"Database returned the following JSON data:\n{db_response}\n\n"
+            f"Please analyze the response and provide a clear, human-readable summary.\n"
+            f"Keep it concise and informative. Do not include any SQL-related details."
+        )
+
+        response = chat(model='deepseek-r1:8b', messages=[
+            {'role': 'user', 'content': prompt},
+        ])
+
+        humanized_response = response['message']['content'].strip()
+        return humanized_response
+    except Exception as e:
+        print(f"Error: {e}")
+        return "Sorry, I couldn't process the data into a human-readable format."
+
+
+def query_ollama_cli(question, priority=INTERACTIVE, examples=()):
+    """
+    Query Ollama to generate a MySQL-compliant SQL query, optionally shown
+    the SQL of similar past questions.
+
+    The response is streamed and generation is cancelled as soon as a
+    complete ```sql ... ``` block has been received. Dashboards asking the
+    same question at the same time share one generation.
+    """
+    try:
+        prompt = build_sql_prompt(question, examples)
+
+        requested = time.monotonic()
+
+        def generate():
+            extractor = SQLStreamExtractor()
+            model = model_router.choose('sql', time.monotonic() - requested)
+            with trace('llm', task='sql', model=model) as span:
+                stream = chat(model=model,
+                              messages=[{'role': 'user', 'content': prompt}], stream=True,
+                              keep_alive=model_router.keep_alive)
+                chunks = 0
+                try:
+                    for part in stream:
+                        chunks += 1
+                        if extractor.feed(part['message']['content']):
+                            break
+                except Exception as e:
+                    model_router.failed(model, e)
+                    raise
+                finally:
+                    # Closing the HTTP stream makes Ollama stop generating
+                    stream.close()
+                    span['prompt_tokens'], span['completion_tokens'] = count_llm_tokens(
+                        'sql', prompt, part if chunks and part.get('done') else None, chunks)
+            sql_query = extractor.finish()
+            if sql_query:
+                model_router.produced('sql', sql_query, model)
+            return sql_query
+
+        sql_query = llm_scheduler.run(('sql', prompt), generate, priority)
+        return sql_query
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+
+
+def query_ollama_cli_forError(old_sql, error_message, priority=INTERACTIVE):
+    """Query Ollama to fix the SQL query based on an error message."""
+    try:
+        prompt = build_repair_prompt(old_sql, error_message)
+
+        model, content = chat_reply(prompt, priority=priority, task='repair')
+        sql_query = extractSQLQuery(content)
+        if sql_query:
+            model_router.produced('repair', sql_query, model)
+        return sql_query
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+
+# Function to execute SQL query
+
+
+class MySQLBackend:
+    """Runs queries on the MySQL server, through the connection pool."""
+
+    name = 'mysql'
+
+    def __init__(self, lag_seconds=10, startup_wait=30):
+        self.lag_seconds = lag_seconds
+        self.startup_wait = startup_wait
+        self._seen = deque(maxlen=1000)  # (server time, max ID), oldest first
+        self._committed = None
+        self._trx_visible = True
+        self._lock = threading.Lock()
+
+    def execute(self, sql_query):
+        """Execute the SQL query and return (results, error)."""
+        index_advisor.record(sql_query)
+        try:
+            with db_pool.connection() as connection:
+                cursor = connection.cursor(dictionary=True)
+                try:
+                    cursor.execute(sql_query)
+                    results = cursor.fetchall()
+                finally:
+                    cursor.close()
+
+            return results, None
+        except Error as e:
+            print(f"Database error: {e}")
+            return None, str(e)
+
+    def validate(self, sql_query):
+        """Check that the query compiles (EXPLAIN) without running it. Returns an error or None."""
+        try:
+            with db_pool.connection() as connection:
+                cursor = connection.cursor()
+                try:
+                    cursor.execute(f"EXPLAIN {sql_query}")
+                    cursor.fetchall()
+                finally:
+                    cursor.close()
+            return None
+        except Error as e:
+            print(f"Database error: {e}")
+            return str(e)
+
+    def iter_chunks(self, sql_query, chunk_size):
+        """
+        Yield the query's rows as lists of up to chunk_size dicts, read with an
+        unbuffered cursor so only one chunk is held in memory at a time.
+        """
+        connection = db_pool.acquire()
+        finished = False
+        try:
+            cursor = connection.cursor(dictionary=True, buffered=False)
+            cursor.execute(sql_query)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+            cursor.close()
+            finished = True
+        finally:
+            if finished:
+                db_pool.release(connection)
+            else:
+                # Unread rows are still on the wire; drop the connection rather than drain it
+                db_pool.discard(connection)
+
+    def _observe(self):
+        """
+        Read the max ID and record it. Returns the time before which a
+        recorded max ID is final: when the oldest open write transaction
+        started, or lag_seconds ago if open transactions can't be seen.
+        """
+        with db_pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SELECT MAX(ID), NOW(6) FROM transactions")
+                max_id, now = cursor.fetchone()
+                oldest = None
+                if self._trx_visible:
+                    try:
+                        cursor.execute("SELECT MIN(trx_started) FROM information_schema.innodb_trx "
+                                       "WHERE trx_rows_modified > 0")
+                        (oldest,) = cursor.fetchone()
+                    except Error as e:
+                        print(f"Can't see open transactions, lagging {self.lag_seconds}s "
+                              f"behind MAX(ID) instead: {e}")
+                        self._trx_visible = False
+            finally:
+                cursor.close()
+
+        with self._lock:
+            self._seen.append((now, max_id or 0))
+        if not self._trx_visible:
+            return now - timedelta(seconds=self.lag_seconds)
+        # trx_started has whole seconds, so comparing with it errs on the safe side
+        return oldest if oldest is not None else now + timedelta(microseconds=1)
+
+    def _final(self, cutoff):
+        """The newest recorded max ID read before cutoff, or the last one returned."""
+        with self._lock:
+            while self._seen and self._seen[0][0] < cutoff:
+                self._committed = max(self._committed or 0, self._seen.popleft()[1])
+            return self._committed
+
+    def high_water(self):
+        """
+        Return the max ID up to which the rows of transactions are final. IDs
+        only grow, so a new max ID means new rows; MAX on the primary key is
+        an index lookup, not a scan.
+
+        Rows become visible in commit order, not ID order, and the result
+        cache, the rollup and the Parquet copy fold rows in by ID range, so
+        a row that commits below a max ID they already used would be missed
+        for good. A max ID is therefore only used once every write
+        transaction open when it was read has ended (visibility_config).
+        """
+        committed = self._final(self._observe())
+        deadline = time.monotonic() + self.startup_wait
+        while committed is None:
+            # No max ID is final yet: wait for the writers open at startup
+            if time.monotonic() > deadline:
+                print("Open write transactions outlasted startup_wait; using MAX(ID) as is")
+                with self._lock:
+                    committed = self._committed = self._seen[-1][1]
+                break
+            time.sleep(0.1)
+            committed = self._final(self._observe())
+        return committed
+
+    def snapshot(self):
+        return {'backend': self.name, 'high_water': self._committed,
+                'sees_open_transactions': self._trx_visible}
+
+
+# MySQL DATE_FORMAT specifiers that strftime spells differently
+MYSQL_DATE_SPECIFIERS = {
+    '%i': '%M', '%s': '%S', '%M': '%B', '%W': '%A', '%e': '%-d', '%c': '%-m',
+    '%k': '%-H', '%h': '%I', '%l': '%-I', '%T': '%H:%M:%S', '%r': '%I:%M:%S %p',
+    '%u': '%W', '%v': '%V', '%x': '%G', '%f': '%f',
+}
+
+# MySQL functions DuckDB lacks or defines differently, as argument list -> DuckDB SQL
+DUCKDB_FUNCTIONS = {
+    'DATE': lambda args: f"CAST({args[0]} AS DATE)",
+    'DATE_FORMAT': lambda args: f"strftime({args[0]}, {duckdb_date_format(args[1])})",
+    'DATE_SUB': lambda args: f"(CAST({args[0]} AS TIMESTAMP) - {args[1]})",
+    'DATE_ADD': lambda args: f"(CAST({args[0]} AS TIMESTAMP) + {args[1]})",
+    'CURDATE': lambda args: "current_date",
+    'DAYOFWEEK': lambda args: f"(extract(dow FROM {args[0]}) + 1)",
+    'WEEKDAY': lambda args: f"(isodow({args[0]}) - 1)",
+    'UNIX_TIMESTAMP': lambda args: f"epoch({args[0] if args else 'now()'})",
+    'FROM_UNIXTIME': lambda args: f"to_timestamp({args[0]})",
+}
+
+
+def duckdb_date_format(argument):
+    """Translate a MySQL DATE_FORMAT format literal to strftime."""
+    if not re.fullmatch(r"'[^']*'", argument.strip()):
+        return argument
+    return re.sub(r"%.", lambda m: MYSQL_DATE_SPECIFIERS.get(m.group(0), m.group(0)),
+                  argument.strip())
+
+
+def split_arguments(text):
+    """Split a function's argument list on top-level commas, ignoring quoted ones."""
+    masked = mask_sql_literals(text)
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(masked):
+        depth += {"(": 1, ")": -1}.get(char, 0)
+        if char == "," and depth == 0:
+            parts.append(text[start:i].strip())
+            start = i + 1
+    parts.append(text[start:].strip())
+    return [part for part in parts if part]
+
+
+def mysql_column_names(sql_query):
+    """
+    The column names MySQL gives a query's results: each select item's
+    alias, a column's own name, or the expression as written. None when the
+    select list has a * or can't be found.
+    """
+    masked = mask_sql_literals(sql_query)
+    select = re.match(r"\s*SELECT\s+(?:(?:ALL|DISTINCT|DISTINCTROW)\s+)?", masked, re.IGNORECASE)
+    if not select:
+        return None
+    depth, end = 0, len(masked)
+    for token in re.compile(r"[()]|\bFROM\b", re.IGNORECASE).finditer(masked, select.end()):
+        if token.group(0) == "(":
+            depth += 1
+        elif token.group(0) == ")":
+            depth -= 1
+        elif depth == 0:
+            end = token.start()
+            break
+
+    names = []
+    for item in split_arguments(sql_query[select.end():end]):
+        masked_item = mask_sql_literals(item)
+        if re.search(r"(?:^|\.)\s*\*$", masked_item):
+            return None
+        alias = re.match(r"^(.*?[\w)'\"`])\s+(AS\s+)?(`[^`]*`|\"[^\"]*\"|'[^']*'|[A-Za-z_]\w*)$",
+                         masked_item, re.IGNORECASE | re.DOTALL)
+        if alias and (alias.group(2) or alias.group(3).upper() not in SQL_WORDS):
+            names.append(item[alias.start(3):alias.end(3)].strip("`\"'"))
+        elif re.fullmatch(r"(?:`[^`]*`|\w+)(?:\.(?:`[^`]*`|\w+))*", item):
+            names.append(item.rsplit(".", 1)[-1].strip("`"))
+        else:
+            names.append(item)
+    return names
+
+
+def translate_mysql_to_duckdb(sql_query):
+    """
+    Adapt a MySQL SELECT to DuckDB: quoting (backtick identifiers, double
+    quoted and backslash-escaped strings), MySQL-only functions, casts,
+    DIV and LIMIT offset, count. Optimizer hints are dropped.
+    """
+    def literal(match):
+        text = match.group(0)
+        if text.startswith("`"):
+            return '"' + text[1:-1].replace('"', '""') + '"'
+        body = re.sub(r"\\(.)", lambda m: {'n': "\n", 't': "\t", '0': ""}.get(m.group(1), m.group(1)),
+                      text[1:-1])
+        if text.startswith("'"):
+            body = body.replace("''", "'")
+        return "'" + body.replace("'", "''") + "'"
+
+    sql_query = re.sub(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`|/\*\+[\s\S]*?\*/",
+                       lambda m: "" if m.group(0).startswith("/*") else literal(m), sql_query)
+
+    # Rewrite the last call first: nothing inside it is left to rewrite
+    calls = re.compile(r"\b(" + "|".join(DUCKDB_FUNCTIONS) + r")\s*\(", re.IGNORECASE)
+    while True:
+        masked = mask_sql_literals(sql_query)
+        call = None
+        for call in calls.finditer(masked):
+            pass
+        if call is None:
+            break
+        depth = 0
+        for end in range(call.end() - 1, len(masked)):
+            depth += {"(": 1, ")": -1}.get(masked[end], 0)
+            if depth == 0:
+                break
+        else:
+            break  # unbalanced; let DuckDB report it
+        arguments = split_arguments(sql_query[call.end():end])
+        replacement = DUCKDB_FUNCTIONS[call.group(1).upper()](arguments)
+        sql_query = sql_query[:call.start()] + replacement + sql_query[end + 1:]
+
+    masked = mask_sql_literals(sql_query)
+    edits = []
+    for match in re.finditer(r"\bAS\s+(SIGNED|UNSIGNED)(?:\s+INTEGER)?\b|\bAS\s+CHAR\b(?!\s*\()|\bDIV\b",
+                             masked, re.IGNORECASE):
+        word = (match.group(1) or match.group(0)).upper()
+        edits.append((match.span(), {'SIGNED': "AS BIGINT", 'UNSIGNED': "AS UBIGINT",
+                                     'DIV': "//"}.get(word, "AS VARCHAR")))
+    limit = TRAILING_LIMIT.search(masked.rstrip().rstrip(";"))
+    if limit and limit.group(2):
+        edits.append((limit.span(), f"LIMIT {limit.group(2)} OFFSET {limit.group(1)}"))
+    for (start, end), replacement in sorted(edits, reverse=True):
+        sql_query = sql_query[:start] + replacement + sql_query[end:]
+    return sql_query
+
+
+class DuckDBBackend:
+    """
+    Runs queries in process with DuckDB over a columnar copy of transactions
+    kept as Parquet files, so scans and GROUP BY read only the columns they
+    use. MySQL SQL is translated to DuckDB's dialect before it runs.
+
+    The table only grows, so the copy is kept current by copying the rows
+    with IDs above the last one copied, one file per ID range, named
+    part-<first ID>-<last ID>.parquet. A live feed adds many small files;
+    once there are more than max_files the newest small ones are merged.
+    Files a merge replaced are deleted a minute later, when no query that
+    started before the merge can still be reading them.
+    """
+
+    name = 'duckdb'
+    COLUMNS = ['ID', 'Timestamp', 'ProductID', 'Quantity', 'UnitPrice', 'TotalAmount',
+               'State', 'Latitude', 'Longitude']
+    FILE_PATTERN = re.compile(r"^part-(\d+)-(\d+)\.parquet$")
+    RETIRE_SECONDS = 60
+
+    def __init__(self, parquet_dir, sync_batch_ids=1000000, max_files=64, sync_from_mysql=True,
+                 fetch_rows=100000):
+        import duckdb
+        import pyarrow.parquet as pq
+        self._duckdb = duckdb
+        self._pq = pq
+        self.parquet_dir = parquet_dir
+        self.sync_batch_ids = sync_batch_ids
+        self.max_files = max_files
+        self.sync_from_mysql = sync_from_mysql
+        self.fetch_rows = fetch_rows
+        self.source = MySQLBackend(**visibility_config)
+        self._schema = pa.schema([
+            ('ID', pa.int64()), ('Timestamp', pa.timestamp('us')), ('ProductID', pa.string()),
+            ('Quantity', pa.int64()), ('UnitPrice', pa.float64()), ('TotalAmount', pa.float64()),
+            ('State', pa.string()), ('Latitude', pa.float64()), ('Longitude', pa.float64())])
+        # In memory: the data itself stays in the Parquet files
+        self._db = duckdb.connect()
+        self._lock = threading.Lock()
+        self._retired = {}  # path -> time a merge replaced it
+        self._view_files = []
+        self.stats = {'queries': 0, 'errors': 0, 'syncs': 0, 'rows_synced': 0,
+                      'files_written': 0, 'merges': 0, 'sync_errors': 0}
+
+        os.makedirs(parquet_dir, exist_ok=True)
+        self._purge(force=True)
+        files = self._files()
+        self._high_water = files[-1][1] if files else 0
+        self._refresh_view()
+
+    def _scan(self):
+        found = []
+        for name in os.listdir(self.parquet_dir):
+            match = self.FILE_PATTERN.match(name)
+            if match:
+                found.append((int(match.group(1)), int(match.group(2)),
+                              os.path.join(self.parquet_dir, name)))
+        return sorted(found, key=lambda file: (file[0], -file[1]))
+
+    def _files(self):
+        """(first ID, last ID, path) of the current files, skipping those a merged file replaced."""
+        files = []
+        for file in self._scan():
+            if not files or file[1] > files[-1][1]:
+                files.append(file)
+        return files
+
+    def _purge(self, force=False):
+        current = {path for _, _, path in self._files()}
+        now = time.monotonic()
+        for _, _, path in self._scan():
+            if path in current:
+                continue
+            retired = self._retired.setdefault(path, now)
+            if force or now - retired > self.RETIRE_SECONDS:
+                os.remove(path)
+                del self._retired[path]
+
+    @staticmethod
+    def _file_list(paths):
+        return "[" + ", ".join("'" + path.replace("'", "''") + "'" for path in paths) + "]"
+
+    def _refresh_view(self):
+        files = [path for _, _, path in self._files()]
+        if files and files != self._view_files:
+            self._db.execute("CREATE OR REPLACE VIEW transactions AS "
+                             f"SELECT * FROM read_parquet({self._file_list(files)})")
+        self._view_files = files
+
+    def _copy(self, low_id, high_id):
+        """Write the rows with low_id < ID <= high_id to a new file."""
+        path = os.path.join(self.parquet_dir, f"part-{low_id + 1:012d}-{high_id:012d}.parquet")
+        written, writer = 0, None
+        with db_pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(f"SELECT {', '.join(self.COLUMNS)} FROM transactions "
+                               "WHERE ID > %s AND ID <= %s ORDER BY ID", (low_id, high_id))
+                while True:
+                    rows = cursor.fetchmany(self.fetch_rows)
+                    if not rows:
+                        break
+                    if writer is None:
+                        writer = self._pq.ParquetWriter(path + ".tmp", self._schema)
+                    arrays = [pa.array(column, type=field.type)
+                              for column, field in zip(zip(*rows), self._schema)]
+                    writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+                    written += len(rows)
+            finally:
+                if writer is not None:
+                    writer.close()
+                cursor.close()
+        if written:
+            os.replace(path + ".tmp", path)
+            self.stats['files_written'] += 1
+            self.stats['rows_synced'] += written
+
+    def _merge_small_files(self):
+        files = self._files()
+        if len(files) <= self.max_files:
+            return
+        run = []
+        for file in reversed(files):
+            if file[1] - file[0] + 1 >= self.sync_batch_ids:
+                break
+            run.insert(0, file)
+        if len(run) < 2:
+            return
+        merged = os.path.join(self.parquet_dir, f"part-{run[0][0]:012d}-{run[-1][1]:012d}.parquet")
+        self._db.execute(f"COPY (SELECT * FROM read_parquet({self._file_list([f[2] for f in run])}) "
+                         f"ORDER BY ID) TO '{merged}.tmp' (FORMAT PARQUET)")
+        os.replace(merged + ".tmp", merged)
+        self.stats['merges'] += 1
+
+    def sync(self):
+        """
+        Copy new rows from MySQL into Parquet, or without MySQL pick up files
+        written by DataGenerator. Returns the max ID the copy is complete up to.
+        """
+        with self._lock:
+            if self.sync_from_mysql:
+                try:
+                    target = self.source.high_water()
+                    while self._high_water < target:
+                        upper = min(target, self._high_water + self.sync_batch_ids)
+                        self._copy(self._high_water, upper)
+                        self._high_water = upper
+                        self.stats['syncs'] += 1
+                except Error as e:
+                    self.stats['sync_errors'] += 1
+                    print(f"Parquet sync failed, serving rows up to ID {self._high_water}: {e}")
+            self._merge_small_files()
+            self._refresh_view()
+            self._purge()
+            if not self.sync_from_mysql and self._view_files:
+                self._high_water = self._files()[-1][1]
+            return self._high_water
+
+    def high_water(self):
+        return self.sync()
+
+    @staticmethod
+    def _columns(sql_query, cursor):
+        """The result's column names, as MySQL would give them (DuckDB spells expressions its own way)."""
+        columns = [column[0] for column in cursor.description]
+        names = mysql_column_names(sql_query)
+        return names if names is not None and len(names) == len(columns) else columns
+
+    def execute(self, sql_query):
+        """Execute the (MySQL) SQL query on the Parquet copy and return (results, error)."""
+        self.sync()
+        if not self._view_files:
+            return None, f"No transactions have been copied to {self.parquet_dir} yet."
+        cursor = self._db.cursor()
+        try:
+            cursor.execute(translate_mysql_to_duckdb(sql_query))
+            columns = self._columns(sql_query, cursor)
+            results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        except self._duckdb.Error as e:
+            self.stats['errors'] += 1
+            print(f"DuckDB error: {e}")
+            return None, str(e)
+        finally:
+            cursor.close()
+        self.stats['queries'] += 1
+        return results, None
+
+    def validate(self, sql_query):
+        """Check that the query compiles (EXPLAIN) without running it. Returns an error or None."""
+        self.sync()
+        if not self._view_files:
+            return f"No transactions have been copied to {self.parquet_dir} yet."
+        cursor = self._db.cursor()
+        try:
+            cursor.execute(f"EXPLAIN {translate_mysql_to_duckdb(sql_query)}")
+            cursor.fetchall()
+            return None
+        except self._duckdb.Error as e:
+            print(f"DuckDB error: {e}")
+            return str(e)
+        finally:
+            cursor.close()
+
+    def iter_chunks(self, sql_query, chunk_size):
+        """
+        Yield the query's rows as lists of up to chunk_size dicts. Errors are
+        raised as mysql.connector Errors, like the MySQL backend's.
+        """
+        self.sync()
+        if not self._view_files:
+            raise Error(msg=f"No transactions have been copied to {self.parquet_dir} yet.")
+        cursor = self._db.cursor()
+        try:
+            try:
+                cursor.execute(translate_mysql_to_duckdb(sql_query))
+                columns = self._columns(sql_query, cursor)
+            except self._duckdb.Error as e:
+                self.stats['errors'] += 1
+                raise Error(msg=str(e)) from e
+            self.stats['queries'] += 1
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield [dict(zip(columns, row)) for row in rows]
+        finally:
+            cursor.close()
+
+    def snapshot(self):
+        return dict(self.stats, backend=self.name, high_water=self._high_water,
+                    files=len(self._view_files), parquet_dir=self.parquet_dir,
+                    sync_from_mysql=self.sync_from_mysql)
+
+
+def create_execution_backend(config):
+    if config['backend'] == 'duckdb':
+        return DuckDBBackend(config['parquet_dir'], sync_batch_ids=config['sync_batch_ids'],
+                             max_files=config['max_files'],
+                             sync_from_mysql=config['sync_from_mysql'])
+    return MySQLBackend(**visibility_config)
+
+
+execution_backend = create_execution_backend(execution_config)
+
+
+def execute_sql_query(sql_query):
+    """Execute the SQL query on the configured backend and return the results."""
+    with trace('db_query', backend=execution_backend.name) as span:
+        results, error = execution_backend.execute(sql_query)
+        span['rows'] = len(results) if results is not None else None
+    if results is not None:
+        metrics.observe('rows_returned', len(results), buckets=ROW_BUCKETS,
+                        backend=execution_backend.name)
+    return results, error
+
+
+def get_high_water():
+    """Return the max ID of transactions the configured backend can query."""
+    return execution_backend.high_water()
+
+
+# Aggregates that can be merged from a delta of new rows without a full re-scan
+MERGEABLE_AGGREGATES = {
+    'SUM': lambda old, new: new if old is None else (old if new is None else old + new),
+    'COUNT': lambda old, new: (old or 0) + (new or 0),
+    'MIN': lambda old, new: new if old is None else (old if new is None else min(old, new)),
+    'MAX': lambda old, new: new if old is None else (old if new is None else max(old, new)),
+}
+
+AGGREGATE_QUERY_PATTERN = re.compile(
+    r"^\s*SELECT\s+(?:(?P<hint>/\*\+.*?\*/)\s*)?(?P<select>.+?)\s+FROM\s+`?transactions`?"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?"
+    r"\s+GROUP\s+BY\s+(?P<group>.+?)"
+    r"(?:\s+ORDER\s+BY\s+(?P<order>.+?))?"
+    r"(?:\s+LIMIT\s+(?P<limit>\d+))?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL)
+
+# Anything that makes a query depend on more than the rows it aggregates
+NON_INCREMENTAL_TOKENS = re.compile(
+    r"\b(HAVING|JOIN|DISTINCT|UNION|OVER|AVG|NOW|CURDATE|CURTIME|SYSDATE|"
+    r"CURRENT_DATE|CURRENT_TIME|CURRENT_TIMESTAMP|UNIX_TIMESTAMP|RAND)\b",
+    re.IGNORECASE)
+
+IDENTIFIER = r"`?([A-Za-z_][A-Za-z0-9_]*)`?"
+
+# Columns with a small, known set of values. The incremental path fetches
+# and keeps every group, without the query's LIMIT, so it only groups on these
+INCREMENTAL_GROUP_COLUMNS = {'state', 'productid'}
+
+
+def split_top_level(text, separator=","):
+    """Split on a separator, ignoring separators nested inside parentheses."""
+    parts, depth, current = [], 0, []
+    for char in text:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == separator and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    parts.append("".join(current).strip())
+    return [part for part in parts if part]
+
+
+def parse_incremental_aggregate(sql_query):
+    """
+    Recognise append-only aggregate queries over `transactions`, such as
+    `SELECT State, SUM(TotalAmount) FROM transactions GROUP BY State`, that
+    only group on INCREMENTAL_GROUP_COLUMNS.
+
+    Returns a plan describing the select list, grouping, ordering and limit,
+    or None when the query cannot be maintained incrementally.
+    """
+    match = AGGREGATE_QUERY_PATTERN.match(sql_query)
+    if not match or NON_INCREMENTAL_TOKENS.search(sql_query):
+        return None
+    if len(re.findall(r"\bSELECT\b", sql_query, re.IGNORECASE)) != 1:
+        return None
+
+    columns = []
+    for item in split_top_level(match.group('select')):
+        aggregate = re.match(
+            r"^(SUM|COUNT|MIN|MAX)\s*\((.+)\)(?:\s+(?:AS\s+)?" + IDENTIFIER + r")?$",
+            item, re.IGNORECASE | re.DOTALL)
+        plain = re.match(
+            r"^" + IDENTIFIER + r"(?:\s+(?:AS\s+)?" + IDENTIFIER + r")?$", item, re.IGNORECASE)
+        if aggregate:
+            columns.append({'aggregate': aggregate.group(1).upper(),
+                            'names': {item, aggregate.group(3) or item}})
+        elif plain:
+            columns.append({'aggregate': None, 'column': plain.group(1),
+                            'names': {plain.group(1), plain.group(2) or plain.group(1)}})
+        else:
+            return None
+
+    group_columns = []
+    for item in split_top_level(match.group('group')):
+        plain = re.match(r"^" + IDENTIFIER + r"$", item)
+        if not plain:
+            return None
+        group_columns.append(plain.group(1))
+
+    # Every plain column must be grouped on, or groups could not be merged
+    plain_columns = [c for c in columns if c['aggregate'] is None]
+    for column in plain_columns:
+        if not column['names'] & set(group_columns):
+            return None
+    if len(plain_columns) != len(group_columns):
+        return None
+    for column in plain_columns:
+        if column['column'].lower() not in INCREMENTAL_GROUP_COLUMNS:
+            return None
+
+    order = []
+    for item in split_top_level(match.group('order') or ""):
+        term = re.match(r"^(.+?)(?:\s+(ASC|DESC))?$", item, re.IGNORECASE | re.DOTALL)
+        name = term.group(1).strip().strip("`")
+        positions = [i for i, c in enumerate(columns) if name in c['names']]
+        if not positions:
+            return None
+        order.append((positions[0], (term.group(2) or "ASC").upper() == "DESC"))
+
+    return {
+        'columns': columns,
+        'hint': match.group('hint'),
+        'select': match.group('select'),
+        'where': match.group('where'),
+        'group': match.group('group'),
+        'order': order,
+        'limit': int(match.group('limit')) if match.group('limit') else None,
+    }
+
+
+def build_range_query(plan, low_id, high_id):
+    """Build the unordered, unlimited aggregate query over low_id < ID <= high_id."""
+    conditions = [f"ID <= {int(high_id)}"]
+    if low_id is not None:
+        conditions.append(f"ID > {int(low_id)}")
+    if plan['where']:
+        conditions.insert(0, f"({plan['where']})")
+    hint = f"{plan['hint']} " if plan['hint'] else ""
+    return (f"SELECT {hint}{plan['select']} FROM transactions "
+            f"WHERE {' AND '.join(conditions)} GROUP BY {plan['group']}")
+
+
+# Measures kept in the rollup (as sums) and the dimensions it is grouped by
+ROLLUP_MEASURES = ('TotalAmount', 'Quantity', 'UnitPrice')
+ROLLUP_DIMENSIONS = ('Day', 'State', 'ProductID')
+
+ROLLUP_QUERY_PATTERN = re.compile(
+    r"^\s*SELECT\s+(?P<select>.+?)\s+FROM\s+`?transactions`?"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?"
+    r"(?:\s+GROUP\s+BY\s+(?P<group>.+?))?"
+    r"(?:\s+ORDER\s+BY\s+(?P<order>.+?))?"
+    r"(?:\s+LIMIT\s+(?P<limit>\d+(?:\s*,\s*\d+|\s+OFFSET\s+\d+)?))?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL)
+
+ROLLUP_AGGREGATE = re.compile(r"\b(SUM|AVG|COUNT)\s*\(\s*(\*|1|`?\w+`?)\s*\)", re.IGNORECASE)
+
+# Aggregates, clauses and other constructs the rollup can't answer exactly
+ROLLUP_BLOCKERS = re.compile(
+    r"\b(?:SUM|AVG|COUNT|MIN|MAX|STD\w*|VAR\w*|GROUP_CONCAT|BIT_\w+|JSON_\w*AGG)\s*\(|"
+    r"\b(?:HAVING|DISTINCT|OVER|WITH|ROLLUP|JOIN|UNION)\b|\*", re.IGNORECASE)
+
+# Functions of Timestamp that only depend on its date
+DAY_FUNCTION = re.compile(
+    r"\b(DATE|YEAR|MONTH|DAY|DAYOFMONTH|DAYOFWEEK|DAYOFYEAR|WEEK|WEEKDAY|QUARTER|"
+    r"MONTHNAME|DAYNAME|LAST_DAY|YEARWEEK|TO_DAYS)\s*\(\s*`?Timestamp`?\s*\)", re.IGNORECASE)
+DAY_DATE_FORMAT = re.compile(
+    r"\bDATE_FORMAT\s*\(\s*`?Timestamp`?\s*,\s*'([^'%]*(?:%[YyMmbcDdejUuVvWwXxa%][^'%]*)*)'\s*\)",
+    re.IGNORECASE)
+
+# Timestamp ranges that start and end on day boundaries
+DAY_BETWEEN = re.compile(
+    r"`?\bTimestamp`?\s+BETWEEN\s+'(\d{4}-\d{2}-\d{2})(?: 00:00:00)?'\s+AND\s+"
+    r"'(\d{4}-\d{2}-\d{2}) 23:59:59'", re.IGNORECASE)
+DAY_COMPARISON = re.compile(
+    r"`?\bTimestamp`?\s*(>=|<=|<|>)\s*'(\d{4}-\d{2}-\d{2})(?: (00:00:00|23:59:59))?'",
+    re.IGNORECASE)
+
+
+class RollupStore:
+    """
+    Keeps a pre-aggregated copy of transactions, one row per day x State x
+    ProductID with the sums of TotalAmount, Quantity and UnitPrice and the
+    transaction count. The table only grows, so new ID ranges are folded in
+    as they arrive; a row in rollup_state records how far it has got and is
+    locked while folding, so several workers never fold the same rows twice.
+
+    rewrite() turns aggregate SQL over transactions that only filters and
+    groups by day, State and ProductID into the same query over the rollup,
+    whose size grows with days rather than rows.
+    """
+
+    def __init__(self, table, batch_ids, enabled=True):
+        self.table = table
+        self.batch_ids = batch_ids
+        self.enabled = enabled
+        self.high_water = None
+        self._ready = False
+        self._lock = threading.Lock()
+        self.stats = {'rewritten': 0, 'not_eligible': 0, 'refreshes': 0, 'batches': 0,
+                      'ids_folded': 0, 'errors': 0}
+        self._fold_sql = f"""
+            INSERT INTO {table} (Day, State, ProductID, TotalAmount, Quantity, UnitPrice, TransactionCount)
+            SELECT * FROM (
+                SELECT DATE(Timestamp) AS NewDay, State AS NewState, ProductID AS NewProductID,
+                       SUM(TotalAmount) AS NewTotalAmount, SUM(Quantity) AS NewQuantity,
+                       SUM(UnitPrice) AS NewUnitPrice, COUNT(*) AS NewCount
+                FROM transactions
+                WHERE ID > %s AND ID <= %s
+                GROUP BY DATE(Timestamp), State, ProductID
+            ) AS delta
+            ON DUPLICATE KEY UPDATE
+                TotalAmount = TotalAmount + delta.NewTotalAmount,
+                Quantity = Quantity + delta.NewQuantity,
+                UnitPrice = UnitPrice + delta.NewUnitPrice,
+                TransactionCount = TransactionCount + delta.NewCount"""
+
+    def ensure(self):
+        """Create the rollup tables on first use. Returns False when rollups can't be used."""
+        if self._ready or not self.enabled:
+            return self._ready
+        try:
+            with db_pool.connection() as connection:
+                cursor = connection.cursor()
+                try:
+                    cursor.execute(f"""
+                        CREATE TABLE IF NOT EXISTS {self.table} (
+                            Day DATE NOT NULL,
+                            State VARCHAR(255) NOT NULL,
+                            ProductID VARCHAR(255) NOT NULL,
+                            TotalAmount DOUBLE NOT NULL,
+                            Quantity BIGINT NOT NULL,
+                            UnitPrice DOUBLE NOT NULL,
+                            TransactionCount BIGINT NOT NULL,
+                            PRIMARY KEY (Day, State, ProductID)
+                        )""")
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS rollup_state (
+                            name VARCHAR(64) PRIMARY KEY,
+                            high_water BIGINT NOT NULL
+                        )""")
+                    cursor.execute("INSERT IGNORE INTO rollup_state (name, high_water) VALUES (%s, 0)",
+                                   (self.table,))
+                    connection.commit()
+                finally:
+                    cursor.close()
+        except Error as e:
+            self.stats['errors'] += 1
+            print(f"Rollup setup failed: {e}")
+            return False
+        self._ready = True
+        return True
+
+    def refresh(self, high_water):
+        """
+        Fold the rows with IDs up to high_water into the rollup. Returns the
+        ID the rollup is complete up to, or None when it can't be used.
+        """
+        if not self.ensure():
+            return None
+        if self.high_water is not None and self.high_water >= high_water:
+            return self.high_water
+
+        with self._lock:
+            try:
+                with db_pool.connection() as connection:
+                    cursor = connection.cursor()
+                    try:
+                        while True:
+                            cursor.execute(
+                                "SELECT high_water FROM rollup_state WHERE name = %s FOR UPDATE",
+                                (self.table,))
+                            (done,) = cursor.fetchone()
+                            if done >= high_water:
+                                connection.commit()
+                                break
+                            upper = min(high_water, done + self.batch_ids)
+                            cursor.execute(self._fold_sql, (done, upper))
+                            cursor.execute("UPDATE rollup_state SET high_water = %s WHERE name = %s",
+                                           (upper, self.table))
+                            connection.commit()
+                            self.stats['batches'] += 1
+                            self.stats['ids_folded'] += upper - done
+                    finally:
+                        cursor.close()
+            except Error as e:
+                self.stats['errors'] += 1
+                print(f"Rollup refresh failed: {e}")
+                return None
+            self.stats['refreshes'] += 1
+            self.high_water = done
+            return done
+
+    @staticmethod
+    def _to_days(text, aggregates):
+        """Point aggregates and day-granular uses of Timestamp at rollup columns."""
+        def aggregate(match):
+            function, argument = match.group(1).upper(), match.group(2).strip("`")
+            measure = next((m for m in ROLLUP_MEASURES if m.lower() == argument.lower()), None)
+            if function == 'COUNT' and argument.upper() in ('*', '1', 'ID'):
+                expression = "CAST(SUM(TransactionCount) AS SIGNED)"
+            elif measure and function == 'SUM':
+                expression = f"SUM({measure})"
+            elif measure and function == 'AVG':
+                expression = f"SUM({measure}) / SUM(TransactionCount)"
+            else:
+                return match.group(0)
+            aggregates.append(expression)
+            return f"__rollup{len(aggregates) - 1}__"
+
+        def comparison(match):
+            operator, day, time_of_day = match.groups()
+            starts_day = time_of_day in (None, '00:00:00')
+            if (operator in ('>=', '<') and starts_day) or \
+                    (operator in ('>', '<=') and time_of_day == '23:59:59'):
+                return f"Day {operator} '{day}'"
+            return match.group(0)
+
+        text = ROLLUP_AGGREGATE.sub(aggregate, text)
+        text = DAY_FUNCTION.sub(lambda m: f"{m.group(1)}(Day)", text)
+        text = DAY_DATE_FORMAT.sub(lambda m: f"DATE_FORMAT(Day, '{m.group(1)}')", text)
+        text = DAY_BETWEEN.sub(lambda m: f"Day BETWEEN '{m.group(1)}' AND '{m.group(2)}'", text)
+        return DAY_COMPARISON.sub(comparison, text)
+
+    @staticmethod
+    def _names(text):
+        """Column names a clause refers to (not functions, keywords or new aliases)."""
+        tokens = re.findall(r"[A-Za-z_][\w$]*|\S", mask_sql_literals(text))
+        names = set()
+        for i, token in enumerate(tokens):
+            after = tokens[i + 1] if i + 1 < len(tokens) else ""
+            before = tokens[i - 1] if i else ""
+            if (re.match(r"[A-Za-z_]", token) and token.upper() not in SQL_WORDS
+                    and after != "(" and before.upper() != "AS" and not token.startswith("__rollup")):
+                names.add(token if before != "." else ".")
+        return names
+
+    def rewrite(self, sql_query, count=True):
+        """
+        Return sql_query rewritten against the rollup, or None if it isn't
+        eligible. count=False leaves the stats alone, for a query that is
+        only being inspected.
+        """
+        if not self.enabled:
+            return None
+        sql_query = re.sub(r"`(\w+)`", r"\1", sql_query.strip())
+        match = ROLLUP_QUERY_PATTERN.match(mask_sql_literals(sql_query))
+        if not match or len(re.findall(r"\bSELECT\b", mask_sql_literals(sql_query), re.I)) != 1:
+            self.stats['not_eligible'] += count
+            return None
+
+        part = {name: sql_query[match.start(name):match.end(name)] if match.group(name) else None
+                for name in ('select', 'where', 'group', 'order', 'limit')}
+        aggregates, items, aliases = [], [], set()
+        for item in split_top_level(part['select']):
+            alias = re.match(r"^(.*?[\w)])\s+(AS\s+)?([A-Za-z_]\w*)$", item, re.IGNORECASE | re.DOTALL)
+            if alias and not alias.group(2) and alias.group(3).upper() in SQL_WORDS:
+                alias = None  # e.g. the END of a CASE expression, not an alias
+            expression = self._to_days(alias.group(1) if alias else item, aggregates)
+            if alias:
+                aliases.add(alias.group(3).lower())
+                items.append(f"{expression} AS {alias.group(3)}")
+            elif re.fullmatch(r"\w+", item):
+                items.append(expression)
+            else:
+                # Keep the column name MySQL gives the original expression
+                items.append(f"{expression} AS `{item}`")
+        clauses = {name: self._to_days(part[name], aggregates)
+                   for name in ('where', 'group', 'order') if part[name]}
+
+        dimensions = {name.lower() for name in ROLLUP_DIMENSIONS}
+        reusable = aliases - {name.lower() for name in ROLLUP_MEASURES + ('TransactionCount',)}
+        allowed = {'select': dimensions, 'where': dimensions,
+                   'group': dimensions | reusable, 'order': dimensions | aliases}
+        texts = dict(clauses, select=", ".join(items))
+        for name, text in texts.items():
+            masked = mask_sql_literals(text)
+            if ROLLUP_BLOCKERS.search(masked.replace("`", " ")) or \
+                    {n.lower() for n in self._names(text)} - allowed[name]:
+                self.stats['not_eligible'] += count
+                return None
+
+        select_at = re.search(r"\bSELECT\b", sql_query, re.IGNORECASE)
+        hint = sql_query[select_at.end():match.start('select')]
+        rewritten = f"SELECT{hint}{texts['select']} FROM {self.table}"
+        for name, keyword in (('where', 'WHERE'), ('group', 'GROUP BY'), ('order', 'ORDER BY')):
+            if name in texts and name != 'select':
+                rewritten += f" {keyword} {texts[name]}"
+        if part['limit']:
+            rewritten += f" LIMIT {part['limit']}"
+        for i, expression in enumerate(aggregates):
+            rewritten = rewritten.replace(f"__rollup{i}__", expression)
+
+        self.stats['rewritten'] += count
+        return rewritten
+
+    def snapshot(self):
+        return dict(self.stats, table=self.table, high_water=self.high_water,
+                    enabled=self.enabled, ready=self._ready)
+
+
+# The rollup lives in MySQL; other backends aggregate their own copy instead
+rollups = RollupStore(**dict(rollup_config, enabled=rollup_config['enabled']
+                             and execution_backend.name == 'mysql'))
+
+
+class ResultCache:
+    """
+    Caches query results against the transactions high-water mark (max ID).
+
+    A result is reused as-is while the high-water mark is unchanged. When new
+    rows arrive, aggregates the rollup can answer are re-run against it,
+    other append-only aggregates are brought up to date by aggregating only
+    the rows with a larger ID and merging them into the cached groups, and
+    every other query is simply re-executed.
+    """
+
+    def __init__(self, max_entries=100):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'rollup': 0, 'incremental': 0, 'full': 0, 'evictions': 0}
+
+    @staticmethod
+    def _key(sql_query):
+        return " ".join(sql_query.strip().rstrip(";").split())
+
+    def execute(self, sql_query, high_water):
+        """Return (results, error) for sql_query as of the given max ID."""
+        key = self._key(sql_query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is not None and entry['high_water'] == high_water:
+            self.stats['hits'] += 1
+            return entry['results'], None
+
+        rollup_sql = rollups.rewrite(sql_query)
+        if rollup_sql and rollups.refresh(high_water) is not None:
+            results, error = execute_sql_query(rollup_sql)
+            if not error:
+                self.stats['rollup'] += 1
+                self._store(key, {'high_water': high_water, 'results': results})
+                return results, None
+            print(f"Rollup query failed, using transactions: {error}")
+
+        plan = parse_incremental_aggregate(sql_query)
+        if plan is None:
+            results, error = execute_sql_query(sql_query)
+            if error:
+                return None, error
+            self.stats['full'] += 1
+            self._store(key, {'high_water': high_water, 'results': results})
+            return results, None
+
+        incremental = (entry is not None and 'groups' in entry
+                       and entry['high_water'] is not None
+                       and entry['high_water'] < high_water)
+        low_id = entry['high_water'] if incremental else None
+        rows, error = execute_sql_query(build_range_query(plan, low_id, high_water))
+        if error:
+            return None, error
+
+        groups = OrderedDict(entry['groups']) if incremental else OrderedDict()
+        self._merge(plan, groups, rows)
+        self.stats['incremental' if incremental else 'full'] += 1
+
+        results = self._finish(plan, groups)
+        self._store(key, {'high_water': high_water, 'results': results, 'groups': groups})
+        return results, None
+
+    @staticmethod
+    def _merge(plan, groups, rows):
+        for row in rows:
+            values = list(row.values())
+            group_key = tuple(value for value, column in zip(values, plan['columns'])
+                              if column['aggregate'] is None)
+            existing = groups.get(group_key)
+            if existing is None:
+                groups[group_key] = dict(row)
+                continue
+            for name, value, column in zip(list(existing), values, plan['columns']):
+                if column['aggregate']:
+                    existing[name] = MERGEABLE_AGGREGATES[column['aggregate']](
+                        existing[name], value)
+
+    @staticmethod
+    def _finish(plan, groups):
+        results = [dict(row) for row in groups.values()]
+        # Apply ORDER BY terms last-to-first so earlier terms take precedence
+        for position, descending in reversed(plan['order']):
+            results.sort(key=lambda row: (list(row.values())[position] is not None,
+                                          list(row.values())[position]),
+                         reverse=descending)
+        if plan['limit'] is not None:
+            results = results[:plan['limit']]
+        return results
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries),
+                        max_entries=self.max_entries)
+
+
+result_cache = ResultCache(max_entries=result_cache_config['max_entries'])
+
+
+# Function to format results
+def format_results(results, expected_columns):
+    """Format the results to match the expected table structure."""
+    if not results:
+        return []
+
+    formatted = []
+    for row in results:
+        formatted_row = {column: row.get(column, None)
+                         for column in expected_columns}
+        formatted.append(formatted_row)
+
+    return formatted
+
+
+EXPECTED_COLUMNS = ['id', 'transaction_date', 'amount',
+                    'category']  # Adjust based on your table structure
+
+
+# Endpoint to set the number of records to return
+@app.route('/api/set-return-num/<int:num>', methods=['GET'])
+def set_return_num(num):
+    session_id = current_session_id(request)
+    session = session_store.load(session_id)
+    session['return_data_num'] = num
+    session_store.save(session_id, session)
+    return jsonify({'message': f'Successfully set the number of records to return to {num}'})
+
+
+# @app.route('/ask', methods=['POST'])
+
+
+def extractSQLQuery(text):
+    """
+    Extracts the SQL query from a text response.
+    It handles cases where the SQL query is enclosed within triple backticks
+    or directly present in the text.
+
+    Args:
+        text (str): The text response containing the SQL query.
+
+    Returns:
+        str: The extracted SQL query.
+
+    Raises:
+        ValueError: If no valid SQL query is found in the response.
+    """
+    logging.info(f"Extracting SQL Query from text: {text}")
+
+    # First attempt: Extract SQL within triple backticks
+    code_block_pattern = re.compile(
+        r"```sql\s*([\s\S]*?)\s*```", re.IGNORECASE)
+    match = code_block_pattern.search(text)
+    if match:
+        sql_query = match.group(1).strip()
+        logging.info("SQL query extracted from code block.")
+        return sql_query
+
+    # Second attempt: Extract SQL directly present in the text
+    # Look for a line starting with SELECT and ending with a semicolon
+    direct_sql_pattern = re.compile(r"(SELECT[\s\S]*?;)", re.IGNORECASE)
+    match = direct_sql_pattern.search(text)
+    if match:
+        sql_query = match.group(1).strip()
+        logging.info("SQL query extracted directly from text.")
+        return sql_query
+
+    # Optional Third Attempt: Handle SQL without a terminating semicolon
+    # This can be useful if the SQL query is the last part of the text without a semicolon
+    direct_sql_no_semicolon_pattern = re.compile(
+        r"(SELECT[\s\S]*)", re.IGNORECASE)
+    match = direct_sql_no_semicolon_pattern.search(text)
+    if match:
+        sql_query = match.group(1).strip()
+        # Additional validation can be performed here
+        if sql_query.endswith(";"):
+            sql_query = sql_query[:-1].strip()
+        logging.info(
+            "SQL query extracted directly from text without semicolon.")
+        return sql_query
+
+    # If all attempts fail, raise an error
+    logging.error("No valid SQL query found in the response.")
+    raise ValueError("No valid SQL query found in the response.")
+
+
+# Constructs a read-only SELECT must not contain: writes to files or
+# variables, row locks, and functions with side effects
+UNSAFE_SQL = re.compile(
+    r"\bINTO\b|\bFOR\s+(UPDATE|SHARE)\b|\bLOCK\s+IN\s+SHARE\s+MODE\b|"
+    r"\b(SLEEP|BENCHMARK|GET_LOCK|RELEASE_LOCK|LOAD_FILE)\s*\(",
+    re.IGNORECASE)
+TRAILING_LIMIT = re.compile(
+    r"\bLIMIT\s+(\d+)(?:\s*,\s*(\d+)|\s+OFFSET\s+(\d+))?\s*$", re.IGNORECASE)
+ROW_MULTIPLYING_SQL = re.compile(
+    r"\b(GROUP\s+BY|ORDER\s+BY|DISTINCT|UNION|JOIN|SUM|COUNT|AVG|MIN|MAX)\b", re.IGNORECASE)
+
+
+def mask_sql_literals(sql_query):
+    """
+    Blank out string literals and comments without changing offsets, so the
+    structure of a query can be inspected with regexes.
+    """
+    def blank(match):
+        text = match.group(0)
+        if text.startswith(("'", '"', '`')):
+            return text[0] + " " * (len(text) - 2) + text[-1]
+        return " " * len(text)
+
+    return re.sub(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`|"
+                  r"/\*[\s\S]*?\*/|--[^\n]*|#[^\n]*", blank, sql_query)
+
+
+def guard_sql(sql_query, max_rows=None):
+    """
+    Check that generated SQL is a single read-only SELECT and make it safe to run:
+    cap the result at max_rows (defaults to return_data_num) with a LIMIT and
+    add a MAX_EXECUTION_TIME optimizer hint.
+
+    Returns (guarded_sql, error); error is a message when the query is refused.
+    """
+    if max_rows is None:
+        max_rows = return_data_num
+
+    sql_query = sql_query.strip().rstrip(";").strip()
+    masked = mask_sql_literals(sql_query)
+    if ";" in masked:
+        return None, "Query refused: only a single statement is allowed."
+    if not re.match(r"^[\s(]*SELECT\b", masked, re.IGNORECASE):
+        return None, "Query refused: only read-only SELECT statements are allowed."
+    unsafe = UNSAFE_SQL.search(masked)
+    if unsafe:
+        return None, f"Query refused: '{unsafe.group(0).strip()}' is not allowed."
+
+    limit = TRAILING_LIMIT.search(masked)
+    if limit is None:
+        sql_query = f"{sql_query}\nLIMIT {max_rows}"
+    else:
+        # LIMIT n / LIMIT offset, n / LIMIT n OFFSET offset
+        count_group = 2 if limit.group(2) else 1
+        if int(limit.group(count_group)) > max_rows:
+            start, end = limit.span(count_group)
+            sql_query = sql_query[:start] + str(max_rows) + sql_query[end:]
+
+    select_at = re.search(r"\bSELECT\b", masked, re.IGNORECASE).end()
+    hint = f" /*+ MAX_EXECUTION_TIME({int(sql_guard_config['max_execution_ms'])}) */"
+    sql_query = sql_query[:select_at] + hint + sql_query[select_at:]
+    return sql_query, None
+
+
+def check_sql_cost(sql_query, high_water=None):
+    """
+    Estimate the rows a query will scan with EXPLAIN and refuse it when the
+    estimate is over sql_guard_config['max_rows_scanned']. Pass high_water
+    when the query will run through result_cache, so an aggregate it
+    answers from the rollup is costed as the rollup query that runs.
+
+    Returns an error message, or None when the query may run. Queries that
+    EXPLAIN cannot handle are let through so execution reports the real error.
+    The budget protects the MySQL server, so other backends skip the check.
+    """
+    if execution_backend.name != 'mysql':
+        return None
+    if high_water is not None:
+        rollup_sql = rollups.rewrite(sql_query, count=False)
+        if rollup_sql and rollups.ensure():
+            sql_query = rollup_sql
+    try:
+        with db_pool.connection() as connection:
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute(f"EXPLAIN {sql_query}")
+                plan = cursor.fetchall()
+            finally:
+                cursor.close()
+    except Error as e:
+        print(f"EXPLAIN failed: {e}")
+        return None
+
+    # Each row of a join is matched against the rows of the next table, so
+    # estimates multiply within a SELECT and add up across SELECTs
+    scans = {}
+    for row in plan:
+        rows = int(row.get('rows') or 0)
+        select_id = row.get('id')
+        scans[select_id] = scans[select_id] * max(rows, 1) if select_id in scans else rows
+    estimate = sum(scans.values())
+    masked = mask_sql_literals(sql_query)
+    limit = TRAILING_LIMIT.search(masked)
+    if limit and not ROW_MULTIPLYING_SQL.search(masked):
+        # A plain filtered scan stops as soon as the LIMIT is reached
+        estimate = min(estimate, int(limit.group(2) or limit.group(1)))
+
+    budget = sql_guard_config['max_rows_scanned']
+    if estimate > budget:
+        return (f"Query refused: an estimated {estimate} rows would be scanned, "
+                f"over the budget of {budget}.")
+    return None
+
+
+def validate_sql_query(sql_query):
+    """Check that a query compiles (EXPLAIN) without running it. Returns an error or None."""
+    return execution_backend.validate(sql_query)
+
+
+def iter_query_chunks(sql_query, chunk_size=None):
+    """
+    Yield the rows of a query on the configured backend as lists of up to
+    chunk_size dicts, holding only one chunk in memory at a time.
+    """
+    return execution_backend.iter_chunks(sql_query, chunk_size or stream_config['chunk_size'])
+
+
+def open_row_stream(sql_query):
+    """
+    Start streaming a query's rows in chunks. The query runs (and any Error
+    is raised) right away, so callers can still answer with an error status.
+    """
+    chunks = iter_query_chunks(sql_query)
+    first_chunk = next(chunks, None)
+
+    def rows():
+        try:
+            if first_chunk is not None:
+                yield first_chunk
+                yield from chunks
+        finally:
+            chunks.close()
+
+    return rows()
+
+
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+
+def negotiate_stream_format(req):
+    """Pick the response format from ?format= or the Accept header (JSON by default)."""
+    available = [name for name in STREAM_FORMATS if name != 'arrow' or pa is not None]
+    requested = req.args.get('format')
+    if requested:
+        return requested if requested in available else None
+    best = req.accept_mimetypes.best_match(
+        [STREAM_FORMATS[name] for name in available], default=STREAM_FORMATS['json'])
+    return next(name for name in available if STREAM_FORMATS[name] == best)
+
+
+def serialize_chunks(chunks, fmt):
+    """Serialize row chunks incrementally as a JSON array, NDJSON or an Arrow IPC stream."""
+    if fmt == 'ndjson':
+        for rows in chunks:
+            yield "".join(app.json.dumps(row) + "\n" for row in rows)
+    elif fmt == 'arrow':
+        sink = io.BytesIO()
+        writer = schema = None
+        for rows in chunks:
+            if writer is None:
+                # Later chunks reuse the first chunk's schema
+                batch = pa.RecordBatch.from_pylist(rows)
+                schema = batch.schema
+                writer = pa.ipc.new_stream(sink, schema)
+            else:
+                batch = pa.RecordBatch.from_pylist(rows, schema=schema)
+            writer.write_batch(batch)
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+        if writer is not None:
+            writer.close()
+            yield sink.getvalue()
+    else:
+        yield "["
+        separator = ""
+        for rows in chunks:
+            yield separator + ",".join(app.json.dumps(row) for row in rows)
+            separator = ","
+        yield "]"
+
+
+def rows_etag(sql_query, fmt, encoding, high_water):
+    """
+    ETag of a "give me" response. The table is append-only, so the rows of
+    a query can only change when the max ID does.
+    """
+    key = f"{high_water}:{fmt}:{encoding}:{sql_query}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def accepts_gzip(req):
+    return stream_config['gzip_level'] > 0 and req.accept_encodings['gzip'] > 0
+
+
+def gzip_pieces(pieces, level):
+    """Gzip a streamed body incrementally, flushing after each piece so rows keep flowing."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    try:
+        for piece in pieces:
+            if isinstance(piece, str):
+                piece = piece.encode('utf-8')
+            data = compressor.compress(piece) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        pieces.close()
+
+
+# Words that may appear bare in generated SELECTs without being column names
+SQL_WORDS = frozenset("""
+    ALL AND ANY AS ASC BETWEEN BINARY BY CASE CHAR CROSS CURRENT CURRENT_DATE
+    CURRENT_TIME CURRENT_TIMESTAMP DATE DATETIME DAY DAY_HOUR DAY_MINUTE DAY_SECOND
+    DECIMAL DESC DISTINCT DIV DOUBLE DUAL ELSE END ESCAPE EXISTS FALSE FLOAT FOLLOWING
+    FOR FROM FULL GROUP HAVING HOUR HOUR_MINUTE HOUR_SECOND IN INNER INTEGER INTERVAL
+    IS JOIN LEFT LIKE LIMIT LOCALTIME LOCALTIMESTAMP MICROSECOND MINUTE MINUTE_SECOND
+    MOD MONTH NATURAL NOT NULL OFFSET ON OR ORDER OUTER OVER PARTITION PRECEDING
+    QUARTER RANGE REGEXP RIGHT RLIKE ROLLUP ROW ROWS SECOND SELECT SEPARATOR SIGNED
+    SOME STRAIGHT_JOIN THEN TIME TRUE UNBOUNDED UNION UNSIGNED USING UTC_DATE
+    UTC_TIMESTAMP WEEK WHEN WHERE WINDOW WITH XOR YEAR YEAR_MONTH
+""".split())
+
+TABLE_COLUMNS = re.findall(r"^- `(\w+)`", TABLE_CONTEXT, re.MULTILINE)
+
+
+def find_unknown_columns(sql_query):
+    """
+    Return the identifiers a query uses as columns that are neither columns
+    of `transactions` nor aliases it defines, a local check that catches
+    invented column names without a round trip to MySQL.
+    """
+    masked = mask_sql_literals(re.sub(r"`(\w+)`", r"\1", sql_query))
+    tokens = re.findall(r"[A-Za-z_][\w$]*|\d+(?:\.\d+)?|[^\s\w]", masked)
+    known = {column.lower() for column in TABLE_COLUMNS} | {'transactions'}
+
+    def is_name(token):
+        return bool(re.match(r"[A-Za-z_]", token)) and token.upper() not in SQL_WORDS
+
+    defined, used = set(), []
+    for i, token in enumerate(tokens):
+        if not is_name(token):
+            continue
+        before = tokens[i - 1] if i else ""
+        after = tokens[i + 1:i + 3]
+        if after[:1] in (["("], ["."]):
+            continue  # function call or table qualifier
+        if (before.upper() == "AS" or before == ")" or is_name(before)
+                or [word.upper() for word in after] == ["AS", "("]):
+            defined.add(token.lower())  # column, table or CTE alias
+        else:
+            used.append(token)
+
+    unknown = []
+    for token in used:
+        if token.lower() not in known | defined and token not in unknown:
+            unknown.append(token)
+    return unknown
+
+
+class SQLRepairer:
+    """
+    Repairs SQL that failed to run. Each fix the model proposes is checked
+    cheaply before it runs (unknown columns locally, then the guard and
+    EXPLAIN), and the loop gives up after max_attempts model calls or
+    time_budget seconds. Fixes that worked are remembered per (SQL, error),
+    so the same failure is repaired again without the model.
+    """
+
+    def __init__(self, max_attempts, time_budget, memory_entries):
+        self.max_attempts = max_attempts
+        self.time_budget = time_budget
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()  # (sql, error) -> fixed sql
+        self._lock = threading.Lock()
+        self.recent = deque(maxlen=20)
+        self.stats = {'repairs': 0, 'repaired': 0, 'failed': 0, 'attempts': 0,
+                      'memory_hits': 0, 'seconds': 0.0, 'max_seconds': 0.0}
+
+    @staticmethod
+    def _key(sql_query, error):
+        return " ".join(sql_query.split()), " ".join(str(error).split())
+
+    def _recall(self, key):
+        with self._lock:
+            fix = self._memory.get(key)
+            if fix is not None:
+                self._memory.move_to_end(key)
+            return fix
+
+    def _remember(self, key, fix):
+        with self._lock:
+            self._memory[key] = fix
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _forget(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+
+    @staticmethod
+    def check(candidate, max_rows=None, high_water=None):
+        """
+        Return (guarded_sql, error) for a candidate fix, without running it.
+        high_water is passed on to check_sql_cost.
+        """
+        unknown = find_unknown_columns(candidate)
+        if unknown:
+            return None, (f"Unknown column {', '.join(repr(name) for name in unknown)}; "
+                          f"transactions only has {', '.join(TABLE_COLUMNS)}")
+        guarded_sql, error = guard_sql(candidate, max_rows)
+        if error:
+            return None, error
+        return guarded_sql, (validate_sql_query(guarded_sql)
+                             or check_sql_cost(guarded_sql, high_water))
+
+    def _try(self, candidate, execute, max_rows, high_water):
+        guarded_sql, error = self.check(candidate, max_rows, high_water)
+        if error:
+            return None, error
+        return execute(guarded_sql)
+
+    def repair(self, sql_query, error, execute, max_rows=None, priority=INTERACTIVE,
+               propose=None, high_water=None):
+        """
+        Fix sql_query, which failed with error, and run the fix through
+        execute(guarded_sql) -> (results, error). propose(sql, error) asks
+        the model for a fix and defaults to query_ollama_cli_forError.
+        high_water is passed to check_sql_cost when execute uses result_cache.
+
+        Returns (results, fixed_sql, error); error is the last failure when
+        no fix ran within the attempt and time budgets.
+        """
+        if propose is None:
+            def propose(failed_sql, failure):
+                return query_ollama_cli_forError(failed_sql, failure, priority)
+
+        started = time.monotonic()
+        key = self._key(sql_query, error)
+        attempts, from_memory = 0, False
+        results, fixed_sql = None, None
+
+        remembered = self._recall(key)
+        if remembered:
+            results, failure = self._try(remembered, execute, max_rows, high_water)
+            if failure is None:
+                fixed_sql, from_memory = remembered, True
+            else:
+                self._forget(key)
+
+        current_sql, current_error = sql_query, error
+        while (fixed_sql is None and attempts < self.max_attempts
+               and time.monotonic() - started < self.time_budget):
+            attempts += 1
+            candidate = propose(current_sql, current_error)
+            if not candidate:
+                continue
+            results, failure = self._try(candidate, execute, max_rows, high_water)
+            model_router.outcome('repair', candidate, failure is None)
+            if failure is None:
+                fixed_sql = candidate
+                self._remember(key, candidate)
+            else:
+                # The next attempt fixes the latest candidate, not the original
+                current_sql, current_error = candidate, failure
+
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self.stats['repairs'] += 1
+            self.stats['repaired' if fixed_sql else 'failed'] += 1
+            self.stats['attempts'] += attempts
+            self.stats['memory_hits'] += from_memory
+            self.stats['seconds'] += elapsed
+            self.stats['max_seconds'] = max(self.stats['max_seconds'], elapsed)
+            self.recent.append({'repaired': fixed_sql is not None, 'attempts': attempts,
+                                'from_memory': from_memory, 'seconds': round(elapsed, 3),
+                                'error': str(error)})
+        print(f"SQL repair {'succeeded' if fixed_sql else 'failed'} after {attempts} "
+              f"model attempts{' (from memory)' if from_memory else ''} in {elapsed * 1000:.0f} ms")
+
+        if fixed_sql is None:
+            return None, None, current_error
+        return results, fixed_sql, None
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, remembered=len(self._memory), recent=list(self.recent))
+
+
+sql_repairer = SQLRepairer(**repair_config)
+
+
+# Queries the index advisor can reason about: a single SELECT over transactions
+INDEX_QUERY_PATTERN = re.compile(
+    r"^\s*SELECT\s+(?:/\*\+.*?\*/\s*)?(?P<select>.+?)\s+FROM\s+transactions"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?"
+    r"(?:\s+GROUP\s+BY\s+(?P<group>.+?))?"
+    r"(?:\s+HAVING\s+.+?)?"
+    r"(?:\s+ORDER\s+BY\s+(?P<order>.+?))?"
+    r"(?:\s+LIMIT\s+\d+(?:\s*,\s*\d+|\s+OFFSET\s+\d+)?)?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL)
+
+# Predicates an index can seek on: point lookups, and ranges (which end the usable key)
+INDEX_EQUALITY = re.compile(r"^(\w+)\s*(?:=|<=>|IN\s*\(|IS\s+NULL\b)", re.IGNORECASE)
+INDEX_RANGE = re.compile(r"^(\w+)\s*(?:<=|>=|<|>|BETWEEN\b|LIKE\s+'(?![%_]))", re.IGNORECASE)
+# A column wrapped in a function, e.g. YEAR(Timestamp) = 2024, can't use an index
+INDEX_WRAPPED_COLUMN = re.compile(r"^\w+\s*\(\s*(\w+)")
+
+
+class IndexAdvisor:
+    """
+    Watches the SQL that runs against `transactions` and proposes indexes
+    for it. Each query yields one candidate: its equality columns, then the
+    range column or else the GROUP BY (or ORDER BY) columns, so the index
+    both narrows the scan and hands rows over already grouped or sorted.
+    When the other columns the query reads fit, they are appended so the
+    index covers the query and the rows themselves are never read.
+
+    Candidates an existing index, or a wider candidate, already serves are
+    folded into it, and the rest are ranked by how often they were needed.
+    """
+
+    def __init__(self, max_queries=1000, max_index_columns=5, max_recommendations=5,
+                 allow_apply=False):
+        self.max_queries = max_queries
+        self.max_index_columns = max_index_columns
+        self.max_recommendations = max_recommendations
+        self.allow_apply = allow_apply
+        # The primary key is part of every InnoDB index, so ID is never proposed
+        self._columns = {column.lower(): column for column in TABLE_COLUMNS if column != 'ID'}
+        self._queries = OrderedDict()  # sql -> [candidate, times run]
+        self._lock = threading.Lock()
+        self.stats = {'queries': 0, 'analyzed': 0, 'no_candidate': 0, 'non_sargable': 0,
+                      'applied': 0}
+
+    @staticmethod
+    def _conjuncts(masked_where):
+        """Spans of the top-level AND terms of a WHERE clause, or None if it has a top-level OR."""
+        spans, depth, start, between = [], 0, 0, False
+        for match in re.finditer(r"\(|\)|\b(?:BETWEEN|AND|OR)\b", masked_where, re.IGNORECASE):
+            token = match.group(0).upper()
+            if token in "()":
+                depth += 1 if token == "(" else -1
+            elif depth:
+                continue
+            elif token == "OR":
+                return None
+            elif token == "BETWEEN":
+                between = True
+            elif between:
+                between = False  # the AND of BETWEEN x AND y
+            else:
+                spans.append((start, match.start()))
+                start = match.end()
+        spans.append((start, len(masked_where)))
+        return spans
+
+    def _plain_columns(self, clause):
+        """The columns of a GROUP BY or ORDER BY list, or None unless every item is a bare column."""
+        columns = []
+        for item in split_top_level(clause):
+            match = re.fullmatch(r"(\w+)(?:\s+(?:ASC|DESC))?", item.strip(), re.IGNORECASE)
+            column = match and self._columns.get(match.group(1).lower())
+            if not column:
+                return None
+            if column not in columns:
+                columns.append(column)
+        return columns
+
+    def analyze(self, sql_query):
+        """Return the (key, covering) columns of the index that would serve sql_query, or None."""
+        sql_query = re.sub(r"`(\w+)`", r"\1", sql_query)
+        masked = mask_sql_literals(sql_query)
+        match = INDEX_QUERY_PATTERN.match(masked)
+        if not match or len(re.findall(r"\bSELECT\b", masked, re.IGNORECASE)) != 1:
+            return None
+
+        equality, ranges = [], []
+        if match.group('where'):
+            offset = match.start('where')
+            for low, high in self._conjuncts(match.group('where')) or ():
+                term = sql_query[offset + low:offset + high].strip().lstrip("( ")
+                if re.search(r"\bOR\b", masked[offset + low:offset + high], re.IGNORECASE):
+                    continue
+                seek = INDEX_EQUALITY.match(term) or INDEX_RANGE.match(term)
+                column = seek and self._columns.get(seek.group(1).lower())
+                if column and seek.re is INDEX_EQUALITY:
+                    equality.append(column)
+                elif column:
+                    ranges.append(column)
+                elif not seek:
+                    wrapped = INDEX_WRAPPED_COLUMN.match(term)
+                    if wrapped and wrapped.group(1).lower() in self._columns:
+                        self.stats['non_sargable'] += 1
+
+        key = list(dict.fromkeys(equality))
+        group = self._plain_columns(match.group('group')) if match.group('group') else None
+        order = self._plain_columns(match.group('order')) if match.group('order') else None
+        if ranges:
+            key.append(ranges[0])
+        elif group or (order and not match.group('group')):
+            key += [column for column in group or order if column not in key]
+        if not key:
+            return None
+
+        # Anything else the query reads, in the order it appears
+        select = match.group('select')
+        if re.search(r"(?:^|,)\s*\*\s*(?:,|$)", select):
+            return tuple(key), ()
+        read = [self._columns[word.lower()] for word in re.findall(r"\w+", masked)
+                if word.lower() in self._columns]
+        cover = [column for column in dict.fromkeys(read) if column not in key]
+        if len(key) + len(cover) > self.max_index_columns:
+            cover = []
+        return tuple(key), tuple(cover)
+
+    def record(self, sql_query):
+        """Note one run of sql_query; new queries are analysed once."""
+        with self._lock:
+            self.stats['queries'] += 1
+            entry = self._queries.get(sql_query)
+            if entry is not None:
+                self._queries.move_to_end(sql_query)
+                entry[1] += 1
+                return
+            self.stats['analyzed'] += 1
+            candidate = self.analyze(sql_query)
+            if candidate is None:
+                self.stats['no_candidate'] += 1
+            self._queries[sql_query] = [candidate, 1]
+            while len(self._queries) > self.max_queries:
+                self._queries.popitem(last=False)
+
+    @staticmethod
+    def _serves(columns, key, cover):
+        return list(columns[:len(key)]) == list(key) and set(cover) <= set(columns)
+
+    def existing_indexes(self):
+        """Index name -> columns of the indexes on transactions."""
+        with db_pool.connection() as connection:
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute("SHOW INDEX FROM transactions")
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+
+        indexes = {}
+        for row in sorted(rows, key=lambda row: (row['Key_name'], row['Seq_in_index'])):
+            indexes.setdefault(row['Key_name'], []).append(row['Column_name'])
+        return indexes
+
+    def recommendations(self, existing=None):
+        """
+        The proposed indexes, most needed first, each with the ALTER TABLE
+        that creates it. existing (name -> columns) defaults to SHOW INDEX.
+        """
+        if existing is None:
+            existing = self.existing_indexes()
+        counts = {}
+        with self._lock:
+            for candidate, runs in self._queries.values():
+                if candidate is not None:
+                    counts[candidate] = counts.get(candidate, 0) + runs
+
+        proposals = []
+        # Widest first, so narrower candidates can fold into them
+        for (key, cover), runs in sorted(counts.items(), key=lambda item: -len(item[0][0] + item[0][1])):
+            if any(self._serves(columns, key, cover) for columns in existing.values()):
+                continue
+            wider = next((p for p in proposals if self._serves(p['columns'], key, cover)), None)
+            if wider is not None:
+                wider['queries'] += runs
+            else:
+                proposals.append({'columns': list(key + cover), 'covering': bool(cover),
+                                  'queries': runs})
+
+        proposals.sort(key=lambda proposal: -proposal['queries'])
+        for proposal in proposals:
+            proposal['name'] = "idx_" + "_".join(c.lower() for c in proposal['columns'])[:60]
+            proposal['ddl'] = (f"ALTER TABLE transactions ADD INDEX {proposal['name']} "
+                               f"({', '.join(proposal['columns'])}), ALGORITHM=INPLACE, LOCK=NONE")
+        return proposals[:self.max_recommendations]
+
+    def apply(self, names=None):
+        """
+        Create the proposed indexes (only those in names, if given). The DDL
+        runs online, so queries keep working while an index builds.
+        Returns the names of the indexes created.
+        """
+        applied = []
+        for proposal in self.recommendations():
+            if names and proposal['name'] not in names:
+                continue
+            with db_pool.connection() as connection:
+                cursor = connection.cursor()
+                try:
+                    cursor.execute(proposal['ddl'])
+                finally:
+                    cursor.close()
+            applied.append(proposal['name'])
+            with self._lock:
+                self.stats['applied'] += 1
+        return applied
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, tracked=len(self._queries), allow_apply=self.allow_apply)
+
+
+index_advisor = IndexAdvisor(**index_advisor_config)
+
+
+# Vocabulary for the template fast path. Each entry maps the words a question
+# may use to a SQL fragment and the name its result column gets
+TEMPLATE_AGGREGATES = [
+    (r"total|sum(?: of)?|overall", 'SUM', 'Total'),
+    (r"average|avg|mean", 'AVG', 'Average'),
+    (r"max(?:imum)?|highest|largest|biggest", 'MAX', 'Max'),
+    (r"min(?:imum)?|lowest|smallest", 'MIN', 'Min'),
+]
+
+TEMPLATE_MEASURES = [
+    (r"sales|revenue|(?:total )?amounts?|spend(?:ing)?", 'TotalAmount', 'Sales'),
+    (r"(?:quantit(?:y|ies)|units|items)(?: sold)?", 'Quantity', 'Quantity'),
+    (r"(?:unit )?prices?", 'UnitPrice', 'UnitPrice'),
+]
+
+TEMPLATE_DIMENSIONS = [
+    (r"states?|regions?", 'State', 'State'),
+    (r"products?(?: ?ids?)?", 'ProductID', 'ProductID'),
+    (r"days?|dates?|daily", 'DATE(Timestamp)', 'Day'),
+    (r"months?|monthly", "DATE_FORMAT(Timestamp, '%Y-%m')", 'Month'),
+    (r"years?|yearly", 'YEAR(Timestamp)', 'Year'),
+]
+
+# The State values a question may filter on. Any other filter ("in march",
+# "for last month") is left to the LLM rather than read as a State
+TEMPLATE_STATES = (
+    'Alabama', 'Alaska', 'Arizona', 'Arkansas', 'California', 'Colorado', 'Connecticut',
+    'Delaware', 'District of Columbia', 'Florida', 'Georgia', 'Hawaii', 'Idaho', 'Illinois',
+    'Indiana', 'Iowa', 'Kansas', 'Kentucky', 'Louisiana', 'Maine', 'Maryland',
+    'Massachusetts', 'Michigan', 'Minnesota', 'Mississippi', 'Missouri', 'Montana',
+    'Nebraska', 'Nevada', 'New Hampshire', 'New Jersey', 'New Mexico', 'New York',
+    'North Carolina', 'North Dakota', 'Ohio', 'Oklahoma', 'Oregon', 'Pennsylvania',
+    'Rhode Island', 'South Carolina', 'South Dakota', 'Tennessee', 'Texas', 'Utah',
+    'Vermont', 'Virginia', 'Washington', 'West Virginia', 'Wisconsin', 'Wyoming',
+)
+
+# Leading words that don't change what is asked
+TEMPLATE_FILLER = re.compile(
+    r"^(?:(?:what|which)(?:'s| is| are| was| were)?|show(?: me)?|list|get|tell me|find|"
+    r"give me|calculate|compute|please|the|our|all)\s+")
+
+
+def sql_string_literal(value):
+    """Quote a value matched from a question as a MySQL string literal."""
+    return "'" + value.replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+class TemplateMatcher:
+    """
+    Deterministic fast path in front of the LLM: recognises common question
+    shapes ("total sales by state", "top 5 products by quantity", "average
+    unit price in Texas", "how many transactions per month", "give me the
+    last 20 transactions") and builds their SQL directly. Only columns listed
+    in the schema are used, and values taken from the question are quoted,
+    never spliced in raw.
+    """
+
+    def __init__(self, schema):
+        columns = set(re.findall(r"^- `(\w+)`", schema, re.MULTILINE))
+        measures = [m for m in TEMPLATE_MEASURES if m[1] in columns]
+        dimensions = [d for d in TEMPLATE_DIMENSIONS
+                      if columns & set(re.findall(r"\w+", d[1]))]
+        self._aggregates = self._alternatives(TEMPLATE_AGGREGATES)
+        self._measures = self._alternatives(measures)
+        self._dimensions = self._alternatives(dimensions)
+        self._lookup = {'aggregate': TEMPLATE_AGGREGATES, 'measure': measures,
+                        'dimension': dimensions}
+        self._states = {state.lower(): state for state in TEMPLATE_STATES}
+        states = "|".join(re.escape(state) for state in sorted(self._states, key=len, reverse=True))
+
+        group = rf"(?:by|per|for each|for every|across|grouped by) (?:each )?(?P<dimension>{self._dimensions})"
+        where = rf"(?:in|for|from|during) (?:the state of )?(?P<filter>{states}|\d{{4}})"
+        measure = rf"(?:(?P<aggregate>{self._aggregates}) )?(?:of )?(?P<measure>{self._measures})"
+        count = r"(?:how many|number of|count of|count|total number of) (?:transactions|sales|orders|records|rows)"
+        tail = rf"(?: {group})?(?: {where})?(?: {group.replace('dimension', 'dimension2')})?"
+        self._patterns = [
+            ('last_rows', re.compile(
+                r"^(?:the )?(?:last|latest|most recent|newest) (?P<limit>\d+) "
+                r"(?:transactions|records|rows|sales)" rf"(?: {where})?$")),
+            ('top_n', re.compile(
+                rf"^(?P<direction>top|best|bottom|worst) (?P<limit>\d+) (?P<dimension>{self._dimensions}) "
+                rf"(?:by|for|with(?: the)? (?:most|highest|lowest)) {measure}(?: {where})?$")),
+            ('count', re.compile(rf"^{count}{tail}$")),
+            ('aggregate', re.compile(rf"^{measure}{tail}$")),
+        ]
+        self.stats = {'hits': 0, 'misses': 0, 'templates': {}}
+
+    @staticmethod
+    def _alternatives(vocabulary):
+        return "|".join(f"(?:{words})" for words, _, _ in vocabulary)
+
+    def _resolve(self, kind, text):
+        for words, sql, name in self._lookup[kind]:
+            if re.fullmatch(words, text):
+                return sql, name
+        return None
+
+    @staticmethod
+    def normalize(question):
+        text = re.sub(r"[?!.,;]+$", "", question.strip().lower())
+        text = re.sub(r"\s+", " ", text)
+        while True:
+            stripped = TEMPLATE_FILLER.sub("", text, count=1)
+            if stripped == text:
+                return text
+            text = stripped
+
+    def _where(self, value):
+        if not value:
+            return ""
+        if value.isdigit():
+            return (f" WHERE Timestamp BETWEEN '{value}-01-01' "
+                    f"AND '{value}-12-31 23:59:59'")
+        return f" WHERE State = {sql_string_literal(self._states[value])}"
+
+    def match(self, question):
+        """Return SQL for a recognised question, or None to fall back to the LLM."""
+        text = self.normalize(question)
+        for name, pattern in self._patterns:
+            found = pattern.match(text)
+            if found:
+                sql = getattr(self, f"_build_{name}")(found.groupdict())
+                if sql:
+                    self.stats['hits'] += 1
+                    self.stats['templates'][name] = self.stats['templates'].get(name, 0) + 1
+                    return sql
+        self.stats['misses'] += 1
+        return None
+
+    def _group_by(self, fields):
+        text = fields.get('dimension') or fields.get('dimension2')
+        return self._resolve('dimension', text) if text else None
+
+    def _build_last_rows(self, fields):
+        return (f"SELECT * FROM transactions{self._where(fields['filter'])} "
+                f"ORDER BY ID DESC LIMIT {int(fields['limit'])}")
+
+    def _build_top_n(self, fields):
+        dimension, dimension_name = self._resolve('dimension', fields['dimension'])
+        aggregate, prefix = self._resolve('aggregate', fields['aggregate'] or 'total')
+        column, measure_name = self._resolve('measure', fields['measure'])
+        alias = prefix + measure_name
+        direction = 'DESC' if fields['direction'] in ('top', 'best') else 'ASC'
+        return (f"SELECT {self._select_dimension(dimension, dimension_name)}, "
+                f"{aggregate}({column}) AS {alias} "
+                f"FROM transactions{self._where(fields['filter'])} "
+                f"GROUP BY {dimension_name} ORDER BY {alias} {direction} "
+                f"LIMIT {int(fields['limit'])}")
+
+    def _build_count(self, fields):
+        return self._grouped("COUNT(ID)", "TransactionCount", fields)
+
+    def _build_aggregate(self, fields):
+        if fields['aggregate'] is None and fields['measure'] in ('price', 'prices', 'unit price', 'unit prices'):
+            # "price by state" means the average price, not the sum of prices
+            aggregate, prefix = 'AVG', 'Average'
+        else:
+            aggregate, prefix = self._resolve('aggregate', fields['aggregate'] or 'total')
+        column, measure_name = self._resolve('measure', fields['measure'])
+        return self._grouped(f"{aggregate}({column})", prefix + measure_name, fields)
+
+    def _grouped(self, expression, alias, fields):
+        if fields.get('dimension') and fields.get('dimension2'):
+            return None
+        where = self._where(fields['filter'])
+        group = self._group_by(fields)
+        if group is None:
+            return f"SELECT {expression} AS {alias} FROM transactions{where}"
+        dimension, dimension_name = group
+        # Time buckets read best in time order, everything else by value
+        order = dimension_name if dimension != dimension_name else f"{alias} DESC"
+        return (f"SELECT {self._select_dimension(dimension, dimension_name)}, {expression} AS {alias} "
+                f"FROM transactions{where} GROUP BY {dimension_name} ORDER BY {order}")
+
+    @staticmethod
+    def _select_dimension(dimension, name):
+        return dimension if dimension == name else f"{dimension} AS {name}"
+
+    def snapshot(self):
+        total = self.stats['hits'] + self.stats['misses']
+        return dict(self.stats, templates=dict(self.stats['templates']),
+                    hit_rate=self.stats['hits'] / total if total else 0.0)
+
+
+sql_templates = TemplateMatcher(TABLE_CONTEXT)
+
+
+def ask_question(question, high_water=None, stream_rows=False, max_rows=None,
+                 priority=INTERACTIVE):
+
+    print("Received POST requestsss", question)
+    if not question:
+        return jsonify({'error': 'No question provided.'}), 400
+
+    with trace('sql_generation') as span:
+        # Common question shapes are answered from templates without the LLM
+        template_sql = sql_templates.match(question)
+        cached_sql = None if template_sql else sql_cache.get(question)
+        # A rewording of a past question reuses its SQL, or shows it to the model
+        similar_sql, examples = None, []
+        if not template_sql and not cached_sql:
+            similar_sql, examples = question_index.match(question)
+        if template_sql:
+            print(f"Template fast path: {template_sql}")
+            span['source'] = 'template'
+            sql_query = sql_query_sanitized = template_sql
+        elif cached_sql:
+            print(f"SQL cache hit: {cached_sql}")
+            span['source'] = 'cache'
+            sql_query = sql_query_sanitized = cached_sql
+        elif similar_sql:
+            print(f"Similar question reuse: {similar_sql}")
+            span['source'] = 'similar'
+            sql_query = sql_query_sanitized = similar_sql
+        else:
+            span['source'] = 'llm'
+            span['examples'] = len(examples)
+            sql_query = query_ollama_cli(question, priority, examples)
+            print("sql query", sql_query)
+
+            if not sql_query:
+                return jsonify({'error': 'Failed to generate SQL query.'}), 500
+
+            sql_query_sanitized = extractSQLQuery(sql_query)
+            print(f"Generated SQL Query: {sql_query_sanitized}")
+
+    # Streamed rows and direct queries run as written; everything else goes
+    # through result_cache, which may answer from the rollup
+    cost_high_water = None if stream_rows else high_water
+    with trace('guard') as span:
+        guarded_sql, guard_error = guard_sql(sql_query_sanitized, max_rows)
+        if not guard_error and not cached_sql and not template_sql and not similar_sql:
+            # Cached and reused queries already passed the cost check when
+            # they were generated, and template queries are known shapes
+            guard_error = check_sql_cost(guarded_sql, cost_high_water)
+        span['refused'] = bool(guard_error)
+    if guard_error:
+        print(guard_error)
+        model_router.outcome('sql', sql_query, False)
+        if cached_sql:
+            sql_cache.invalidate(question)
+        return jsonify({'error': guard_error}), 400
+
+    def execute(guarded_sql):
+        if stream_rows:
+            # The rows are read later, chunk by chunk, by /api/last-10-records
+            return {'question': question, 'sql': guarded_sql}, validate_sql_query(guarded_sql)
+        if high_water is None:
+            return execute_sql_query(guarded_sql)
+        return result_cache.execute(guarded_sql, high_water)
+
+    with trace('execute') as span:
+        results, error = execute(guarded_sql)
+        span['mode'] = 'stream' if stream_rows else 'direct' if high_water is None else 'result_cache'
+    print(f"Results: {results}")
+    # Generated SQL is good if it ran as written
+    model_router.outcome('sql', sql_query, not error)
+
+    if error:
+        if cached_sql:
+            # A cached query that no longer runs must not be served again
+            sql_cache.invalidate(question)
+            cached_sql = None
+        with trace('repair') as span:
+            results, repaired_sql, error = sql_repairer.repair(
+                sql_query_sanitized, error, execute, max_rows, priority,
+                high_water=cost_high_water)
+            span['repaired'] = not error
+        if error:
+            return jsonify({'error': f"SQL Execution Error: {error}"}), 500
+        print(f"Repaired SQL Query: {repaired_sql}")
+        sql_query_sanitized, template_sql = repaired_sql, None
+
+    if not cached_sql and not template_sql:
+        sql_cache.put(question, sql_query_sanitized)
+        question_index.put(question, sql_query_sanitized)
+
+    return results
+
+    formatted_data = format_results(results, EXPECTED_COLUMNS)
+
+    # return jsonify({'data': formatted_data}), 200, {'Access-Control-Allow-Origin': '*'}
+
+
+def refresh_session(session_id, session, high_water, priority=INTERACTIVE):
+    """
+    Re-answer the session's question against the table at high_water and
+    save the session. Returns an (event, payload) pair: 'answer' with the
+    humanized text, 'reload' for "give me" questions whose rows are streamed
+    by /api/last-10-records, or 'error' with the error body.
+    """
+    question = session['question']
+    session['last_checked_data'] = high_water
+    session_store.save(session_id, session)
+
+    give_me = question.lower().startswith("give me")
+    results = ask_question(question, high_water, stream_rows=give_me,
+                           max_rows=session['return_data_num'], priority=priority)
+    if isinstance(results, tuple):
+        error_response, _ = results
+        return 'error', error_response.get_json()
+
+    if give_me:
+        session['return_this_data'] = results
+        session_store.save(session_id, session)
+        return 'reload', {'question': question}
+
+    return 'answer', query_ollama_cli_humanize(question, results, priority)
+
+
+class ChangeWatcher:
+    """
+    A single background thread that checks the transactions table for new
+    rows with one MAX(ID) lookup per interval. When rows arrive it re-answers
+    the question of every subscribed session (once per distinct question) and
+    only then wakes their SSE streams and long-polls, so the database load is
+    the same for one dashboard or a hundred.
+    """
+
+    def __init__(self, interval, subscriber_ttl):
+        self.interval = interval
+        self.subscriber_ttl = subscriber_ttl
+        self.high_water = None
+        self._subscribers = {}  # session id -> when it last waited
+        self._messages = {}  # session id -> latest change message
+        self._changed = threading.Condition()
+        self._thread = None
+        self.stats = {'checks': 0, 'changes': 0, 'recomputed': 0, 'notified': 0, 'errors': 0}
+
+    def ensure_started(self):
+        """Start the watcher thread on first use."""
+        with self._changed:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self.high_water = get_high_water()
+            self._thread = threading.Thread(target=self._run, name='change-watcher', daemon=True)
+            self._thread.start()
+
+    def current(self):
+        """The latest max ID: the watcher's last check, or a lookup if it isn't running."""
+        if self._thread is not None and self._thread.is_alive():
+            return self.high_water
+        return get_high_water()
+
+    def subscribe(self, session_id):
+        """Keep session_id's answer recomputed on every change."""
+        self.ensure_started()
+        with self._changed:
+            self._subscribers[session_id] = time.monotonic()
+
+    def latest(self, session_id):
+        """The last change message for a subscribed session_id, or None."""
+        with self._changed:
+            self._subscribers[session_id] = time.monotonic()
+            return self._messages.get(session_id)
+
+    def wait(self, session_id, since, timeout):
+        """
+        Block until session_id has a change message newer than the since
+        high water mark and return it, or return None after timeout seconds.
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                self._subscribers[session_id] = time.monotonic()
+                message = self._messages.get(session_id)
+                if message and message['high_water'] > since:
+                    return message
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._changed.wait(remaining)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                high_water = get_high_water()
+                self.stats['checks'] += 1
+                if high_water != self.high_water:
+                    self.stats['changes'] += 1
+                    # Keep the rollup current as rows arrive, even with no subscribers
+                    rollups.refresh(high_water)
+                    self._recompute(high_water)
+                    self.high_water = high_water
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"Change watcher error: {e!r}")
+
+    def _recompute(self, high_water):
+        now = time.monotonic()
+        with self._changed:
+            for session_id, seen in list(self._subscribers.items()):
+                if now - seen > self.subscriber_ttl:
+                    del self._subscribers[session_id]
+                    self._messages.pop(session_id, None)
+            session_ids = list(self._subscribers)
+
+        # Dashboards asking the same question share one answer
+        groups = {}
+        for session_id in session_ids:
+            session = session_store.load(session_id)
+            if session['question']:
+                key = (session['question'], session['return_data_num'])
+                groups.setdefault(key, []).append((session_id, session))
+
+        with app.app_context():
+            for members in groups.values():
+                session_id, session = members[0]
+                event, payload = refresh_session(session_id, session, high_water, BACKGROUND)
+                self.stats['recomputed'] += 1
+                for other_id, other in members[1:]:
+                    other['last_checked_data'] = high_water
+                    if event == 'reload':
+                        other['return_this_data'] = session['return_this_data']
+                    session_store.save(other_id, other)
+
+                if event == 'answer':
+                    message = {'high_water': high_water, 'answer': payload}
+                elif event == 'reload':
+                    message = {'high_water': high_water, 'reload': True}
+                else:
+                    message = dict(payload, high_water=high_water)
+                with self._changed:
+                    for member_id, _ in members:
+                        self._messages[member_id] = message
+                    self.stats['notified'] += len(members)
+                    self._changed.notify_all()
+
+    def snapshot(self):
+        with self._changed:
+            subscribers = len(self._subscribers)
+        return dict(self.stats, high_water=self.high_water, subscribers=subscribers,
+                    running=self._thread is not None and self._thread.is_alive())
+
+
+change_watcher = ChangeWatcher(watch_config['interval'], watch_config['subscriber_ttl'])
+
+
+@app.route('/api/ask-database-set/<string:question>', methods=['GET'])
+def ask_database_set(question):
+    session_id = current_session_id(request)
+    session = session_store.load(session_id)
+    session['question'] = question
+    # Answer a new question even if no rows arrived since the last check
+    session['last_checked_data'] = None
+    session_store.save(session_id, session)
+
+    print("Question is asked", question)
+    question = question
+    sql_query_analysed = should_reload()
+
+    # Pass database and SQL errors through instead of wrapping them in a message
+    if isinstance(sql_query_analysed, tuple) and sql_query_analysed[1] != 200:
+        return sql_query_analysed
+    if not sql_query_analysed:
+        return jsonify({'error': 'Failed to generate SQL query.'}), 500
+
+    return jsonify({'message': f'Query generated: {sql_query_analysed}'}), 200
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+# Endpoint that answers a question over Server-Sent Events: "token" events
+# carry the humanized answer while it is generated, "answer" carries the
+# final text and "reload" tells the extension to refresh for "give me" data
+@app.route('/api/ask-database-stream/<string:question>', methods=['GET'])
+def ask_database_stream(question):
+    session_id = current_session_id(request)
+    session = session_store.load(session_id)
+    session['question'] = question
+
+    def events():
+        try:
+            high_water = change_watcher.current()
+        except Error as e:
+            print(f"Error: {e}")
+            yield sse_event('error', {'error': 'Failed to connect to the database'})
+            return
+        session['last_checked_data'] = high_water
+        session_store.save(session_id, session)
+
+        give_me = question.lower().startswith("give me")
+        results = ask_question(question, high_water, stream_rows=give_me,
+                               max_rows=session['return_data_num'])
+        if isinstance(results, tuple):
+            error_response, _ = results
+            yield sse_event('error', error_response.get_json())
+            return
+
+        if give_me:
+            session['return_this_data'] = results
+            session_store.save(session_id, session)
+            yield sse_event('reload', {'question': question})
+            return
+
+        with trace('humanize') as span:
+            local_answer = local_humanizer.answer(results)
+            span['source'] = 'local' if local_answer else 'llm'
+            if local_answer:
+                yield sse_event('answer', local_answer)
+                return
+
+            answer_filter = AnswerStreamFilter()
+            try:
+                stream = stream_chat(build_humanize_prompt(question, results), task='humanize',
+                                     judge=well_formed_answer)
+                try:
+                    for chunk in stream:
+                        delta = answer_filter.feed(chunk)
+                        if delta:
+                            yield sse_event('token', delta)
+                        if answer_filter.complete:
+                            break
+                finally:
+                    stream.close()
+                answer = finalize_humanized_response(answer_filter.text.strip(), results)
+            except Exception as e:
+                print(f"Error: {e}")
+                answer = "<<< Sorry, I couldn't process the data into a human-readable format. >>>"
+        yield sse_event('answer', answer)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/ask-database/<int:num>', methods=['GET'])
+def ask_database():
+    print("question is asked", )
+    ollama_response = should_reload()
+    print('finally response from ollama', ollama_response)
+
+    return jsonify({'ollama_response': ollama_response}), 200
+# Function to determine if client should reload data
+
+
+@app.route('/api/should-reload', methods=['GET'])
+def should_reload():
+    session_id = current_session_id(request)
+    session = session_store.load(session_id)
+    question = session['question']
+    print("Question from should reload", question)
+    try:
+        high_water = change_watcher.current()
+    except Error as e:
+        print(f"Error: {e}")
+        return jsonify({'error': 'Failed to connect to the database'}), 500
+
+    try:
+        if session['last_checked_data'] != high_water:
+            # A question that was just asked is interactive; re-answering it
+            # after new rows is a background refresh
+            priority = INTERACTIVE if session['last_checked_data'] is None else BACKGROUND
+            event, payload = refresh_session(session_id, session, high_water, priority)
+            print('ollama response', payload)
+            if event == 'answer':
+                return payload
+            if event == 'error':
+                return jsonify(payload), 500
+
+        return jsonify({'reload': False}), 200, {'Access-Control-Allow-Origin': '*'}
+
+    except Error as e:
+        print(f"Error: {e}")
+        return jsonify({'error': 'Database query failed'}), 500
+
+
+# Change-data push, replacing /api/should-reload polling: a dashboard
+# subscribes once and hears about new rows only after its answer has been
+# recomputed. /api/changes is a Server-Sent Events stream of "change" events;
+# /api/changes/poll is the long-poll fallback, answering as soon as there is a
+# change newer than ?since= (a high water mark) or after a timeout
+@app.route('/api/changes', methods=['GET'])
+def changes():
+    session_id = current_session_id(request)
+    try:
+        change_watcher.subscribe(session_id)
+        since = change_watcher.current()
+    except Error as e:
+        print(f"Error: {e}")
+        return jsonify({'error': 'Failed to connect to the database'}), 500
+
+    def events():
+        last = since
+        yield sse_event('subscribed', {'high_water': last})
+        while True:
+            message = change_watcher.wait(session_id, last, watch_config['keepalive'])
+            if message is None:
+                yield ": keep-alive\n\n"
+                continue
+            last = message['high_water']
+            yield sse_event('change', message)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/changes/poll', methods=['GET'])
+def changes_poll():
+    session_id = current_session_id(request)
+    since = request.args.get('since', type=int)
+    timeout = min(request.args.get('timeout', watch_config['long_poll_timeout'], type=float),
+                  watch_config['long_poll_timeout'])
+    try:
+        change_watcher.subscribe(session_id)
+        if since is None:
+            since = change_watcher.current()
+    except Error as e:
+        print(f"Error: {e}")
+        return jsonify({'error': 'Failed to connect to the database'}), 500
+
+    message = change_watcher.wait(session_id, since, timeout)
+    if message is None:
+        return jsonify({'high_water': since, 'changed': False})
+    return jsonify(dict(message, changed=True))
+
+
+# Endpoint to inspect the rollup: rewritten queries and folded ID ranges
+@app.route('/api/rollups', methods=['GET'])
+def rollup_stats():
+    return jsonify(rollups.snapshot())
+
+
+# Endpoint to inspect the change watcher counters
+@app.route('/api/change-watcher', methods=['GET'])
+def change_watcher_stats():
+    return jsonify(change_watcher.snapshot())
+
+
+# Endpoint to inspect the current session's state
+@app.route('/api/session', methods=['GET'])
+def session_info():
+    session_id = current_session_id(request)
+    return jsonify(dict(session_store.load(session_id), session_id=session_id,
+                        sessions=len(session_store)))
+
+
+# Endpoint to inspect the template fast path's hit rate
+@app.route('/api/fast-path', methods=['GET'])
+def fast_path_stats():
+    return jsonify(sql_templates.snapshot())
+
+
+# Endpoint to inspect how many answers were written without the LLM
+@app.route('/api/humanizer', methods=['GET'])
+def humanizer_stats():
+    return jsonify(local_humanizer.snapshot())
+
+
+# Endpoint to inspect estimated prompt sizes per kind of prompt
+@app.route('/api/prompt-stats', methods=['GET'])
+def prompt_size_stats():
+    return jsonify(prompt_stats.snapshot())
+
+
+# Endpoint to inspect SQL repairs: attempts, latency and remembered fixes
+@app.route('/api/repair-stats', methods=['GET'])
+def repair_stats():
+    return jsonify(sql_repairer.snapshot())
+
+
+# Endpoint to inspect the LLM scheduler's queue depth, waits and merged calls
+@app.route('/api/llm-scheduler', methods=['GET'])
+def llm_scheduler_stats():
+    return jsonify(llm_scheduler.snapshot())
+
+
+# Endpoint to inspect the model per task, fallbacks, loaded models and output quality
+@app.route('/api/models', methods=['GET'])
+def model_router_stats():
+    return jsonify(model_router.snapshot())
+
+
+# Endpoint to inspect the execution backend (MySQL, or DuckDB over Parquet)
+@app.route('/api/execution-backend', methods=['GET'])
+def execution_backend_stats():
+    return jsonify(execution_backend.snapshot())
+
+
+# Prometheus metrics: per-stage latency histograms, LLM tokens, rows
+# returned, request latency, and the counters of the pool, caches and scheduler
+for component, snapshot in (('pool', db_pool.snapshot), ('sql_cache', sql_cache.snapshot),
+                            ('question_index', question_index.snapshot),
+                            ('result_cache', result_cache.snapshot),
+                            ('llm_scheduler', llm_scheduler.snapshot),
+                            ('model_tasks', lambda: model_router.snapshot()['tasks']),
+                            ('models', lambda: model_router.snapshot()['models']),
+                            ('prompt', prompt_stats.snapshot),
+                            ('fast_path', sql_templates.snapshot),
+                            ('humanizer', local_humanizer.snapshot),
+                            ('repair', sql_repairer.snapshot), ('rollups', rollups.snapshot),
+                            ('index_advisor', index_advisor.snapshot),
+                            ('execution_backend', execution_backend.snapshot),
+                            ('change_watcher', change_watcher.snapshot),
+                            ('profiler', slow_request_profiler.snapshot)):
+    metrics.collect(component, snapshot)
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+# Endpoint to inspect the connection pool counters
+@app.route('/api/pool-stats', methods=['GET'])
+def pool_stats():
+    return jsonify(db_pool.snapshot())
+
+
+# Endpoints to inspect and invalidate the question -> SQL cache
+@app.route('/api/sql-cache', methods=['GET'])
+def sql_cache_stats():
+    return jsonify(sql_cache.snapshot())
+
+
+@app.route('/api/sql-cache/invalidate', methods=['GET', 'POST'])
+def sql_cache_invalidate():
+    question = request.args.get('question')
+    removed = sql_cache.invalidate(question)
+    question_index.invalidate(question)
+    return jsonify({'message': f'Removed {removed} cached queries'})
+
+
+# Endpoint to inspect the question index; ?question= also lists the stored
+# questions nearest to it, to help tune the similarity thresholds
+@app.route('/api/question-index', methods=['GET'])
+def question_index_stats():
+    question = request.args.get('question')
+    if not question:
+        return jsonify(question_index.snapshot())
+    neighbours = [dict(entry, similarity=round(similarity, 4),
+                       reusable=similarity >= question_index.reuse_similarity
+                       and question_index.compatible(question, entry))
+                  for similarity, entry in question_index.search(question)]
+    return jsonify(dict(question_index.snapshot(), neighbours=neighbours))
+
+
+# Endpoint to inspect the result cache counters
+@app.route('/api/result-cache', methods=['GET'])
+def result_cache_stats():
+    return jsonify(result_cache.snapshot())
+
+
+# Endpoints to see the indexes proposed for the SQL that has run, and to create them
+@app.route('/api/index-advisor', methods=['GET'])
+def index_advisor_stats():
+    try:
+        recommendations = index_advisor.recommendations()
+    except Error as e:
+        return jsonify(dict(index_advisor.snapshot(), error=str(e))), 500
+    return jsonify(dict(index_advisor.snapshot(), recommendations=recommendations))
+
+
+@app.route('/api/index-advisor/apply', methods=['POST'])
+def index_advisor_apply():
+    if not index_advisor.allow_apply:
+        return jsonify({'error': "Applying indexes is disabled (index_advisor_config['allow_apply'])."}), 403
+    names = request.args.getlist('name')
+    try:
+        applied = index_advisor.apply(names)
+    except Error as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'message': f'Created {len(applied)} indexes', 'applied': applied})
+
+
+# API to fetch the last N records. The rows of the last "give me" question are
+# streamed from the database as a JSON array, NDJSON or Arrow IPC, chosen with
+# ?format= or the Accept header, and gzipped if the client accepts it. The
+# ETag changes with the max ID, so a client sending If-None-Match gets a 304
+# without the query running until new rows arrive
+@app.route('/api/last-10-records', methods=['GET'])
+def get_last_10_records():
+    return_this_data = session_store.load(current_session_id(request))['return_this_data']
+    if not isinstance(return_this_data, dict) or 'sql' not in return_this_data:
+        return jsonify(return_this_data)
+
+    fmt = negotiate_stream_format(request)
+    if fmt is None:
+        return jsonify({'error': f"Unsupported format, use one of {list(STREAM_FORMATS)}"}), 406
+    gzip = accepts_gzip(request)
+
+    try:
+        etag = rows_etag(return_this_data['sql'], fmt, 'gzip' if gzip else 'identity',
+                         change_watcher.current())
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        chunks = open_row_stream(return_this_data['sql'])
+    except Error as e:
+        print(f"Database error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+    pieces = serialize_chunks(chunks, fmt)
+    headers = {'Cache-Control': 'no-cache', 'Vary': 'Accept, Accept-Encoding'}
+    if gzip:
+        pieces = gzip_pieces(pieces, stream_config['gzip_level'])
+        headers['Content-Encoding'] = 'gzip'
+    response = Response(stream_with_context(pieces), mimetype=STREAM_FORMATS[fmt],
+                        headers=headers)
+    response.set_etag(etag)
+    return response
 
 
 # Run Flask app
 if __name__ == '__main__':
+    model_router.preload()
     app.run(debug=True, host='0.0.0.0', port=3308)
@@ -0,0 +1,686 @@
+"""
+Asyncio serving mode for theApiBrain.
+
+Serves the same routes as theApiBrain.py from one event loop. Ollama is
+called through its async client behind a concurrency limit and a per-call
+timeout, and MySQL work runs on a small thread pool against the shared
+connection pool, so one slow question no longer stalls every other dashboard.
+
+Run with `python theAsyncApiBrain.py` or `hypercorn theAsyncApiBrain:app`.
+"""
+import asyncio
+import contextvars
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+
+from quart import Quart, Response, g, jsonify, request
+from mysql.connector import Error
+from ollama import AsyncClient
+
+import theApiBrain as brain
+
+app = Quart(__name__)
+
+# LLM settings: seconds allowed per call, including the time spent waiting
+# for a free slot. Slots, priorities and merging of identical calls come from
+# brain.llm_scheduler, shared with the change watcher's refreshes; the model
+# for each call comes from brain.model_router
+llm_config = {
+    'timeout': 120
+}
+
+ollama_client = AsyncClient()
+
+# One thread per pooled connection, so DB work never queues twice
+db_executor = ThreadPoolExecutor(
+    max_workers=brain.pool_config['size'], thread_name_prefix='db')
+
+# Seconds between checks of brain.change_watcher's messages while a
+# subscriber waits; waiting on its Condition would hold a thread per dashboard
+change_poll_interval = 0.25
+
+
+@app.before_request
+async def start_request_trace():
+    # brain.trace reads the request ID from the context, which the event loop
+    # keeps per request; the slow-request profiler samples threads, so it
+    # only runs under theApiBrain.py
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+    g.request_started = time.perf_counter()
+    brain.current_request_id.set(g.request_id)
+
+
+@app.after_request
+async def allow_cors(response):
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['X-Request-ID'] = g.get('request_id', '-')
+    brain.metrics.inc('requests_total', endpoint=request.endpoint, status=response.status_code)
+    return response
+
+
+@app.before_serving
+async def preload_models():
+    brain.model_router.preload()
+
+
+@app.teardown_request
+async def finish_request_trace(error=None):
+    if 'request_started' in g:
+        brain.metrics.observe('request_seconds', time.perf_counter() - g.request_started,
+                              endpoint=request.endpoint)
+
+
+async def run_db(func, *args):
+    """Run a blocking DB helper from theApiBrain on the DB thread pool."""
+    loop = asyncio.get_running_loop()
+    # Carry the request ID over to the thread, for the trace lines logged there
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(db_executor, context.run, func, *args)
+
+
+async def run_io(func, *args):
+    """
+    Run a blocking helper that writes files, calls Redis or embeds with
+    Ollama (session store, SQL cache, question index) on the default pool,
+    so DB work keeps its own threads.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(None, context.run, func, *args)
+
+
+async def chat_async(prompt, task='chat', priority=brain.INTERACTIVE):
+    """
+    Send one prompt to the model brain.model_router picks for task, through
+    brain.llm_scheduler and within llm_config's timeout. Identical calls in
+    flight are merged. Returns (model, content).
+    """
+    requested = time.monotonic()
+
+    async def call():
+        model = brain.model_router.choose(task, time.monotonic() - requested)
+        try:
+            with brain.trace('llm', task=task, model=model) as span:
+                response = await ollama_client.chat(
+                    model=model, messages=[{'role': 'user', 'content': prompt}],
+                    keep_alive=brain.model_router.keep_alive)
+                span['prompt_tokens'], span['completion_tokens'] = brain.count_llm_tokens(
+                    task, prompt, response)
+        except Exception as e:
+            brain.model_router.failed(model, e)
+            raise
+        return model, response['message']['content']
+
+    return await asyncio.wait_for(
+        brain.llm_scheduler.run_async(('chat', task, prompt), call, priority),
+        timeout=llm_config['timeout'])
+
+
+async def _stream_model_async(model, prompt, task, deadline, judge=None):
+    """
+    Yield the content of a streamed Ollama chat response from model chunk
+    by chunk, in an LLM slot the caller holds. Closing the generator early
+    closes the HTTP stream, which makes Ollama stop generating. judge(text),
+    if given, says whether the complete output was good, for the router.
+    """
+    loop = asyncio.get_running_loop()
+    chunks, last, text = 0, None, []
+    with brain.trace('llm', task=task, model=model) as span:
+        try:
+            stream = await asyncio.wait_for(
+                ollama_client.chat(model=model,
+                                   messages=[{'role': 'user', 'content': prompt}],
+                                   stream=True, keep_alive=brain.model_router.keep_alive),
+                timeout=deadline - loop.time())
+            async with aclosing(stream):
+                while True:
+                    try:
+                        part = await asyncio.wait_for(anext(stream),
+                                                      timeout=deadline - loop.time())
+                    except StopAsyncIteration:
+                        break
+                    chunks, last = chunks + 1, part
+                    text.append(part['message']['content'])
+                    yield part['message']['content']
+        except Exception as e:
+            brain.model_router.failed(model, e)
+            raise
+        finally:
+            span['prompt_tokens'], span['completion_tokens'] = brain.count_llm_tokens(
+                task, prompt, last if last is not None and last.get('done') else None, chunks)
+        if judge is not None:
+            brain.model_router.judge(task, model, judge("".join(text)))
+
+
+async def stream_chat_async(prompt, task='chat', judge=None, priority=brain.INTERACTIVE):
+    """
+    Yield the content of a streamed Ollama chat response chunk by chunk,
+    holding a brain.llm_scheduler slot for the whole stream.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + llm_config['timeout']
+    await asyncio.wait_for(brain.llm_scheduler.acquire_async(priority),
+                           timeout=llm_config['timeout'])
+    try:
+        model = brain.model_router.choose(task, loop.time() - (deadline - llm_config['timeout']))
+        async with aclosing(_stream_model_async(model, prompt, task, deadline, judge)) as stream:
+            async for chunk in stream:
+                yield chunk
+    finally:
+        brain.llm_scheduler.release()
+
+
+async def query_ollama_async(question, examples=(), priority=brain.INTERACTIVE):
+    """
+    Async counterpart of brain.query_ollama_cli, stopping at the first SQL
+    block. Identical questions in flight share one generation.
+    """
+    try:
+        prompt = brain.build_sql_prompt(question, examples)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + llm_config['timeout']
+
+        async def generate():
+            extractor = brain.SQLStreamExtractor()
+            model = brain.model_router.choose(
+                'sql', loop.time() - (deadline - llm_config['timeout']))
+            async with aclosing(_stream_model_async(model, prompt, 'sql', deadline)) as stream:
+                async for chunk in stream:
+                    if extractor.feed(chunk):
+                        break
+            sql_query = extractor.finish()
+            if sql_query:
+                brain.model_router.produced('sql', sql_query, model)
+            return sql_query
+
+        return await asyncio.wait_for(
+            brain.llm_scheduler.run_async(('sql', prompt), generate, priority),
+            timeout=llm_config['timeout'])
+    except Exception as e:
+        print(f"Error: {e!r}")
+        return None
+
+
+async def query_ollama_async_forError(old_sql, error_message, priority=brain.INTERACTIVE):
+    """Async counterpart of brain.query_ollama_cli_forError."""
+    try:
+        model, content = await chat_async(brain.build_repair_prompt(old_sql, error_message),
+                                          task='repair', priority=priority)
+        sql_query = brain.extractSQLQuery(content)
+        if sql_query:
+            brain.model_router.produced('repair', sql_query, model)
+        return sql_query
+    except Exception as e:
+        print(f"Error: {e!r}")
+        return None
+
+
+async def query_ollama_async_humanize(question, db_response, priority=brain.INTERACTIVE):
+    """Async counterpart of brain.query_ollama_cli_humanize."""
+    with brain.trace('humanize') as span:
+        local_answer = brain.local_humanizer.answer(db_response)
+        span['source'] = 'local' if local_answer else 'llm'
+        if local_answer:
+            return local_answer
+        try:
+            model, content = await chat_async(brain.build_humanize_prompt(question, db_response),
+                                              task='humanize', priority=priority)
+            brain.model_router.judge('humanize', model, brain.well_formed_answer(content))
+            return brain.finalize_humanized_response(content.strip(), db_response)
+        except Exception as e:
+            print(f"Error: {e!r}")
+            return "<<< Sorry, I couldn't process the data into a human-readable format. >>>"
+
+
+async def ask_question(question, high_water=None, stream_rows=False, max_rows=None,
+                       priority=brain.INTERACTIVE):
+    """Translate a question to SQL and run it. Returns (results, error)."""
+    if not question:
+        return None, 'No question provided.'
+
+    with brain.trace('sql_generation') as span:
+        template_sql = brain.sql_templates.match(question)
+        cached_sql = None if template_sql else brain.sql_cache.get(question)
+        similar_sql, examples = None, []
+        if not template_sql and not cached_sql:
+            similar_sql, examples = await run_io(brain.question_index.match, question)
+        if template_sql:
+            span['source'] = 'template'
+            sql_query = template_sql
+        elif cached_sql:
+            span['source'] = 'cache'
+            sql_query = cached_sql
+        elif similar_sql:
+            span['source'] = 'similar'
+            sql_query = similar_sql
+        else:
+            span['source'] = 'llm'
+            span['examples'] = len(examples)
+            sql_query = await query_ollama_async(question, examples, priority)
+            if not sql_query:
+                return None, 'Failed to generate SQL query.'
+
+    cost_high_water = None if stream_rows else high_water
+    with brain.trace('guard') as span:
+        guarded_sql, guard_error = brain.guard_sql(sql_query, max_rows)
+        if not guard_error and not cached_sql and not template_sql and not similar_sql:
+            guard_error = await run_db(brain.check_sql_cost, guarded_sql, cost_high_water)
+        span['refused'] = bool(guard_error)
+    if guard_error:
+        brain.model_router.outcome('sql', sql_query, False)
+        if cached_sql:
+            await run_io(brain.sql_cache.invalidate, question)
+        return None, guard_error
+
+    def execute(guarded_sql):
+        if stream_rows:
+            return {'question': question, 'sql': guarded_sql}, brain.validate_sql_query(guarded_sql)
+        if high_water is None:
+            return brain.execute_sql_query(guarded_sql)
+        return brain.result_cache.execute(guarded_sql, high_water)
+
+    with brain.trace('execute') as span:
+        results, error = await run_db(execute, guarded_sql)
+        span['mode'] = 'stream' if stream_rows else 'direct' if high_water is None else 'result_cache'
+    # Generated SQL is good if it ran as written
+    brain.model_router.outcome('sql', sql_query, not error)
+
+    if error:
+        if cached_sql:
+            await run_io(brain.sql_cache.invalidate, question)
+            cached_sql = None
+        loop = asyncio.get_running_loop()
+
+        def propose(failed_sql, failure):
+            # Model calls stay on the event loop's client and limits
+            return asyncio.run_coroutine_threadsafe(
+                query_ollama_async_forError(failed_sql, failure, priority), loop).result()
+
+        # The repair loop blocks on DB checks, so it runs off the event loop
+        with brain.trace('repair') as span:
+            results, repaired_sql, error = await loop.run_in_executor(
+                None, contextvars.copy_context().run,
+                lambda: brain.sql_repairer.repair(sql_query, error, execute, max_rows, priority,
+                                                  propose=propose, high_water=cost_high_water))
+            span['repaired'] = not error
+        if error:
+            return None, f"SQL Execution Error: {error}"
+        sql_query, template_sql = repaired_sql, None
+
+    if not cached_sql and not template_sql:
+        await run_io(brain.sql_cache.put, question, sql_query)
+        await run_io(brain.question_index.put, question, sql_query)
+
+    return results, None
+
+
+async def refresh_answer(session_id, session, force=False):
+    """
+    Re-answer the session's question if the table changed since the last
+    check, or unconditionally when force is set.
+
+    Returns (changed, answer, error); answer is the humanized text, or a note
+    for "give me" questions whose rows are streamed by last-10-records.
+    """
+    question = session['question']
+    high_water = await run_db(brain.change_watcher.current)
+    if session['last_checked_data'] == high_water and not force:
+        return False, None, None
+    # A question that was just asked is interactive; re-answering it after
+    # new rows is a background refresh
+    if force or session['last_checked_data'] is None:
+        priority = brain.INTERACTIVE
+    else:
+        priority = brain.BACKGROUND
+    session['last_checked_data'] = high_water
+    await run_io(brain.session_store.save, session_id, session)
+
+    give_me = question.lower().startswith("give me")
+    results, error = await ask_question(question, high_water, stream_rows=give_me,
+                                        max_rows=session['return_data_num'], priority=priority)
+    if error:
+        return True, None, error
+
+    if give_me:
+        session['return_this_data'] = results
+        await run_io(brain.session_store.save, session_id, session)
+        return True, "rows are ready at /api/last-10-records", None
+
+    answer = await query_ollama_async_humanize(question, results, priority)
+    return True, answer, None
+
+
+@app.route('/api/set-return-num/<int:num>', methods=['GET'])
+async def set_return_num(num):
+    session_id = brain.current_session_id(request)
+    session = await run_io(brain.session_store.load, session_id)
+    session['return_data_num'] = num
+    await run_io(brain.session_store.save, session_id, session)
+    return jsonify({'message': f'Successfully set the number of records to return to {num}'})
+
+
+@app.route('/api/ask-database-set/<string:question>', methods=['GET'])
+async def ask_database_set(question):
+    session_id = brain.current_session_id(request)
+    session = await run_io(brain.session_store.load, session_id)
+    session['question'] = question
+
+    try:
+        _, answer, error = await refresh_answer(session_id, session, force=True)
+    except Error as e:
+        print(f"Error: {e}")
+        return jsonify({'error': 'Failed to connect to the database'}), 500
+
+    if error or not answer:
+        return jsonify({'error': error or 'Failed to generate SQL query.'}), 500
+
+    return jsonify({'message': f'Query generated: {answer}'}), 200
+
+
+@app.route('/api/ask-database-stream/<string:question>', methods=['GET'])
+async def ask_database_stream(question):
+    """Async counterpart of brain.ask_database_stream (Server-Sent Events)."""
+    session_id = brain.current_session_id(request)
+    session = await run_io(brain.session_store.load, session_id)
+    session['question'] = question
+
+    async def events():
+        try:
+            high_water = await run_db(brain.change_watcher.current)
+        except Error as e:
+            print(f"Error: {e}")
+            yield brain.sse_event('error', {'error': 'Failed to connect to the database'})
+            return
+        session['last_checked_data'] = high_water
+        await run_io(brain.session_store.save, session_id, session)
+
+        give_me = question.lower().startswith("give me")
+        results, error = await ask_question(question, high_water, stream_rows=give_me,
+                                            max_rows=session['return_data_num'])
+        if error:
+            yield brain.sse_event('error', {'error': error})
+            return
+
+        if give_me:
+            session['return_this_data'] = results
+            await run_io(brain.session_store.save, session_id, session)
+            yield brain.sse_event('reload', {'question': question})
+            return
+
+        with brain.trace('humanize') as span:
+            local_answer = brain.local_humanizer.answer(results)
+            span['source'] = 'local' if local_answer else 'llm'
+            if local_answer:
+                yield brain.sse_event('answer', local_answer)
+                return
+
+            answer_filter = brain.AnswerStreamFilter()
+            try:
+                prompt = brain.build_humanize_prompt(question, results)
+                async with aclosing(stream_chat_async(prompt, task='humanize',
+                                                       judge=brain.well_formed_answer)) as stream:
+                    async for chunk in stream:
+                        delta = answer_filter.feed(chunk)
+                        if delta:
+                            yield brain.sse_event('token', delta)
+                        if answer_filter.complete:
+                            break
+                answer = brain.finalize_humanized_response(answer_filter.text.strip(), results)
+            except Exception as e:
+                print(f"Error: {e!r}")
+                answer = "<<< Sorry, I couldn't process the data into a human-readable format. >>>"
+        yield brain.sse_event('answer', answer)
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/should-reload', methods=['GET'])
+async def should_reload():
+    session_id = brain.current_session_id(request)
+    session = await run_io(brain.session_store.load, session_id)
+    question = session['question']
+    try:
+        changed, answer, error = await refresh_answer(session_id, session)
+    except Error as e:
+        print(f"Error: {e}")
+        return jsonify({'error': 'Failed to connect to the database'}), 500
+
+    if error:
+        return jsonify({'error': error}), 500
+    if changed and answer and not question.lower().startswith("give me"):
+        return answer
+
+    return jsonify({'reload': False}), 200
+
+
+async def wait_for_change(session_id, since, timeout):
+    """Async counterpart of brain.change_watcher.wait."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        message = brain.change_watcher.latest(session_id)
+        if message and message['high_water'] > since:
+            return message
+        if loop.time() >= deadline:
+            return None
+        await asyncio.sleep(min(change_poll_interval, deadline - loop.time()))
+
+
+@app.route('/api/changes', methods=['GET'])
+async def changes():
+    """Async counterpart of brain.changes (Server-Sent Events)."""
+    session_id = brain.current_session_id(request)
+    try:
+        await run_db(brain.change_watcher.subscribe, session_id)
+        since = await run_db(brain.change_watcher.current)
+    except Error as e:
+        print(f"Error: {e}")
+        return jsonify({'error': 'Failed to connect to the database'}), 500
+
+    async def events():
+        last = since
+        yield brain.sse_event('subscribed', {'high_water': last})
+        while True:
+            message = await wait_for_change(session_id, last, brain.watch_config['keepalive'])
+            if message is None:
+                yield ": keep-alive\n\n"
+                continue
+            last = message['high_water']
+            yield brain.sse_event('change', message)
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/changes/poll', methods=['GET'])
+async def changes_poll():
+    session_id = brain.current_session_id(request)
+    since = request.args.get('since', type=int)
+    timeout = min(request.args.get('timeout', brain.watch_config['long_poll_timeout'], type=float),
+                  brain.watch_config['long_poll_timeout'])
+    try:
+        await run_db(brain.change_watcher.subscribe, session_id)
+        if since is None:
+            since = await run_db(brain.change_watcher.current)
+    except Error as e:
+        print(f"Error: {e}")
+        return jsonify({'error': 'Failed to connect to the database'}), 500
+
+    message = await wait_for_change(session_id, since, timeout)
+    if message is None:
+        return jsonify({'high_water': since, 'changed': False})
+    return jsonify(dict(message, changed=True))
+
+
+@app.route('/api/last-10-records', methods=['GET'])
+async def get_last_10_records():
+    """Async counterpart of brain.get_last_10_records, streaming rows chunk by chunk."""
+    session = await run_io(brain.session_store.load, brain.current_session_id(request))
+    query = session['return_this_data']
+    if not isinstance(query, dict) or 'sql' not in query:
+        return jsonify(query)
+
+    fmt = brain.negotiate_stream_format(request)
+    if fmt is None:
+        return jsonify({'error': f"Unsupported format, use one of {list(brain.STREAM_FORMATS)}"}), 406
+    gzip = brain.accepts_gzip(request)
+
+    try:
+        high_water = await run_db(brain.change_watcher.current)
+        etag = brain.rows_etag(query['sql'], fmt, 'gzip' if gzip else 'identity', high_water)
+        if request.if_none_match.contains(etag):
+            response = Response("", status=304)
+            response.set_etag(etag)
+            return response
+        chunks = await run_db(brain.open_row_stream, query['sql'])
+    except Error as e:
+        print(f"Database error: {e}")
+        return jsonify({'error': str(e)}), 500
+    pieces = brain.serialize_chunks(chunks, fmt)
+    headers = {'Cache-Control': 'no-cache', 'Vary': 'Accept, Accept-Encoding'}
+    if gzip:
+        pieces = brain.gzip_pieces(pieces, brain.stream_config['gzip_level'])
+        headers['Content-Encoding'] = 'gzip'
+
+    async def body():
+        try:
+            while True:
+                piece = await run_db(next, pieces, None)
+                if piece is None:
+                    break
+                yield piece
+        finally:
+            await run_db(pieces.close)
+
+    response = Response(body(), mimetype=brain.STREAM_FORMATS[fmt], headers=headers)
+    response.set_etag(etag)
+    return response
+
+
+@app.route('/api/session', methods=['GET'])
+async def session_info():
+    session_id = brain.current_session_id(request)
+    session = await run_io(brain.session_store.load, session_id)
+    return jsonify(dict(session, session_id=session_id,
+                        sessions=await run_io(len, brain.session_store)))
+
+
+@app.route('/api/change-watcher', methods=['GET'])
+async def change_watcher_stats():
+    return jsonify(brain.change_watcher.snapshot())
+
+
+@app.route('/api/fast-path', methods=['GET'])
+async def fast_path_stats():
+    return jsonify(brain.sql_templates.snapshot())
+
+
+@app.route('/api/humanizer', methods=['GET'])
+async def humanizer_stats():
+    return jsonify(brain.local_humanizer.snapshot())
+
+
+@app.route('/api/prompt-stats', methods=['GET'])
+async def prompt_size_stats():
+    return jsonify(brain.prompt_stats.snapshot())
+
+
+@app.route('/api/repair-stats', methods=['GET'])
+async def repair_stats():
+    return jsonify(brain.sql_repairer.snapshot())
+
+
+@app.route('/api/rollups', methods=['GET'])
+async def rollup_stats():
+    return jsonify(brain.rollups.snapshot())
+
+
+@app.route('/api/llm-scheduler', methods=['GET'])
+async def llm_scheduler_stats():
+    return jsonify(brain.llm_scheduler.snapshot())
+
+
+@app.route('/api/models', methods=['GET'])
+async def model_router_stats():
+    return jsonify(brain.model_router.snapshot())
+
+
+@app.route('/api/execution-backend', methods=['GET'])
+async def execution_backend_stats():
+    return jsonify(brain.execution_backend.snapshot())
+
+
+@app.route('/metrics', methods=['GET'])
+async def prometheus_metrics():
+    return Response(brain.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/pool-stats', methods=['GET'])
+async def pool_stats():
+    return jsonify(brain.db_pool.snapshot())
+
+
+@app.route('/api/sql-cache', methods=['GET'])
+async def sql_cache_stats():
+    return jsonify(brain.sql_cache.snapshot())
+
+
+@app.route('/api/sql-cache/invalidate', methods=['GET', 'POST'])
+async def sql_cache_invalidate():
+    question = request.args.get('question')
+
+    def invalidate():
+        # Both rewrite their files on disk
+        removed = brain.sql_cache.invalidate(question)
+        brain.question_index.invalidate(question)
+        return removed
+
+    removed = await run_io(invalidate)
+    return jsonify({'message': f'Removed {removed} cached queries'})
+
+
+@app.route('/api/question-index', methods=['GET'])
+async def question_index_stats():
+    question = request.args.get('question')
+    if not question:
+        return jsonify(brain.question_index.snapshot())
+    neighbours = await run_io(brain.question_index.search, question)
+    neighbours = [dict(entry, similarity=round(similarity, 4),
+                       reusable=similarity >= brain.question_index.reuse_similarity
+                       and brain.question_index.compatible(question, entry))
+                  for similarity, entry in neighbours]
+    return jsonify(dict(brain.question_index.snapshot(), neighbours=neighbours))
+
+
+@app.route('/api/result-cache', methods=['GET'])
+async def result_cache_stats():
+    return jsonify(brain.result_cache.snapshot())
+
+
+@app.route('/api/index-advisor', methods=['GET'])
+async def index_advisor_stats():
+    try:
+        recommendations = await run_db(brain.index_advisor.recommendations)
+    except Error as e:
+        return jsonify(dict(brain.index_advisor.snapshot(), error=str(e))), 500
+    return jsonify(dict(brain.index_advisor.snapshot(), recommendations=recommendations))
+
+
+@app.route('/api/index-advisor/apply', methods=['POST'])
+async def index_advisor_apply():
+    if not brain.index_advisor.allow_apply:
+        return jsonify({'error': "Applying indexes is disabled (index_advisor_config['allow_apply'])."}), 403
+    names = request.args.getlist('name')
+    try:
+        applied = await run_db(brain.index_advisor.apply, names)
+    except Error as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'message': f'Created {len(applied)} indexes', 'applied': applied})
+
+
+# Run Quart app
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=3308)